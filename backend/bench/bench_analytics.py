@@ -0,0 +1,58 @@
+# Answering "what's the sentiment / main themes?" from local comment
+# analytics (analytics.analyze_comments) against the model path it replaces
+# (preprocess, then summarize with a stub model), on the fixture corpus from
+# bench_preprocess.py.
+#
+#   python bench/bench_analytics.py [--comments 200,2000,10000] [--latency 0.3] [--per-1k-tokens 0.5]
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from analytics import analyze_comments, local_answer, local_question
+from bench_preprocess import fixture_corpus
+from open_ai import summarize_comments
+from preprocess import preprocess_comments
+from stubs import StubModel
+
+PROMPT = "What are the main themes and the overall sentiment?"
+
+
+def local(records):
+    return local_answer(local_question(PROMPT), analyze_comments(records))
+
+
+def via_model(records, model):
+    kept, _ = preprocess_comments(records)
+    return summarize_comments([r["text"] for r in kept], PROMPT, complete_fn=model)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=lambda s: [int(x) for x in s.split(",")], default=[200, 2000, 10000])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub model latency per call, seconds")
+    parser.add_argument("--per-1k-tokens", type=float, default=0.5, help="extra stub latency per 1k prompt tokens")
+    args = parser.parse_args()
+
+    assert local_question(PROMPT) is not None
+    local(fixture_corpus(50))  # imports numpy
+    print(f"{'comments':>8} {'local ms':>9} {'model ms':>9} {'model calls':>12}")
+    for count in args.comments:
+        records = fixture_corpus(count)
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            local(records)
+            timings.append((time.perf_counter() - started) * 1000)
+        model = StubModel(latency=args.latency, per_1k_tokens=args.per_1k_tokens)
+        started = time.perf_counter()
+        via_model(records, model)
+        model_ms = (time.perf_counter() - started) * 1000
+        print(f"{count:>8} {statistics.median(timings):>9.1f} {model_ms:>9.0f} {model.calls:>12}")
+
+    print(f"\n{local(fixture_corpus(args.comments[0]))}")
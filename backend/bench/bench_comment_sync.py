@@ -0,0 +1,62 @@
+# YouTube pages fetched when re-reading an active video: a full re-download
+# versus the incremental sync in comment_store, which stops at the first
+# already-stored comment. Runs against the local stub server and SQLite.
+#
+#   python bench/bench_comment_sync.py [--comments 2000] [--new 0,10,150,600]
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from loadtest_async import configure_env
+from stubs import start_stub_server
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=int, default=2000, help="comments on the video at the first sync")
+    parser.add_argument("--new", type=lambda s: [int(x) for x in s.split(",")], default=[0, 10, 150, 600],
+                        help="comments posted before each re-read")
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency=args.latency, comments_per_video=args.comments)
+    configure_env(base_url)
+    os.environ["DATABASE_URL"] = "sqlite:///bench_comments.db"
+
+    from database.database import Base, engine
+    from comment_store import CommentStore
+    from youtube import iter_video_comments
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # No sync interval: every read goes to YouTube, so only the stopping rule is measured
+    store = CommentStore(sync_interval=timedelta(0))
+    budget = args.comments * 2
+
+    def pages():
+        count = server.request_counts.get("commentThreads", 0)
+        server.request_counts.clear()
+        return count
+
+    _, seconds = timed(lambda: store.comments("video1", max_comments=budget))
+    print(f"initial sync: {pages()} pages, {seconds:.2f}s\n")
+    print(f"{'new':>5} {'full pages':>11} {'full s':>7} {'sync pages':>11} {'sync s':>7} {'added':>6}")
+    for new in args.new:
+        server.comments_per_video += new
+        _, full_seconds = timed(lambda: list(iter_video_comments("video1", max_comments=budget, order="time")))
+        full_pages = pages()
+        added = store.comments_added
+        _, sync_seconds = timed(lambda: store.comments("video1", max_comments=budget))
+        added = store.comments_added - added
+        print(f"{new:>5} {full_pages:>11} {full_seconds:>7.2f} {pages():>11} {sync_seconds:>7.2f} {added:>6}")
+    server.shutdown()
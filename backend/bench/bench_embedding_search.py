@@ -0,0 +1,68 @@
+# Semantic comment search (embeddings.EmbeddingIndex) on the fixture corpus
+# from bench_preprocess.py: building a video's index, re-querying it after
+# new comments arrive (only those are embedded), and query latency against
+# the memory-mapped matrix. Embeddings come from stubs.StubEmbedder, which
+# sleeps per batch request like the API would.
+#
+#   python bench/bench_embedding_search.py [--comments 2000,10000,50000] [--new 100] [--latency 0.1]
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from bench_preprocess import fixture_corpus
+from embeddings import EmbeddingIndex
+from stubs import StubEmbedder
+
+QUERIES = ["the audio mix was too loud", "how do I fix my mic", "lighting", "best part of the video"]
+
+
+def timed(call, *args):
+    started = time.perf_counter()
+    result = call(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=lambda s: [int(x) for x in s.split(",")], default=[2000, 10000, 50000])
+    parser.add_argument("--new", type=int, default=100, help="comments arriving before the second query")
+    parser.add_argument("--latency", type=float, default=0.1, help="stub embedding latency per batch, seconds")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'comments':>8} {'build ms':>9} {'embedded':>9} {'update ms':>10} {'embedded':>9} "
+          f"{'query ms':>9} {'index MB':>9}")
+    for count in args.comments:
+        with tempfile.TemporaryDirectory() as directory:
+            embedder = StubEmbedder(latency=args.latency)
+            index = EmbeddingIndex(embedder, directory)
+            records = fixture_corpus(count)
+            _, build_ms = timed(index.update, "video1", records)
+            built = embedder.texts
+
+            # New comments, then a search as the app runs it: only they are embedded
+            grown = fixture_corpus(count + args.new)
+            _, update_ms = timed(index.search, "video1", QUERIES[0], grown)
+            updated = embedder.texts - built - 1  # less the query itself
+
+            timings = []
+            for run in range(args.runs):
+                _, ms = timed(index.search, "video1", QUERIES[run % len(QUERIES)], grown)
+                timings.append(ms - args.latency * 1000)  # less the stub's query round-trip
+            size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+            print(f"{count:>8} {build_ms:>9.0f} {built:>9} {update_ms:>10.0f} {updated:>9} "
+                  f"{statistics.median(timings):>9.2f} {size / 1e6:>9.1f}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = EmbeddingIndex(StubEmbedder(latency=0), directory)
+        records = fixture_corpus(args.comments[0])
+        for query in QUERIES[:2]:
+            print(f"\n{query!r}:")
+            for hit in index.search("video1", query, records, 3):
+                print(f"  {hit['score']:.3f}  {hit['text'][:80]}")
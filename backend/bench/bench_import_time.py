@@ -0,0 +1,77 @@
+# Cold-start cost of a worker: `python -X importtime -c "import main"`, with
+# the heavy client libraries deferred (as the app now boots) and with them
+# imported up front (as it used to), plus how long the warm-up hook takes to
+# load them afterwards. Each import runs in a fresh interpreter.
+#
+#   python bench/bench_import_time.py [--runs 5] [--top 12]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from loadtest_async import configure_env
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+DEFERRED = ("openai", "httpx", "httplib2", "google_auth_httplib2", "googleapiclient.discovery",
+            "google_auth_oauthlib.flow", "google.oauth2.credentials", "google.auth.transport.requests")
+
+
+def import_profile(statement):
+    # Returns (total microseconds, {module imported directly by a top-level one: cumulative us})
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=SRC,
+                            capture_output=True, text=True, check=True)
+    total = 0
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented two spaces per level under the module that pulled them in
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            total += int(cumulative)
+        elif depth == 1:
+            modules[name.strip()] = int(cumulative)
+    return total, modules
+
+
+def warm_up_steps():
+    statement = "import asyncio, json, main; asyncio.run(main.warm_up.run()); print(json.dumps(main.warm_up.status()))"
+    result = subprocess.run([sys.executable, "-c", statement], cwd=SRC, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="heaviest top-level imports to list")
+    args = parser.parse_args()
+
+    configure_env("http://127.0.0.1:9")  # nothing is called; clients only need a URL
+    os.environ["SUMMARY_CACHE_PATH"] = ":memory:"
+    cases = {
+        "deferred": "import main",
+        "up front": "import main; " + "; ".join(f"import {name}" for name in DEFERRED),
+    }
+    print(f"{'imports':<10} {'median ms':>10} {'min ms':>8}")
+    profiles = {}
+    for label, statement in cases.items():
+        totals = []
+        for _ in range(args.runs):
+            total, modules = import_profile(statement)
+            totals.append(total / 1000)
+        profiles[label] = modules
+        print(f"{label:<10} {statistics.median(totals):>10.1f} {min(totals):>8.1f}")
+
+    print("\nHeaviest imports under main (deferred), cumulative ms:")
+    top = sorted(((cumulative, name) for name, cumulative in profiles["deferred"].items()), reverse=True)[:args.top]
+    for cumulative, name in top:
+        print(f"  {cumulative / 1000:>8.1f}  {name}")
+
+    status = warm_up_steps()
+    print(f"\nWarm-up after boot (ready={status['ready']}):")
+    for name, result in status["steps"].items():
+        outcome = f"{result['seconds'] * 1000:.1f} ms" if result.get("ok") else f"failed: {result.get('error')}"
+        print(f"  {name:<12} {outcome}")
@@ -0,0 +1,67 @@
+# Prompt tokens and model time for keeping a summary current on a growing
+# video: full re-summarization every round versus folding only the new
+# comments into the stored summary (summary_updates.SummaryStore).
+#
+#   python bench/bench_incremental_summary.py [--initial 2000] [--per-round 100] [--rounds 12]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ["DATABASE_URL"] = "sqlite:///bench_summaries.db"
+
+from stubs import StubModel, comment_thread
+
+PROMPT = "What do viewers think of the audio?"
+
+
+def records(count):
+    from youtube import comment_record
+
+    # Newest first, as CommentStore.recent() returns them
+    return [comment_record(comment_thread("video1", i)) for i in reversed(range(count))]
+
+
+def run(store, model, comments, incremental):
+    started = time.perf_counter()
+    update = store.plan("video1", PROMPT, comments, incremental, complete_fn=model)
+    if update.summary is None:
+        update.save(model(update.final_prompt))
+    return update.kind, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--initial", type=int, default=2000)
+    parser.add_argument("--per-round", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub model latency per call, seconds")
+    parser.add_argument("--per-1k-tokens", type=float, default=0.5)
+    args = parser.parse_args()
+
+    from database.database import Base, engine
+    from summary_updates import SummaryStore
+
+    print(f"{'round':>5} {'comments':>9} {'mode':<12} {'kind':<10} {'calls':>6} {'prompt tokens':>14} {'seconds':>8}")
+    totals = {}
+    for incremental in (False, True):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        store = SummaryStore()
+        mode = "incremental" if incremental else "full"
+        for round_ in range(args.rounds + 1):
+            count = args.initial + round_ * args.per_round
+            model = StubModel(latency=args.latency, per_1k_tokens=args.per_1k_tokens)
+            kind, seconds = run(store, model, records(count), incremental)
+            tokens = model.prompt_chars // 4
+            if round_:
+                # Round 0 builds the first summary in both modes
+                calls, total_tokens, total_seconds = totals.get(mode, (0, 0, 0.0))
+                totals[mode] = (calls + model.calls, total_tokens + tokens, total_seconds + seconds)
+            print(f"{round_:>5} {count:>9} {mode:<12} {kind:<10} {model.calls:>6} {tokens:>14} {seconds:>8.2f}")
+
+    print(f"\nUpdates after the first summary ({args.rounds} rounds of {args.per_round} new comments):")
+    for mode, (calls, tokens, seconds) in totals.items():
+        print(f"  {mode:<12} {calls:>4} calls {tokens:>9} prompt tokens {seconds:>7.2f}s")
@@ -0,0 +1,53 @@
+# Bulk summary job completion time against worker-pool size, with the app
+# running in-process against the local YouTube/OpenAI stub server.
+#
+#   python bench/bench_jobs.py [--videos 40] [--latency 0.05]
+import argparse
+import asyncio
+import time
+
+from loadtest_async import TOKEN, configure_env, sign_in
+from stubs import start_stub_server
+
+
+async def run_job(client, video_ids):
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    response = await client.post("/api/summarize_jobs", headers=headers,
+                                 json={"video_ids": video_ids, "prompt": "Summarize", "max_comments": 100})
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    while True:
+        await asyncio.sleep(0.02)
+        job = (await client.get(f"/api/summarize_jobs/{job_id}", headers=headers)).json()
+        if job["status"] in ("done", "cancelled"):
+            return job
+
+
+async def main_async(args):
+    import httpx
+    import main
+    from jobs import JobManager
+
+    sign_in(main)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        print(f"{'workers':>8} {'videos':>7} {'failed':>7} {'seconds':>8}")
+        for workers in (1, 4, 16):
+            # Generous quota so the pool size is what is being measured
+            main.summary_jobs = JobManager(main.summarize_video, workers=workers,
+                                           quota_per_minute=1_000_000, quota_burst=1_000_000)
+            video_ids = [f"w{workers}-video{i}" for i in range(args.videos)]
+            started = time.perf_counter()
+            job = await run_job(client, video_ids)
+            print(f"{workers:>8} {job['total']:>7} {job['failed']:>7} {time.perf_counter() - started:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    server, base_url = start_stub_server(latency=args.latency)
+    configure_env(base_url)
+    asyncio.run(main_async(args))
+    server.shutdown()
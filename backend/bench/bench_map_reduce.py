@@ -0,0 +1,33 @@
+# Wall-clock time of open_ai.summarize_comments against chunk count and
+# parallelism, using a stub model with fixed per-call latency.
+#
+#   python bench/bench_map_reduce.py [--latency 0.2]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from open_ai import chunk_texts, summarize_comments
+from stubs import StubModel, comment_thread, comment_record_text
+
+CHUNK_TOKENS = 3000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.2, help="stub model latency in seconds")
+    args = parser.parse_args()
+
+    print(f"{'comments':>9} {'chunks':>7} {'parallelism':>12} {'calls':>6} {'seconds':>8}")
+    for count in (200, 1_000, 5_000, 20_000):
+        comments = [comment_record_text(comment_thread("video", i)) for i in range(count)]
+        chunks = len(chunk_texts(comments, CHUNK_TOKENS))
+        for parallelism in (1, 4, 16):
+            model = StubModel(latency=args.latency)
+            started = time.perf_counter()
+            summarize_comments(comments, "Summarize", complete_fn=model,
+                               chunk_tokens=CHUNK_TOKENS, parallelism=parallelism)
+            elapsed = time.perf_counter() - started
+            print(f"{count:>9} {chunks:>7} {parallelism:>12} {model.calls:>6} {elapsed:>8.2f}")
@@ -0,0 +1,66 @@
+# OpenAI completion latency and success rate against a local fake server that
+# injects latency and 429/5xx errors: a new client per call with no retries
+# (the old behaviour) versus the shared pooled client with backoff.
+#
+#   python bench/bench_openai_client.py [--latency 0.05] [--error-rate 0.2]
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from stubs import start_stub_server
+
+CALLS = 200
+
+
+def run(label, call, concurrency):
+    latencies = []
+    failures = 0
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            call()
+            return time.perf_counter() - started
+        except Exception:
+            return None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency in pool.map(one, range(CALLS)):
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+    elapsed = time.perf_counter() - started
+    p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+    print(f"{label:<28} {CALLS / elapsed:>8.1f} {p50:>9.1f} {failures:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency=args.latency, error_rate=args.error_rate,
+                                         error_status=503, retry_after=0.05)
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    os.environ["OPENAI_API_KEY"] = "bench"
+
+    from openai import OpenAI
+    import open_ai
+
+    def per_call_client():
+        client = OpenAI(api_key="bench", max_retries=0)
+        return client.chat.completions.create(messages=[{"role": "user", "content": "hi"}], **open_ai.MODEL_PARAMS)
+
+    print(f"{'client':<28} {'calls/s':>8} {'p50 (ms)':>9} {'failures':>9}")
+    run("new client, no retries", per_call_client, args.concurrency)
+    run("shared client + backoff", lambda: open_ai.complete("hi"), args.concurrency)
+    server.shutdown()
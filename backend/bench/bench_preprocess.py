@@ -0,0 +1,77 @@
+# Prompt tokens and end-to-end summarize time with and without comment
+# preprocessing, on a fixture corpus shaped like a popular video's comment
+# section: HTML markup and entities, copy-pasted duplicates, "first!" noise,
+# link spam and a long tail of distinct opinions.
+#
+#   python bench/bench_preprocess.py [--comments 2000] [--latency 0.3] [--per-1k-tokens 0.5]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from open_ai import estimate_tokens, summarize_comments
+from preprocess import preprocess_comments
+from stubs import StubModel
+
+SUBJECTS = ["the audio mix", "the colour grading", "the pacing", "the intro music", "the thumbnail", "the editing",
+            "the lighting", "the script", "the b-roll", "the sponsor segment", "the ending", "the guest",
+            "the camera work", "the subtitles", "the background music", "the explanation at 4:20"]
+OPINIONS = ["was fantastic", "felt too loud", "could be better", "really stood out", "was confusing",
+            "made me laugh", "dragged a bit", "was perfect", "needs more detail", "was way too short"]
+NOISE = ["First!!!", "first &#128512;&#128512;", "lol", "nice video", "wow 🔥🔥🔥", "Who&#39;s here in 2024?",
+         "❤️❤️❤️", "great video!!"]
+SPAM = ['Check out my channel <a href="https://example.com/c">https://example.com/c</a>',
+        "Giveaway!!! DM me on telegram", "sub4sub anyone? <br>www.example.com"]
+
+
+def fixture_corpus(count, seed=7):
+    rng = random.Random(seed)
+    popular = [f"{rng.choice(SUBJECTS).capitalize()} {rng.choice(OPINIONS)}, honestly the best part of the video."
+               for _ in range(12)]
+    records = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.12:
+            text = rng.choice(NOISE)
+        elif roll < 0.17:
+            text = rng.choice(SPAM)
+        elif roll < 0.35:
+            # Copy-pasted or lightly edited repeats of a few popular comments
+            text = rng.choice(popular) + rng.choice(["", "!!", " <br>", " &#128077;", " 100%"])
+        else:
+            first, second = rng.sample(SUBJECTS, 2)
+            text = (f"I think {first} {rng.choice(OPINIONS)} but {second} {rng.choice(OPINIONS)}. "
+                    f"<b>Also</b> part {rng.randint(1, 40)} reminded me of my own project &amp; I learned "
+                    f"{rng.choice(['a lot', 'something new', 'nothing', 'how to fix my mic'])}.")
+        records.append({"id": f"c{i}", "text": text, "like_count": int(rng.paretovariate(1.2)) - 1})
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub model latency per call, seconds")
+    parser.add_argument("--per-1k-tokens", type=float, default=0.5, help="extra stub latency per 1k prompt tokens")
+    args = parser.parse_args()
+
+    records = fixture_corpus(args.comments)
+
+    started = time.perf_counter()
+    kept, stats = preprocess_comments(records)
+    preprocess_seconds = time.perf_counter() - started
+    print(f"preprocess: {preprocess_seconds * 1000:.0f} ms")
+    for name, value in stats.items():
+        print(f"  {name:<18} {value}")
+
+    print(f"\n{'input':<12} {'tokens':>8} {'calls':>6} {'prompt chars':>13} {'seconds':>8}")
+    for label, texts in (("raw", [r["text"] for r in records]), ("preprocessed", [r["text"] for r in kept])):
+        model = StubModel(latency=args.latency, per_1k_tokens=args.per_1k_tokens)
+        started = time.perf_counter()
+        summarize_comments(texts, "Summarize what viewers think", complete_fn=model)
+        elapsed = time.perf_counter() - started + (preprocess_seconds if label == "preprocessed" else 0)
+        tokens = sum(estimate_tokens(t) for t in texts)
+        print(f"{label:<12} {tokens:>8} {model.calls:>6} {model.prompt_chars:>13} {elapsed:>8.2f}")
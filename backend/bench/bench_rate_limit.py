@@ -0,0 +1,57 @@
+# Latency of requests shed by admission control compared with admitted
+# ones, with the app running in-process against the local stub server.
+# Rejections should come back as 429s without waiting on any upstream.
+#
+#   python bench/bench_rate_limit.py [--requests 200] [--latency 0.2]
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from loadtest_async import TOKEN, configure_env, sign_in
+from stubs import start_stub_server
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def main_async(args):
+    import httpx
+    import main
+
+    sign_in(main)
+    transport = httpx.ASGITransport(app=main.app)
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    latencies = {}
+
+    async def one(i):
+        started = time.perf_counter()
+        response = await client.post("/api/summarize_comments", headers=headers,
+                                     json={"video_id": f"video{i}", "prompt": "Summarize", "max_comments": 100})
+        latencies.setdefault(response.status_code, []).append(time.perf_counter() - started)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+
+    print(f"{'status':>6} {'count':>6} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    for status, values in sorted(latencies.items()):
+        print(f"{status:>6} {len(values):>6} {percentile(values, 0.5) * 1000:>8.2f} "
+              f"{percentile(values, 0.99) * 1000:>8.2f} {statistics.mean(values) * 1000:>8.2f}")
+    print(main.admission.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+    # A tight per-user limit so most of the burst is shed
+    os.environ["RATE_LIMIT_SUMMARIZE_PER_MINUTE"] = "60"
+    os.environ["OPENAI_MAX_IN_FLIGHT"] = "4"
+    server, base_url = start_stub_server(latency=args.latency)
+    configure_env(base_url)
+    asyncio.run(main_async(args))
+    server.shutdown()
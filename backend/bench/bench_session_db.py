@@ -0,0 +1,62 @@
+# Auth lookup latency with sessions stored in the users table, across several
+# worker processes sharing one database: cold lookups (indexed token-hash
+# query) versus the in-process read-through cache.
+#
+#   DATABASE_URL=postgresql://... python bench/bench_session_db.py
+# Defaults to a local SQLite file when DATABASE_URL is not set.
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("DATABASE_URL", "sqlite:///bench_sessions.db")
+
+SESSIONS = 10_000
+LOOKUPS_PER_WORKER = 2_000
+
+
+def seed():
+    from database.database import Base, engine
+    from sessions import SessionStore, UserData
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    store = SessionStore()
+    expiry = datetime.utcnow() + timedelta(hours=1)
+    for i in range(SESSIONS):
+        store.add(UserData(google_id=f"g{i}", name=f"User {i}", email=f"user{i}@example.com",
+                           channel_id=f"UC{i}", access_token=f"token-{i}", refresh_token="r",
+                           token_expiry=expiry))
+
+
+def worker(seed_index):
+    from sessions import SessionStore
+
+    store = SessionStore()
+    tokens = [f"token-{(seed_index * 7919 + i) % SESSIONS}" for i in range(LOOKUPS_PER_WORKER)]
+    results = {}
+    for label, cache_ttl in (("database", 0), ("cached", 3600)):
+        store.cache_ttl = cache_ttl
+        latencies = []
+        for token in tokens:
+            started = time.perf_counter()
+            assert store.get_by_token(token) is not None
+            latencies.append(time.perf_counter() - started)
+        results[label] = latencies
+    return results
+
+
+if __name__ == "__main__":
+    seed()
+    print(f"{'workers':>8} {'mode':>9} {'p50 (us)':>9} {'p99 (us)':>9}")
+    for workers in (1, 4, 16):
+        with Pool(workers) as pool:
+            per_worker = pool.map(worker, range(workers))
+        for label in ("database", "cached"):
+            latencies = sorted(l for result in per_worker for l in result[label])
+            p50 = statistics.median(latencies) * 1e6
+            p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+            print(f"{workers:>8} {label:>9} {p50:>9.1f} {p99:>9.1f}")
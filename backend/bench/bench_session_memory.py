@@ -0,0 +1,109 @@
+# Memory and per-request cost of cached sessions: the slotted UserData
+# dataclass against the pydantic model it replaced, and a Credentials object
+# cached per session against building one on every request.
+#
+# RSS is measured in a fresh process per variant, after filling the session
+# cache the way signed-in traffic does (SessionStore._remember).
+#
+#   python bench/bench_session_memory.py [--sessions 100000]
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import timeit
+from datetime import datetime, timedelta
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from harness import rss_mb
+
+CALLS = 100_000
+
+
+def pydantic_user_data():
+    from pydantic import BaseModel
+
+    # The session model before it became a dataclass
+    class UserData(BaseModel):
+        google_id: str
+        name: str
+        email: str
+        channel_id: str
+        uploads_playlist_id: Optional[str] = None
+        access_token: str
+        refresh_token: str
+        token_expiry: datetime
+        previous_access_token: Optional[str] = None
+
+    return UserData
+
+
+def session_fields(i, expiry):
+    # Fresh strings per session, as rows read from the database would be
+    return dict(google_id=f"1{i:020d}", name=f"User {i}", email=f"user{i}@example.com",
+                channel_id=f"UC{i:022d}", uploads_playlist_id=f"UU{i:022d}",
+                access_token=f"ya29.{i:0>150}", refresh_token=f"1//{i:0>100}", token_expiry=expiry)
+
+
+def fill(kind, sessions):
+    # Child process: RSS growth in MB from caching `sessions` sessions
+    from sessions import SessionStore, UserData
+
+    cls = pydantic_user_data() if kind == "pydantic" else UserData
+    store = SessionStore(session_factory=None, cache_ttl=3600)
+    expiry = datetime.utcnow() + timedelta(hours=1)
+    gc.collect()
+    before = rss_mb()
+    for i in range(sessions):
+        store._remember(cls(**session_fields(i, expiry)))
+    gc.collect()
+    print(rss_mb() - before)
+
+
+def per_request():
+    from loadtest_async import configure_env
+
+    configure_env("http://127.0.0.1:9")
+    import main
+    from google.oauth2.credentials import Credentials
+
+    expiry = datetime.utcnow() + timedelta(hours=1)
+    fields = session_fields(1, expiry)
+    legacy = pydantic_user_data()
+    session = main.UserData(**fields)
+
+    def build_credentials():
+        # What every request did before: a new Credentials from the session
+        return Credentials(token=session.access_token, refresh_token=session.refresh_token,
+                           client_id="bench", client_secret="bench", token_uri="http://127.0.0.1:9/token")
+
+    rows = {
+        "session from row, pydantic": lambda: legacy(**fields),
+        "session from row, dataclass": lambda: main.UserData(**fields),
+        "credentials, built per request": build_credentials,
+        "credentials, cached on session": lambda: main.user_credentials(session),
+    }
+    print(f"\n{'per request':<32} {'ns/op':>8}")
+    for label, call in rows.items():
+        print(f"{label:<32} {timeit.timeit(call, number=CALLS) / CALLS * 1e9:>8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--child", choices=["pydantic", "dataclass"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        fill(args.child, args.sessions)
+        sys.exit()
+
+    print(f"{'session record':<16} {'RSS MB':>8} {'MB per 100k':>12}")
+    for kind in ("pydantic", "dataclass"):
+        result = subprocess.run([sys.executable, __file__, "--child", kind, "--sessions", str(args.sessions)],
+                                capture_output=True, text=True, check=True)
+        grown = float(result.stdout.strip().splitlines()[-1])
+        print(f"{kind:<16} {grown:>8.1f} {grown / args.sessions * 100_000:>12.1f}")
+    per_request()
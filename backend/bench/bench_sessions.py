@@ -0,0 +1,39 @@
+# Per-request auth lookup cost against the number of signed-in sessions, for
+# the in-process token cache that fronts the users table.
+#
+#   python bench/bench_sessions.py
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from sessions import SessionStore
+
+LOOKUPS = 100_000
+
+
+def make_store(n):
+    store = SessionStore(session_factory=None, cache_ttl=3600)
+    expiry = datetime.utcnow() + timedelta(hours=1)
+    for i in range(n):
+        store._remember(SimpleNamespace(email=f"user{i}@example.com", access_token=f"token-{i}", token_expiry=expiry))
+    return store
+
+
+def linear_scan(users, token):
+    # The pre-index implementation: next(u for u in user_data_store.values() ...)
+    return next((u for u in users.values() if u.access_token == token), None)
+
+
+if __name__ == "__main__":
+    print(f"{'sessions':>10} {'index (ns/op)':>15} {'linear scan (ns/op)':>20}")
+    for n in (10, 1_000, 100_000, 1_000_000):
+        store = make_store(n)
+        token = f"token-{n - 1}"  # worst case for the scan: last inserted user
+        indexed = timeit.timeit(lambda: store.get_cached(token), number=LOOKUPS) / LOOKUPS * 1e9
+        scan_runs = max(1, LOOKUPS // n)
+        scanned = timeit.timeit(lambda: linear_scan(store._by_email, token), number=scan_runs) / scan_runs * 1e9
+        print(f"{n:>10} {indexed:>15.0f} {scanned:>20.0f}")
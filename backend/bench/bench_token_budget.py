@@ -0,0 +1,57 @@
+# Cost of prompt budgeting and usage accounting on the request path:
+# counting a prompt's tokens before sending it (tiktoken when installed,
+# otherwise the length estimate), fitting it to PROMPT_TOKEN_BUDGET under each
+# policy, and buffering one usage record. Also prints how far the length
+# estimate is from tiktoken's count, when tiktoken is available.
+#
+#   python bench/bench_token_budget.py [--comments 200,2000,10000] [--budget 4000]
+import argparse
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+import open_ai
+from bench_preprocess import fixture_corpus
+from usage import cost, usage_log, usage_scope
+
+PROMPT = "What do viewers think of the audio?"
+
+
+def ms_per_call(call, number):
+    return timeit.timeit(call, number=number) / number * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=lambda s: [int(x) for x in s.split(",")], default=[200, 2000, 10000])
+    parser.add_argument("--budget", type=int, default=4000, help="prompt token budget to fit to")
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    exact = open_ai._encoding(open_ai.MODEL_PARAMS["model"]) is not None
+    print(f"token counts: {'tiktoken' if exact else 'length estimate (tiktoken not installed)'}\n")
+    print(f"{'comments':>8} {'tokens':>8} {'estimate':>9} {'count ms':>9} {'policy':>7} {'sent':>8} "
+          f"{'model':>14} {'fit ms':>8} {'USD':>9}")
+    for count in args.comments:
+        # One prompt with every comment, as an unchunked prompt would be
+        prompt = f"{PROMPT}\n\nComments:\n" + "\n".join(record["text"] for record in fixture_corpus(count))
+        tokens = open_ai.prompt_tokens(prompt)
+        estimate = open_ai.estimate_tokens(prompt)
+        count_ms = ms_per_call(lambda: open_ai.prompt_tokens(prompt), args.number)
+        for policy in ("trim", "model"):
+            fitted, params = open_ai.fit_prompt(prompt, budget=args.budget, policy=policy)
+            fit_ms = ms_per_call(lambda: open_ai.fit_prompt(prompt, budget=args.budget, policy=policy), args.number)
+            sent = open_ai.prompt_tokens(fitted, params["model"])
+            usd = cost(params["model"], sent, open_ai.MODEL_PARAMS["max_tokens"])
+            print(f"{count:>8} {tokens:>8} {estimate:>9} {count_ms:>9.2f} {policy:>7} {sent:>8} "
+                  f"{params['model']:>14} {fit_ms:>8.2f} {usd:>9.5f}")
+
+    usage = SimpleNamespace(prompt_tokens=1200, completion_tokens=300)
+    calls = 100_000
+    with usage_scope("bench@example.com", "video1"):
+        seconds = timeit.timeit(lambda: usage_log.record("gpt-3.5-turbo", "completion", usage, 0.8), number=calls)
+    print(f"\nusage record: {seconds / calls * 1e9:.0f} ns per call")
@@ -0,0 +1,111 @@
+# Throughput of the production entry point (gunicorn + uvicorn workers,
+# src/gunicorn.conf.py) at increasing worker counts, over real HTTP against
+# the stub upstreams. Workers share sign-in state through SHARED_STATE_URL,
+# so each run signs in via /auth/login -> /auth/callback first.
+#
+#   python bench/bench_workers.py [--workers 1,2,4] [--flow comments] [--requests 400]
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs, urlparse
+
+from loadtest_async import configure_env
+from stubs import start_stub_process
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+def start_app(workers, port, workdir):
+    env = dict(os.environ)
+    env["WEB_CONCURRENCY"] = str(workers)
+    env["BIND"] = f"127.0.0.1:{port}"
+    env["SHARED_STATE_URL"] = f"sqlite:///{os.path.join(workdir, 'shared_state.db')}"
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench_workers.db')}"
+    env["SUMMARY_CACHE_PATH"] = os.path.join(workdir, "summary_cache.db")
+    subprocess.run([sys.executable, "-m", "database.create_db"], cwd=SRC, env=env, check=True)
+    return subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+                            cwd=SRC, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(client, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get("/metrics")
+            return
+        except Exception:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("app did not start")
+
+
+async def sign_in(client):
+    # State stored by whichever worker served /auth/login must be found by
+    # whichever worker serves the callback
+    login = await client.get("/auth/login")
+    state = parse_qs(urlparse(login.headers["location"]).query)["state"][0]
+    callback = await client.get(f"/auth/callback?code=bench-code&state={state}")
+    if callback.status_code != 307:
+        raise RuntimeError(f"sign-in failed: {callback.status_code} {callback.text}")
+    return parse_qs(urlparse(callback.headers["location"]).query)["access_token"][0]
+
+
+async def run(base_url, flow, concurrency, total, comments):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        await wait_ready(client)
+        headers = {"Authorization": f"Bearer {await sign_in(client)}"}
+        semaphore = asyncio.Semaphore(concurrency)
+        errors = 0
+
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                if flow == "summarize":
+                    response = await client.post("/api/summarize_comments", headers=headers, json={
+                        "video_id": f"video{i}", "prompt": "Summarize", "max_comments": comments})
+                else:
+                    response = await client.get(f"/api/video/video{i}/comments?max_comments={comments}",
+                                                headers=headers)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        return total / (time.perf_counter() - started), errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=lambda s: [int(x) for x in s.split(",")], default=[1, 2, 4])
+    parser.add_argument("--flow", choices=["comments", "summarize"], default="comments")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--comments", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.01, help="stub upstream latency in seconds")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_process(latency=args.latency, comments_per_video=args.comments)
+    configure_env(stub_url)
+    print(f"{'workers':>7} {'req/s':>8} {'speedup':>8} {'errors':>6}")
+    baseline = None
+    try:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as workdir:
+                app = start_app(workers, args.port, workdir)
+                try:
+                    throughput, errors = asyncio.run(run(f"http://127.0.0.1:{args.port}", args.flow,
+                                                         args.concurrency, args.requests, args.comments))
+                finally:
+                    app.terminate()
+                    app.wait(timeout=30)
+            baseline = baseline or throughput
+            print(f"{workers:>7} {throughput:>8.1f} {throughput / baseline:>7.2f}x {errors:>6}")
+    finally:
+        stub.terminate()
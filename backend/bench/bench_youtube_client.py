@@ -0,0 +1,40 @@
+# Per-request YouTube client setup cost: build() on every request versus the
+# shared discovery client from youtube.get_service() plus an AuthorizedHttp.
+# No network calls are made; only client construction is timed.
+#
+#   python bench/bench_youtube_client.py
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+for name, value in {"YOUTUBE_API_KEY": "bench", "YOUTUBE_API_SERVICE_NAME": "youtube", "YOUTUBE_API_VERSION": "v3"}.items():
+    os.environ.setdefault(name, value)
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from youtube import get_service, authorized_http
+
+RUNS = 200
+
+
+def per_request_build(credentials):
+    service = build("youtube", "v3", credentials=credentials, cache_discovery=False)
+    return service.commentThreads().list(part="snippet", videoId="abc", maxResults=40)
+
+
+def shared_client(credentials):
+    http = authorized_http(credentials)
+    request = get_service().commentThreads().list(part="snippet", videoId="abc", maxResults=40)
+    return request, http
+
+
+if __name__ == "__main__":
+    credentials = Credentials(token="bench-token")
+    get_service()  # warm the process-wide client, as the first request would
+    before = timeit.timeit(lambda: per_request_build(credentials), number=RUNS) / RUNS * 1e6
+    after = timeit.timeit(lambda: shared_client(credentials), number=RUNS) / RUNS * 1e6
+    print(f"build() per request:  {before:10.1f} us/request")
+    print(f"shared client:        {after:10.1f} us/request")
+    print(f"speedup:              {before / after:10.1f}x")
@@ -0,0 +1,180 @@
+# End-to-end benchmark: the app runs in-process against stand-in OAuth,
+# YouTube and OpenAI servers (bench/stubs.py, in a separate process) and
+# each user-facing flow is driven at increasing concurrency.
+#
+# Reports p50/p95/p99 latency, throughput and RSS per flow and level, and
+# saves them to bench/results/<commit>.json. Pass --compare with an earlier
+# results file to print the change against it.
+#
+#   python bench/harness.py [--latency 0.05] [--comments 200] [--comment-chars 120]
+#                           [--levels 1,4,16] [--requests 64] [--compare bench/results/abc123.json]
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from urllib.parse import parse_qs, urlparse
+
+from loadtest_async import TOKEN, configure_env, sign_in
+from stubs import start_stub_process
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    # Peak rather than current RSS where /proc is unavailable (kB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True).stdout.strip()
+
+    return git("rev-parse", "--short", "HEAD") or "unknown", bool(git("status", "--porcelain", "--untracked-files=no"))
+
+
+async def sign_in_flow(client, i):
+    # /auth/login stores the OAuth state; the callback must present it
+    login = await client.get("/auth/login")
+    state = parse_qs(urlparse(login.headers["location"]).query)["state"][0]
+    return await client.get(f"/auth/callback?code=bench-code-{i}&state={state}")
+
+
+def flows(args):
+    # (name, coroutine function (client, request index) -> response, expected status)
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    comments = args.comments
+    return [
+        ("auth_callback", sign_in_flow, 307),
+        ("videos", lambda client, i: client.get("/api/videos?page_size=15", headers=headers), 200),
+        ("comments", lambda client, i: client.get(f"/api/video/video{i}/comments?max_comments={comments}",
+                                                  headers=headers), 200),
+        ("summarize", lambda client, i: client.post("/api/summarize_comments", headers=headers, json={
+            "video_id": f"video{i}", "prompt": "Summarize", "max_comments": comments}), 200),
+    ]
+
+
+async def run_level(client, call, expected, concurrency, total):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await call(client, i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != expected:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput": total / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "rss_mb": rss_mb(),
+    }
+
+
+async def main_async(args):
+    import httpx
+    import main
+
+    sign_in(main)
+    transport = httpx.ASGITransport(app=main.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        print(f"{'flow':<14} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6} {'rss MB':>7}")
+        for name, call, expected in flows(args):
+            if args.flows and name not in args.flows:
+                continue
+            for concurrency in args.levels:
+                row = await run_level(client, call, expected, concurrency, args.requests)
+                row["flow"] = name
+                results.append(row)
+                print(f"{name:<14} {concurrency:>5} {row['throughput']:>8.1f} {row['p50_ms']:>8.1f} "
+                      f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['errors']:>6} {row['rss_mb']:>7.1f}")
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(row["flow"], row["concurrency"]): row for row in baseline["results"]}
+    print(f"\nAgainst {baseline['commit']}:")
+    print(f"{'flow':<14} {'conc':>5} {'req/s':>9} {'p95':>9} {'p99':>9}")
+    for row in results:
+        old = previous.get((row["flow"], row["concurrency"]))
+        if old is None:
+            continue
+
+        def change(key):
+            return f"{(row[key] - old[key]) / old[key] * 100:+8.1f}%" if old[key] else "      n/a"
+
+        print(f"{row['flow']:<14} {row['concurrency']:>5} {change('throughput')} {change('p95_ms')} {change('p99_ms')}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05, help="stub upstream latency in seconds")
+    parser.add_argument("--comments", type=int, default=200, help="comments per video")
+    parser.add_argument("--comment-chars", type=int, default=120, help="characters per comment")
+    parser.add_argument("--levels", type=lambda s: [int(x) for x in s.split(",")], default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=64, help="requests per flow and level")
+    parser.add_argument("--flows", type=lambda s: s.split(","), default=None)
+    parser.add_argument("--out", default=None, help="results file (default bench/results/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to diff against")
+    args = parser.parse_args()
+
+    stub, base_url = start_stub_process(latency=args.latency, comments_per_video=args.comments,
+                                        comment_chars=args.comment_chars)
+    try:
+        configure_env(base_url)
+        results = asyncio.run(main_async(args))
+    finally:
+        stub.terminate()
+
+    commit, dirty = git_revision()
+    report = {
+        "commit": commit + ("-dirty" if dirty else ""),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {"latency": args.latency, "comments": args.comments, "comment_chars": args.comment_chars,
+                   "requests": args.requests},
+        "results": results,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Throughput of the comments and summarize routes against local stub
+# upstreams at increasing concurrency. With blocking calls offloaded to the
+# thread pool, throughput should grow with concurrency instead of staying
+# pinned at 1 / upstream latency.
+#
+#   python bench/loadtest_async.py [--latency 0.1] [--requests 64]
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from stubs import start_stub_server
+
+TOKEN = "bench-token"
+
+
+def configure_env(base_url):
+    for name in ("YOUTUBE_API_KEY", "GOOGLE_CLIENT_ID", "GOOGLE_CLIENT_SECRET", "SESSION_SECRET_KEY"):
+        os.environ.setdefault(name, "bench")
+    os.environ.setdefault("GOOGLE_REDIRECT_URI", "http://localhost:8000/auth/callback")
+    os.environ["YOUTUBE_API_SERVICE_NAME"] = "youtube"
+    os.environ["YOUTUBE_API_VERSION"] = "v3"
+    os.environ["GOOGLE_API_ENDPOINT"] = base_url
+    os.environ["GOOGLE_TOKEN_URI"] = f"{base_url}/token"
+    os.environ["OAUTHLIB_RELAX_TOKEN_SCOPE"] = "1"  # the stub grants an empty scope
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    os.environ["OPENAI_API_KEY"] = "bench"
+    os.environ.setdefault("DATABASE_URL", "sqlite:///bench.db")
+    os.environ.setdefault("SUMMARY_CACHE_PATH", ":memory:")
+    # Measure upstream overlap, not cache hits
+    os.environ.setdefault("SUMMARY_CACHE_MAX_AGE", "0")
+    os.environ.setdefault("COMMENT_CACHE_TTL", "0")
+    # ...nor comments and summaries already stored in the database
+    os.environ.setdefault("COMMENT_SYNC_INTERVAL", "0")
+    os.environ.setdefault("INCREMENTAL_SUMMARIES", "0")
+    # Measure the app, not admission control
+    for name in ("RATE_LIMIT_VIDEOS_PER_MINUTE", "RATE_LIMIT_COMMENTS_PER_MINUTE",
+                 "RATE_LIMIT_SUMMARIZE_PER_MINUTE", "RATE_LIMIT_JOBS_PER_MINUTE", "OPENAI_REQUESTS_PER_MINUTE"):
+        os.environ.setdefault(name, "1000000")
+    os.environ.setdefault("YOUTUBE_QUOTA_PER_DAY", "1000000000")
+    os.environ.setdefault("YOUTUBE_QUOTA_BURST", "1000000")
+    os.environ.setdefault("OPENAI_MAX_IN_FLIGHT", "1000")
+
+
+def sign_in(main):
+    from database.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    main.session_store.add(main.UserData(
+        google_id="bench-google-id",
+        name="Bench User",
+        email="bench@example.com",
+        channel_id="UCbench",
+        access_token=TOKEN,
+        refresh_token="bench-refresh",
+        token_expiry=datetime.utcnow() + timedelta(hours=1),
+    ))
+
+
+async def run_level(client, method, path, body, concurrency, total):
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+
+    async def one():
+        async with semaphore:
+            response = await client.request(method, path, json=body, headers=headers)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+async def main_async(args):
+    import httpx
+    import main
+
+    sign_in(main)
+    transport = httpx.ASGITransport(app=main.app)
+    routes = [
+        ("GET", "/api/video/video1/comments", None),
+        ("POST", "/api/summarize_comments", {"video_id": "video1", "prompt": "Summarize"}),
+    ]
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        print(f"{'route':<32} {'concurrency':>11} {'req/s':>8}")
+        for method, path, body in routes:
+            for concurrency in (1, 2, 4, 8, 16, 32):
+                rate = await run_level(client, method, path, body, concurrency, args.requests)
+                print(f"{method + ' ' + path:<32} {concurrency:>11} {rate:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.1, help="stub upstream latency in seconds")
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    args = parser.parse_args()
+    server, base_url = start_stub_server(latency=args.latency)
+    configure_env(base_url)
+    asyncio.run(main_async(args))
+    server.shutdown()
@@ -0,0 +1,309 @@
+# Local stand-ins for the Google and OpenAI endpoints the backend talks to.
+# Every response is delayed by `latency` seconds to mimic upstream round-trips.
+#
+# Point the app at a running stub with:
+#   GOOGLE_API_ENDPOINT=<base_url>   (googleapiclient discovery services)
+#   OPENAI_BASE_URL=<base_url>/v1    (read by the openai SDK)
+#   GOOGLE_TOKEN_URI=<base_url>/token (OAuth code exchange and refresh)
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+EPOCH = datetime(2024, 1, 1)  # comment i is published i seconds after this
+
+
+def comment_thread(video_id, index, chars=None):
+    comment_id = f"{video_id}-c{index}"
+    text = f"Comment {index} on {video_id}: the audio was great and the editing was sharp."
+    if chars is not None and chars > len(text):
+        # Pad to the requested payload size with filler words
+        text = (text + " lorem ipsum" * (chars // 12 + 1))[:chars]
+    return {
+        "id": comment_id,
+        "snippet": {
+            "videoId": video_id,
+            "topLevelComment": {
+                "id": comment_id,
+                "snippet": {
+                    "textDisplay": text,
+                    "authorDisplayName": f"viewer{index}",
+                    "likeCount": index % 17,
+                    "publishedAt": (EPOCH + timedelta(seconds=index)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                },
+            },
+        },
+    }
+
+
+def comment_record_text(thread):
+    return thread["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
+
+
+def chat_completion(content, prompt_tokens=100):
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-3.5-turbo",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def embedding_response(texts, dimensions=256):
+    # A deterministic unit vector per text, so equal texts embed equally
+    data = []
+    for index, text in enumerate(texts):
+        rng = random.Random(hashlib.blake2b(text.encode(), digest_size=8).digest())
+        vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        data.append({"object": "embedding", "index": index, "embedding": [x / norm for x in vector]})
+    prompt_tokens = sum(max(1, len(text) // 4) for text in texts)
+    return {"object": "list", "data": data, "model": "text-embedding-3-small",
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real upstreams
+    server_version = "stub"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        self._count(url.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path.endswith("/commentThreads"):
+            self._send_json(self._comment_threads(query))
+        elif url.path.endswith("/search"):
+            self._send_json(self._search(query))
+        elif url.path.endswith("/playlistItems"):
+            self._send_json(self._playlist_items(query))
+        elif url.path.endswith("/videos"):
+            self._send_json({"items": [{
+                "id": video_id,
+                "contentDetails": {"duration": "PT4M13S"},
+                "statistics": {"viewCount": "1000", "likeCount": "50", "commentCount": str(self.server.comments_per_video)},
+            } for video_id in query.get("id", "").split(",") if video_id]})
+        elif url.path.endswith("/channels"):
+            self._send_json({"items": [{"id": "UCstubchannel", "contentDetails": {
+                "relatedPlaylists": {"uploads": "UUstubchannel"}}}]})
+        elif url.path.endswith("/userinfo"):
+            self._send_json({"id": "stub-google-id", "email": "stub@example.com", "name": "Stub User"})
+        else:
+            self._send_json({"error": {"code": 404, "message": url.path}}, status=404)
+
+    def _count(self, path):
+        with self.server.counts_lock:
+            name = path.rsplit("/", 1)[-1]
+            self.server.request_counts[name] = self.server.request_counts.get(name, 0) + 1
+
+    def _inject_failure(self):
+        # The first `fail_first` requests fail, then each with probability error_rate
+        with self.server.counts_lock:
+            if self.server.fail_first > 0:
+                self.server.fail_first -= 1
+                return True
+        return random.random() < self.server.error_rate
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        body = self._read_body()
+        self._count(url.path)
+        if url.path.endswith("/chat/completions"):
+            if self._inject_failure():
+                headers = {"Retry-After": str(self.server.retry_after)} if self.server.retry_after is not None else None
+                self._send_json({"error": {"message": "injected failure", "type": "stub"}},
+                                status=self.server.error_status, headers=headers)
+                return
+            request = json.loads(body or b"{}")
+            prompt_chars = sum(len(m.get("content") or "") for m in request.get("messages", []))
+            if request.get("stream"):
+                include_usage = (request.get("stream_options") or {}).get("include_usage")
+                self._stream_completion(prompt_chars // 4 if include_usage else None)
+                return
+            self._send_json(chat_completion(self.server.summary_text, prompt_tokens=max(1, prompt_chars // 4)))
+        elif url.path.endswith("/embeddings"):
+            request = json.loads(body or b"{}")
+            texts = request.get("input") or []
+            self._send_json(embedding_response([texts] if isinstance(texts, str) else texts,
+                                               request.get("dimensions") or 256))
+        elif url.path.endswith("/token"):
+            self._send_json({"access_token": f"stub-access-{time.time_ns()}", "expires_in": 3600,
+                             "refresh_token": "stub-refresh", "token_type": "Bearer", "scope": ""})
+        else:
+            self._send_json({"error": {"code": 404, "message": url.path}}, status=404)
+
+    def _stream_completion(self, prompt_tokens=None):
+        # Server-sent events, one word per chunk, like the real streaming API
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for word in self.server.summary_text.split(" "):
+                chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": "gpt-3.5-turbo",
+                         "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(self.server.token_latency)
+            if prompt_tokens is not None:
+                usage = chat_completion(self.server.summary_text, max(1, prompt_tokens))["usage"]
+                chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": "gpt-3.5-turbo", "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client cancelled the stream
+
+    def _comment_threads(self, query):
+        video_id = query.get("videoId", "video")
+        page_size = int(query.get("maxResults", 20))
+        start = int(query.get("pageToken") or 0)
+        end = min(start + page_size, self.server.comments_per_video)
+        indices = range(start, end)
+        if query.get("order") == "time":
+            # Newest (highest index) first, so raising comments_per_video adds new comments at the top
+            indices = [self.server.comments_per_video - 1 - i for i in indices]
+        page = {"etag": f"{video_id}-{self.server.comments_per_video}-{query.get('order')}",
+                "items": [comment_thread(video_id, i, self.server.comment_chars) for i in indices]}
+        if end < self.server.comments_per_video:
+            page["nextPageToken"] = str(end)
+        return page
+
+    def _playlist_items(self, query):
+        page_size = int(query.get("maxResults", 5))
+        start = int(query.get("pageToken") or 0)
+        end = min(start + page_size, self.server.videos_per_channel)
+        page = {"items": [{
+            "snippet": {"title": f"Video {i}", "description": "Stub video", "publishedAt": "2024-01-01T00:00:00Z",
+                        "thumbnails": {"high": {"url": f"https://example.com/{i}.jpg"}}},
+            "contentDetails": {"videoId": f"video{i}", "videoPublishedAt": "2024-01-01T00:00:00Z"},
+        } for i in range(start, end)]}
+        if end < self.server.videos_per_channel:
+            page["nextPageToken"] = str(end)
+        return page
+
+    def _search(self, query):
+        count = int(query.get("maxResults", 5))
+        return {"items": [{
+            "id": {"videoId": f"video{i}"},
+            "snippet": {"title": f"Video {i}", "description": "Stub video",
+                        "thumbnails": {"high": {"url": f"https://example.com/{i}.jpg"}}},
+        } for i in range(count)]}
+
+
+def start_stub_server(latency=0.1, comments_per_video=40, summary_text="Viewers liked the audio and editing.",
+                      error_rate=0.0, error_status=429, retry_after=None, token_latency=0.02,
+                      videos_per_channel=200, comment_chars=None, fail_first=0):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.fail_first = fail_first
+    server.error_status = error_status
+    server.retry_after = retry_after
+    server.token_latency = token_latency
+    server.comments_per_video = comments_per_video
+    server.videos_per_channel = videos_per_channel
+    server.comment_chars = comment_chars
+    server.request_counts = {}  # requests per endpoint name, e.g. "commentThreads", "completions"
+    server.counts_lock = threading.Lock()
+    server.summary_text = summary_text
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
+
+
+def _serve(ready, kwargs):
+    server, base_url = start_stub_server(**kwargs)
+    ready.put(base_url)
+    threading.Event().wait()
+
+
+def start_stub_process(**kwargs):
+    # The stub in its own process, so its CPU time and memory do not show up
+    # in measurements of the app
+    import multiprocessing
+
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(ready, kwargs), daemon=True)
+    process.start()
+    return process, ready.get(timeout=30)
+
+
+class StubModel:
+    """Drop-in for open_ai.complete: sleeps `latency` seconds per call, plus
+    `per_1k_tokens` seconds per thousand prompt tokens."""
+
+    def __init__(self, latency=0.2, summary_text="Viewers liked the audio and editing.", per_1k_tokens=0.0):
+        self.latency = latency
+        self.per_1k_tokens = per_1k_tokens
+        self.summary_text = summary_text
+        self.calls = 0
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+        time.sleep(self.latency + len(prompt) / 4000 * self.per_1k_tokens)
+        return self.summary_text
+
+
+class StubEmbedder:
+    """Drop-in for embeddings.OpenAIEmbedder: hashing vectors, plus `latency`
+    seconds per request of up to `batch` texts."""
+
+    remote = True
+    name = "stub"
+
+    def __init__(self, latency=0.1, batch=256, dimensions=256):
+        from embeddings import HashingEmbedder
+
+        self.embedder = HashingEmbedder(dimensions)
+        self.dimensions = dimensions
+        self.latency = latency
+        self.batch = batch
+        self.calls = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, texts):
+        requests = math.ceil(len(texts) / self.batch)
+        with self._lock:
+            self.calls += requests
+            self.texts += len(texts)
+        time.sleep(self.latency * requests)
+        return self.embedder(texts)
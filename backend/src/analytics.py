@@ -0,0 +1,301 @@
+import os
+import time
+
+from lazy_imports import lazy_import
+from metrics import Counter, registry
+from preprocess import clean_text, is_low_information, words
+
+# Loaded with the first analysis (or by the warm-up hook)
+np = lazy_import("numpy")
+
+# How /api/summarize_comments uses the local analytics:
+#   answer  - generic sentiment / theme questions are answered from them, no model call
+#   context - as answer, and other prompts get them appended as compact context
+#   off     - every prompt goes to the model with the comments only
+ANALYTICS_MODE = os.environ.get("ANALYTICS_MODE", "answer")
+MAX_KEYWORDS = 15
+MAX_TOPICS = 6
+TOPIC_FEATURES = 300  # highest-weighted terms used to cluster comments
+MIN_TOPIC_COMMENTS = 10  # fewer comments than this are not clustered
+KMEANS_ITERATIONS = 25
+NEGATION_SCALE = -0.74  # "not good" is milder than "bad"
+SCORE_ALPHA = 15  # squashes summed word scores into (-1, 1), as VADER does
+NEUTRAL_BAND = 0.05
+# Terms in more than this share of comments say nothing about any one of them.
+# High, so the theme most comments are about still counts.
+MAX_DOCUMENT_FREQUENCY = 0.9
+
+local_answers = registry.register(Counter(
+    "local_answers_total", "Summarize prompts answered from local comment analytics, by question kind",
+    labels=("kind",),
+))
+
+# Word valence from -3 (very negative) to 3 (very positive), for the
+# vocabulary that carries most of the sentiment in YouTube comments
+LEXICON = {
+    "amazing": 3.0, "awesome": 3.0, "brilliant": 3.0, "excellent": 3.0, "fantastic": 3.0, "incredible": 3.0,
+    "masterpiece": 3.0, "perfect": 3.0, "outstanding": 3.0, "superb": 3.0, "wonderful": 3.0, "best": 2.5,
+    "love": 2.5, "loved": 2.5, "loving": 2.5, "beautiful": 2.5, "great": 2.5, "genius": 2.5, "gorgeous": 2.5,
+    "epic": 2.0, "enjoyed": 2.0, "enjoy": 2.0, "favorite": 2.0, "favourite": 2.0, "fun": 2.0, "funny": 2.0,
+    "glad": 2.0, "good": 2.0, "happy": 2.0, "helpful": 2.0, "impressive": 2.0, "inspiring": 2.0, "like": 1.0,
+    "liked": 1.5, "nice": 1.5, "cool": 1.5, "clear": 1.5, "useful": 1.5, "interesting": 1.5, "informative": 1.5,
+    "thank": 1.5, "thanks": 1.5, "appreciate": 1.5, "recommend": 1.5, "solid": 1.0, "better": 1.0,
+    "fine": 0.5, "okay": 0.5, "ok": 0.5,
+    "awful": -3.0, "terrible": -3.0, "horrible": -3.0, "worst": -3.0, "hate": -3.0, "hated": -3.0,
+    "garbage": -3.0, "trash": -2.5, "disgusting": -3.0, "useless": -2.5, "pathetic": -2.5, "bad": -2.5,
+    "boring": -2.0, "annoying": -2.0, "disappointed": -2.0, "disappointing": -2.0, "dislike": -2.0,
+    "stupid": -2.0, "wrong": -2.0, "waste": -2.0, "clickbait": -2.0, "misleading": -2.0, "fake": -2.0,
+    "broken": -2.0, "sad": -1.5, "poor": -1.5, "worse": -1.5, "confusing": -1.5, "confused": -1.5,
+    "problem": -1.0, "issue": -1.0, "issues": -1.0, "loud": -1.0, "quiet": -0.5, "slow": -1.0, "long": -0.5,
+    "cringe": -2.0, "meh": -1.0, "unfortunately": -1.0, "lag": -1.0, "bug": -1.0, "bugs": -1.0,
+}
+NEGATORS = {"not", "no", "never", "nothing", "hardly", "isn't", "wasn't", "aren't", "don't", "doesn't",
+            "didn't", "can't", "cannot", "won't", "wouldn't", "shouldn't", "couldn't", "without"}
+STOPWORDS = {
+    "a", "about", "after", "again", "all", "also", "am", "an", "and", "any", "are", "as", "at", "be", "because",
+    "been", "before", "being", "but", "by", "can", "could", "did", "do", "does", "doing", "even", "ever", "for",
+    "from", "get", "got", "had", "has", "have", "he", "her", "here", "him", "his", "how", "i", "i'm", "i've",
+    "if", "in", "into", "is", "it", "it's", "its", "just", "know", "let", "me", "more", "most", "much", "my",
+    "now", "of", "on", "one", "only", "or", "other", "our", "out", "over", "really", "same", "see", "she",
+    "should", "so", "some", "still", "such", "than", "that", "that's", "the", "their", "them", "then", "there",
+    "these", "they", "think", "this", "those", "through", "to", "too", "up", "us", "very", "video", "videos",
+    "want", "was", "way", "we", "well", "were", "what", "when", "where", "which", "while", "who", "why",
+    "will", "with", "would", "yeah", "yes", "you", "you're", "your", "lol", "guys", "make", "made", "thing",
+    "things", "go", "going", "people", "watch", "watching", "watched", "time", "say", "said",
+    "lot", "own", "new", "something", "many", "every", "need", "looks", "look", "bit",
+} | NEGATORS
+
+
+def _encode(texts):
+    # Flat token stream: (document index, term index) per token, plus the vocabulary
+    vocab = {}
+    term_ids = []
+    lengths = []
+    for text in texts:
+        tokens = words(text)
+        term_ids.extend(vocab.setdefault(token, len(vocab)) for token in tokens)
+        lengths.append(len(tokens))
+    doc_ids = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+    return vocab, doc_ids, np.asarray(term_ids, dtype=np.int64)
+
+
+def _term_values(vocab, table):
+    # table.get(term, 0) for every term in the vocabulary, by term index
+    return np.fromiter((table.get(term, 0.0) for term in vocab), dtype=np.float64, count=len(vocab))
+
+
+def sentiment_scores(n_docs, vocab, doc_ids, term_ids):
+    """Per-comment sentiment in (-1, 1) from the lexicon, with simple negation."""
+    scores = _term_values(vocab, LEXICON)[term_ids]
+    negator = np.fromiter((term in NEGATORS for term in vocab), dtype=bool, count=len(vocab))[term_ids]
+    # A negator up to two tokens back, in the same comment, flips the word
+    negated = np.zeros(len(term_ids), dtype=bool)
+    for distance in (1, 2):
+        negated[distance:] |= negator[:-distance] & (doc_ids[distance:] == doc_ids[:-distance])
+    scores = np.where(negated, scores * NEGATION_SCALE, scores)
+    totals = np.bincount(doc_ids, weights=scores, minlength=n_docs)
+    return totals / np.sqrt(totals * totals + SCORE_ALPHA)
+
+
+def tfidf(n_docs, vocab, doc_ids, term_ids):
+    """Sparse, L2-normalized TF-IDF weights as parallel (doc, term, weight) arrays.
+
+    Stopwords, terms shorter than three letters and (given enough comments)
+    terms in more than MAX_DOCUMENT_FREQUENCY of them get no weight.
+    """
+    size = len(vocab)
+    pairs, counts = np.unique(doc_ids * size + term_ids, return_counts=True)
+    docs, terms = pairs // size, pairs % size
+    df = np.bincount(terms, minlength=size)
+    idf = np.log((1 + n_docs) / (1 + df)) + 1
+    weights = (1 + np.log(counts)) * idf[terms]
+    eligible = np.fromiter((len(term) >= 3 and term not in STOPWORDS for term in vocab), dtype=bool,
+                           count=size)
+    if n_docs >= 20:
+        eligible &= df <= MAX_DOCUMENT_FREQUENCY * n_docs
+    weights[~eligible[terms]] = 0
+    norms = np.sqrt(np.bincount(docs, weights=weights * weights, minlength=n_docs))
+    weights /= np.where(norms > 0, norms, 1)[docs]
+    return docs, terms, weights, df
+
+
+def _kmeans(X, k, rng):
+    # Spherical k-means (rows of X are unit vectors) with k-means++ seeding
+    centroids = [X[rng.integers(len(X))]]
+    for _ in range(1, k):
+        distance = 1 - np.max(X @ np.array(centroids).T, axis=1)
+        distance = np.clip(distance, 0, None)
+        total = distance.sum()
+        index = rng.choice(len(X), p=distance / total) if total > 0 else rng.integers(len(X))
+        centroids.append(X[index])
+    centroids = np.array(centroids)
+    labels = None
+    for _ in range(KMEANS_ITERATIONS):
+        similarity = X @ centroids.T
+        new_labels = similarity.argmax(axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.eye(k, dtype=X.dtype)[labels].T @ X
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        if empty.any():
+            # Reseed an empty cluster with the comment its centroid fits worst
+            worst = similarity.max(axis=1).argsort()[:empty.sum()]
+            sums[empty], norms[empty] = X[worst], 1
+        centroids = sums / norms
+    return labels, X @ centroids.T, centroids
+
+
+def topics(texts, sentiment, docs, terms, weights, vocab_terms, term_score):
+    n_docs = len(texts)
+    ranked = np.argsort(-term_score)
+    features = ranked[:TOPIC_FEATURES][term_score[ranked[:TOPIC_FEATURES]] > 0]
+    column = np.full(len(term_score), -1)
+    column[features] = np.arange(len(features))
+    keep = column[terms] >= 0
+    X = np.zeros((n_docs, len(features)), dtype=np.float32)
+    X[docs[keep], column[terms[keep]]] = weights[keep]
+    norms = np.linalg.norm(X, axis=1)
+    rows = np.flatnonzero(norms > 0)
+    if len(rows) < MIN_TOPIC_COMMENTS or len(features) < 2:
+        return []
+    X = X[rows] / norms[rows, None]
+    k = min(MAX_TOPICS, max(2, int(np.sqrt(len(rows) / 10))))
+    labels, similarity, centroids = _kmeans(X, k, np.random.default_rng(0))
+
+    result = []
+    for cluster in range(k):
+        members = np.flatnonzero(labels == cluster)
+        if len(members) == 0:
+            continue
+        top_terms = np.argsort(-centroids[cluster])[:3]
+        example = rows[members[similarity[members, cluster].argmax()]]
+        result.append({
+            "terms": [vocab_terms[features[index]] for index in top_terms if centroids[cluster, index] > 0],
+            "comments": int(len(members)),
+            "share": round(len(members) / n_docs, 3),
+            "sentiment": round(float(sentiment[rows[members]].mean()), 3),
+            "example": texts[example][:200],
+        })
+    result.sort(key=lambda topic: -topic["comments"])
+    return result
+
+
+def analyze_comments(records):
+    """Sentiment, keywords and topics for comment records, without a model call.
+
+    Spam and filler comments are left out, as for summaries. Blocking (CPU);
+    call through run_blocking.
+    """
+    started = time.perf_counter()
+    texts, likes = [], []
+    for record in records:
+        text = clean_text(record['text'])
+        if text and not is_low_information(text):
+            texts.append(text)
+            likes.append(record.get('like_count') or 0)
+    n_docs = len(texts)
+    result = {"comments": n_docs, "skipped": len(records) - n_docs}
+    if not n_docs:
+        return {**result, "sentiment": None, "keywords": [], "topics": [], "elapsed_ms": 0.0}
+
+    vocab, doc_ids, term_ids = _encode(texts)
+    vocab_terms = list(vocab)
+    sentiment = sentiment_scores(n_docs, vocab, doc_ids, term_ids)
+    # A comment with many likes speaks for more viewers
+    like_weights = 1 + np.log1p(np.asarray(likes, dtype=np.float64))
+    result["sentiment"] = {
+        "mean": round(float(sentiment.mean()), 3),
+        "like_weighted_mean": round(float(np.average(sentiment, weights=like_weights)), 3),
+        "positive": round(float((sentiment >= NEUTRAL_BAND).mean()), 3),
+        "negative": round(float((sentiment <= -NEUTRAL_BAND).mean()), 3),
+        "neutral": round(float((np.abs(sentiment) < NEUTRAL_BAND).mean()), 3),
+    }
+
+    docs, terms, weights, df = tfidf(n_docs, vocab, doc_ids, term_ids)
+    term_score = np.bincount(terms, weights=weights, minlength=len(vocab)) / n_docs
+    # A keyword should come up in more than one comment
+    term_score[df < min(2, n_docs)] = 0
+    top = np.argsort(-term_score)[:MAX_KEYWORDS]
+    result["keywords"] = [{"term": vocab_terms[index], "score": round(float(term_score[index]), 4),
+                           "comments": int(df[index])} for index in top if term_score[index] > 0]
+    result["topics"] = topics(texts, sentiment, docs, terms, weights, vocab_terms, term_score)
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+# Local answers are only given to generic questions; a prompt with any other
+# content word ("...about the audio?") is specific and goes to the model
+_SENTIMENT_WORDS = {"sentiment", "sentiments", "feel", "feels", "feeling", "feelings", "positive", "negative",
+                    "mood", "reception", "received", "react", "reaction", "reactions", "tone", "opinion",
+                    "opinions", "overall", "happy", "unhappy"}
+_THEME_WORDS = {"theme", "themes", "topic", "topics", "keyword", "keywords", "talking", "talk", "discuss",
+                "discussed", "discussing", "main", "points", "common", "top", "key", "recurring", "mentioned"}
+_GENERIC_WORDS = {"comments", "comment", "commenters", "viewers", "viewer", "audience", "people", "video",
+                  "summarize", "summary", "tell", "give", "list", "show", "describe", "general", "mostly",
+                  "generally", "think", "thoughts", "say", "saying", "are", "is", "the", "what", "whats",
+                  "what's", "how", "do", "does", "of", "about", "in", "on", "and", "or", "me", "a", "an", "s",
+                  "there", "any", "most", "this", "these", "my", "please", "they", "it"}
+
+
+def local_question(prompt):
+    """The kinds of question ("sentiment", "themes") a prompt asks, if it can be answered locally."""
+    tokens = set(words(prompt))
+    kinds = set()
+    if tokens & _SENTIMENT_WORDS:
+        kinds.add("sentiment")
+    if tokens & _THEME_WORDS:
+        kinds.add("themes")
+    if not kinds or tokens - _SENTIMENT_WORDS - _THEME_WORDS - _GENERIC_WORDS:
+        return None
+    return kinds
+
+
+def _percent(value):
+    return f"{value * 100:.0f}%"
+
+
+def local_answer(kinds, result):
+    # None when the analytics have nothing to say, so the model answers instead
+    if not result["comments"]:
+        return "No comments found for this video."
+    if "themes" in kinds and not result["topics"] and not result["keywords"]:
+        return None  # too few or too varied comments to find themes in
+    parts = []
+    if "sentiment" in kinds:
+        sentiment = result["sentiment"]
+        lean = ("mostly positive" if sentiment["mean"] >= 0.2 else
+                "mostly negative" if sentiment["mean"] <= -0.2 else
+                "mixed" if sentiment["positive"] and sentiment["negative"] else "neutral")
+        parts.append(f"Overall the comments are {lean}: {_percent(sentiment['positive'])} positive, "
+                     f"{_percent(sentiment['negative'])} negative and {_percent(sentiment['neutral'])} neutral "
+                     f"across {result['comments']} comments.")
+    if "themes" in kinds:
+        if result["topics"]:
+            lines = [f"- {', '.join(topic['terms'])} ({_percent(topic['share'])} of comments): \"{topic['example']}\""
+                     for topic in result["topics"]]
+            parts.append("Main themes:\n" + "\n".join(lines))
+        if result["keywords"]:
+            parts.append("Most distinctive words: " + ", ".join(k["term"] for k in result["keywords"][:10]) + ".")
+    for kind in kinds:
+        local_answers.inc(kind)
+    return "\n\n".join(parts)
+
+
+def context_block(result):
+    """Compact text form of the analytics, appended to a model prompt."""
+    if not result["comments"]:
+        return ""
+    sentiment = result["sentiment"]
+    lines = [
+        "Comment statistics computed locally (background only; the comments remain the source):",
+        f"- {result['comments']} comments: {_percent(sentiment['positive'])} positive, "
+        f"{_percent(sentiment['negative'])} negative, {_percent(sentiment['neutral'])} neutral",
+    ]
+    if result["keywords"]:
+        lines.append("- Keywords: " + ", ".join(k["term"] for k in result["keywords"][:10]))
+    for topic in result["topics"]:
+        lines.append(f"- Theme {', '.join(topic['terms'])}: {_percent(topic['share'])} of comments, "
+                     f"sentiment {topic['sentiment']:+.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from shared_state import SHARED_STATE_URL, shared_state
+
+VIDEO_CACHE_TTL = int(os.environ.get("VIDEO_CACHE_TTL", "300"))  # seconds
+COMMENT_CACHE_TTL = int(os.environ.get("COMMENT_CACHE_TTL", "120"))  # seconds
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "2048"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+class CacheEntry:
+    __slots__ = ("value", "etag", "expires_at", "size")
+
+    def __init__(self, value, etag, expires_at, size):
+        self.value = value
+        self.etag = etag
+        self.expires_at = expires_at
+        self.size = size
+
+    def is_fresh(self, now=None):
+        return (now or time.monotonic()) < self.expires_at
+
+
+class TTLCache:
+    """LRU cache with per-entry TTL and an approximate memory bound.
+
+    Expired entries are kept (until evicted) so their ETag can be used to
+    revalidate them instead of downloading the data again.
+    """
+
+    def __init__(self, ttl, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, etag=None):
+        size = len(json.dumps(value, separators=(",", ":")))
+        if size > self.max_bytes:
+            return
+        entry = CacheEntry(value, etag, time.monotonic() + self.ttl, size)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def touch(self, key):
+        # Upstream confirmed the entry is unchanged: start a new TTL window
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires_at = time.monotonic() + self.ttl
+
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "evictions": self.evictions,
+        }
+
+
+class SharedEntry(CacheEntry):
+    __slots__ = ()
+
+    def is_fresh(self, now=None):
+        # Wall-clock expiry: monotonic clocks are not comparable across processes
+        return (now or time.time()) < self.expires_at
+
+
+class SharedTTLCache:
+    """TTLCache counterpart whose entries live in a SharedState backend, so
+    every worker sees what any of them fetched.
+
+    Entries are retained for `retain` times the TTL after expiring so their
+    ETag can still be used for revalidation; the backend does the eviction.
+    """
+
+    def __init__(self, state, namespace, ttl, retain=10):
+        self.state = state
+        self.namespace = namespace
+        self.ttl = ttl
+        self.retain = retain
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def _key(self, key):
+        return f"cache:{self.namespace}:{json.dumps(key, separators=(',', ':'))}"
+
+    def get_entry(self, key):
+        item = self.state.get(self._key(key))
+        if item is None:
+            return None
+        return SharedEntry(item["value"], item["etag"], item["expires_at"], 0)
+
+    def set(self, key, value, etag=None):
+        item = {"value": value, "etag": etag, "expires_at": time.time() + self.ttl}
+        self.state.set(self._key(key), item, self.ttl * (1 + self.retain))
+
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def touch(self, key):
+        entry = self.get_entry(key)
+        if entry is not None:
+            self.set(key, entry.value, entry.etag)
+
+    def invalidate(self, key):
+        self.state.delete(self._key(key))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "revalidations": self.revalidations}
+
+
+def make_cache(ttl, namespace):
+    # In-process LRU for a single worker, the shared backend otherwise
+    if SHARED_STATE_URL.startswith("memory://"):
+        return TTLCache(ttl)
+    return SharedTTLCache(shared_state, namespace, ttl)
+
+
+video_cache = make_cache(VIDEO_CACHE_TTL, "videos")
+comment_cache = make_cache(COMMENT_CACHE_TTL, "comments")
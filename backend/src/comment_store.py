@@ -0,0 +1,199 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from googleapiclient.errors import HttpError
+from sqlalchemy.exc import IntegrityError
+
+from database.database import SessionLocal
+from database.models import Comment, CommentSync
+from youtube import COMMENT_PAGE_SIZE, MAX_COMMENTS, comment_record, fetch_comment_page
+
+logger = logging.getLogger(__name__)
+
+# A video synced this recently is served from the database without asking
+# YouTube, to viewers who fetched it themselves within the same interval
+COMMENT_SYNC_INTERVAL = timedelta(seconds=int(os.environ.get("COMMENT_SYNC_INTERVAL", "60")))
+MAX_VIEWERS = 100_000  # (video, viewer) access checks remembered per process
+# Safety cap on the pages one sync walks looking for the newest stored comment
+SYNC_MAX_PAGES = int(os.environ.get("COMMENT_SYNC_MAX_PAGES", "100"))
+
+
+def parse_published_at(value):
+    # YouTube timestamps are UTC ("2024-01-01T00:00:00Z"); stored naive like the other columns
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def _to_record(comment):
+    return {
+        'id': comment.id,
+        'text': comment.text,
+        'author': comment.author,
+        'like_count': comment.like_count,
+        'published_at': comment.published_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+
+class CommentStore:
+    """Comments persisted per video, kept current by incremental syncs.
+
+    Syncs walk commentThreads newest first (order=time) and stop at the first
+    page containing a comment that is already stored, so re-reading an active
+    video costs one page per ~100 new comments rather than the whole thread.
+    Stored comments are only served to a viewer whose own credentials were
+    accepted for the video within sync_interval; anyone else triggers a sync,
+    which doubles as YouTube's access check. Blocking; call through run_blocking.
+    """
+
+    def __init__(self, session_factory=SessionLocal, sync_interval=COMMENT_SYNC_INTERVAL, max_viewers=MAX_VIEWERS,
+                 max_sync_pages=SYNC_MAX_PAGES):
+        self.session_factory = session_factory
+        self.sync_interval = sync_interval
+        self.max_viewers = max_viewers
+        self.max_sync_pages = max_sync_pages
+        self._verified = {}  # (video_id, viewer) -> when YouTube last served them this video
+        self._verified_lock = threading.Lock()
+        self.pages_fetched = 0
+        self.comments_added = 0
+
+    def _viewer_verified(self, video_id, viewer, now):
+        verified_at = self._verified.get((video_id, viewer))
+        return verified_at is not None and verified_at + self.sync_interval > now
+
+    def _mark_verified(self, video_id, viewer, now):
+        with self._verified_lock:
+            if len(self._verified) >= self.max_viewers:
+                cutoff = now - self.sync_interval
+                self._verified = {key: at for key, at in self._verified.items() if at > cutoff}
+            self._verified[(video_id, viewer)] = now
+
+    def _store_page(self, db, video_id, records):
+        # Returns how many of the records were already stored
+        ids = [record['id'] for record in records]
+        known = {comment_id for (comment_id,) in db.query(Comment.id).filter(Comment.id.in_(ids))}
+        now = datetime.utcnow()
+        for record in records:
+            if record['id'] in known:
+                continue
+            db.add(Comment(
+                id=record['id'],
+                video_id=video_id,
+                text=record['text'],
+                author=record['author'],
+                like_count=record['like_count'] or 0,
+                published_at=parse_published_at(record['published_at']),
+                fetched_at=now,
+            ))
+        if known:
+            # Like counts move; refresh them for the overlap we paid for anyway
+            db.bulk_update_mappings(Comment, [
+                {'id': record['id'], 'like_count': record['like_count'] or 0}
+                for record in records if record['id'] in known
+            ])
+        # Make this page visible to the next page's lookup: new comments arriving
+        # mid-walk shift YouTube's pages, so the same comment can show up twice
+        db.flush()
+        self.comments_added += len(records) - len(known)
+        return len(known)
+
+    def _walk(self, db, video_id, page_token, budget, credentials, cache, stop_at_known, max_pages=None):
+        # Returns (comments stored, next page token or None once the thread is
+        # exhausted, and if the walk was cut off by max_pages, the publish time
+        # of the last comment it reached)
+        stored = 0
+        pages = 0
+        while True:
+            response = fetch_comment_page(video_id, page_token, COMMENT_PAGE_SIZE, "time", credentials, cache)
+            self.pages_fetched += 1
+            pages += 1
+            records = [comment_record(item) for item in response.get('items', [])]
+            known = self._store_page(db, video_id, records)
+            stored += len(records) - known
+            page_token = response.get('nextPageToken')
+            if not page_token or (stop_at_known and known) or (budget is not None and stored >= budget):
+                return stored, page_token, None
+            if max_pages is not None and pages >= max_pages:
+                return stored, page_token, parse_published_at(records[-1]['published_at'])
+
+    def sync(self, video_id, credentials=None, max_comments=MAX_COMMENTS, cache=None, viewer=None):
+        """Bring the stored comments for a video up to date. Returns the number added.
+
+        `viewer` identifies whose `credentials` these are (None: the API key).
+        `cache` only serves backfill pages: walks from the newest comment must
+        see what was posted since the last sync.
+        """
+        with self.session_factory() as db:
+            state = db.get(CommentSync, video_id)
+            now = datetime.utcnow()
+            fresh = (state is not None and state.synced_at + self.sync_interval > now
+                     and self._viewer_verified(video_id, viewer, now))
+            stored = None
+            if state is not None and state.backfill_page_token:
+                stored = db.query(Comment).filter(Comment.video_id == video_id).count()
+            wants_backfill = stored is not None and stored < max_comments
+            if fresh and not wants_backfill:
+                return 0
+
+            added = 0
+            try:
+                if state is None:
+                    state = CommentSync(video_id=video_id, synced_at=now, complete=False)
+                    db.add(state)
+                    added, state.backfill_page_token, _ = self._walk(db, video_id, None, max_comments,
+                                                                     credentials, None, stop_at_known=False)
+                else:
+                    if not fresh:
+                        # Every comment posted since the last sync, however many:
+                        # stopping early would leave them out for good
+                        added, page_token, cut_off_at = self._walk(db, video_id, None, None, credentials, None,
+                                                                   stop_at_known=True, max_pages=self.max_sync_pages)
+                        if cut_off_at is not None:
+                            # Too many to reach the stored comments: drop those and
+                            # resync the older part by backfill, so nothing in
+                            # between is skipped
+                            logger.warning(f"Comment sync for {video_id} stopped after {self.max_sync_pages} pages "
+                                           f"of new comments; resyncing older comments")
+                            db.query(Comment).filter(Comment.video_id == video_id,
+                                                     Comment.published_at < cut_off_at).delete()
+                            state.backfill_page_token = page_token
+                            stored = 0
+                            wants_backfill = True
+                    if wants_backfill and max_comments - stored - added > 0:
+                        # Older comments beyond what the first sync fetched
+                        try:
+                            more, state.backfill_page_token, _ = self._walk(
+                                db, video_id, state.backfill_page_token, max_comments - stored - added,
+                                credentials, cache, stop_at_known=False)
+                            added += more
+                        except HttpError as e:
+                            # Page tokens do not live forever; give up on the backfill
+                            logger.warning(f"Comment backfill for {video_id} failed: {e}")
+                            state.backfill_page_token = None
+                state.complete = state.backfill_page_token is None
+                state.synced_at = now
+                db.commit()
+                self._mark_verified(video_id, viewer, now)
+            except IntegrityError:
+                # Another worker synced the same video concurrently; its rows are as good as ours
+                db.rollback()
+                logger.info(f"Concurrent comment sync for {video_id}, using the other worker's result")
+                self._mark_verified(video_id, viewer, now)  # YouTube served our pages before the conflict
+                return 0
+            return added
+
+    def recent(self, video_id, limit=MAX_COMMENTS):
+        with self.session_factory() as db:
+            comments = (db.query(Comment)
+                        .filter(Comment.video_id == video_id)
+                        .order_by(Comment.published_at.desc())
+                        .limit(limit)
+                        .all())
+            return [_to_record(comment) for comment in comments]
+
+    def comments(self, video_id, credentials=None, max_comments=MAX_COMMENTS, cache=None, viewer=None):
+        self.sync(video_id, credentials, max_comments, cache, viewer)
+        return self.recent(video_id, max_comments)
+
+    def stats(self):
+        return {"pages_fetched": self.pages_fetched, "comments_added": self.comments_added}
@@ -0,0 +1,19 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Blocking client libraries (googleapiclient, google-auth, openai) run here so
+# they never stall the event loop. The pool is bounded so a burst of slow
+# upstream calls queues up instead of spawning unbounded threads.
+BLOCKING_IO_WORKERS = int(os.environ.get("BLOCKING_IO_WORKERS", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io")
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry the caller's contextvars (e.g. usage.usage_scope) into the thread,
+    # as asyncio.to_thread does
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
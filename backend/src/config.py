@@ -2,15 +2,39 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-# Environment variables
-YOUTUBE_API_KEY = os.environ['YOUTUBE_API_KEY']
-YOUTUBE_API_SERVICE_NAME = os.environ['YOUTUBE_API_SERVICE_NAME']
-YOUTUBE_API_VERSION = os.environ['YOUTUBE_API_VERSION']
-
-#Google
-GOOGLE_CLIENT_ID = os.environ['GOOGLE_CLIENT_ID']
-GOOGLE_CLIENT_SECRET= os.environ['GOOGLE_CLIENT_SECRET']
-GOOGLE_REDIRECT_URI= os.environ['GOOGLE_REDIRECT_URI']
-SESSION_SECRET_KEY= os.environ['SESSION_SECRET_KEY']
-
-OPENAI_API_KEY = os.environ['OPENAI_API_KEY']
+# Required environment variables. They are read on first use (config.NAME)
+# rather than at import, so a worker boots without them and /ready reports
+# what is missing instead of the import failing.
+REQUIRED = (
+    'YOUTUBE_API_KEY',
+    'YOUTUBE_API_SERVICE_NAME',
+    'YOUTUBE_API_VERSION',
+    #Google
+    'GOOGLE_CLIENT_ID',
+    'GOOGLE_CLIENT_SECRET',
+    'GOOGLE_REDIRECT_URI',
+    'SESSION_SECRET_KEY',
+    'OPENAI_API_KEY',
+)
+
+# Optional overrides, used to point the app at local stand-in servers
+GOOGLE_API_ENDPOINT = os.environ.get('GOOGLE_API_ENDPOINT')
+GOOGLE_AUTH_URI = os.environ.get('GOOGLE_AUTH_URI', 'https://accounts.google.com/o/oauth2/auth')
+GOOGLE_TOKEN_URI = os.environ.get('GOOGLE_TOKEN_URI', 'https://oauth2.googleapis.com/token')
+
+
+class MissingSetting(RuntimeError):
+    pass
+
+
+def missing_settings():
+    return [name for name in REQUIRED if name not in os.environ]
+
+
+def __getattr__(name):
+    if name in REQUIRED:
+        try:
+            return os.environ[name]
+        except KeyError:
+            raise MissingSetting(f"Environment variable {name} is not set") from None
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
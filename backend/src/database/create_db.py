@@ -1,5 +1,5 @@
 from .database import Base, engine
-from .models import User, ChannelInfo
+from .models import User, Comment, CommentSync, AISummary, OpenAIUsage
 
 # Create all tables
 Base.metadata.create_all(bind=engine)
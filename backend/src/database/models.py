@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP
+from sqlalchemy import Boolean, Column, Index, Integer, String, Text, TIMESTAMP, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -11,8 +11,81 @@ class User(Base):
     name = Column(String(255), nullable=False)
     email = Column(String(255), unique=True, nullable=False)
     channel_id = Column(String(255), unique=True, nullable=False)
+    uploads_playlist_id = Column(String(255))
     access_token = Column(Text, nullable=False)
+    # sha256 of access_token; the indexed column used to authenticate requests
+    access_token_hash = Column(String(64), unique=True, index=True)
+    # Hash of the token replaced by the last refresh, still accepted until the next one
+    previous_access_token_hash = Column(String(64), index=True)
     refresh_token = Column(Text, nullable=False)
     token_expiry = Column(TIMESTAMP, nullable=False)
     created_at = Column(TIMESTAMP, default=datetime.utcnow)
-    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Comment(Base):
+    __tablename__ = "comments"
+
+    # YouTube's comment thread id
+    id = Column(String(128), primary_key=True)
+    video_id = Column(String(64), nullable=False)
+    text = Column(Text, nullable=False)
+    author = Column(String(255))
+    like_count = Column(Integer, default=0)
+    published_at = Column(TIMESTAMP, nullable=False)
+    fetched_at = Column(TIMESTAMP, default=datetime.utcnow)
+
+    # Newest-first reads per video
+    __table_args__ = (Index("ix_comments_video_id_published_at", "video_id", "published_at"),)
+
+
+class CommentSync(Base):
+    __tablename__ = "comment_syncs"
+
+    video_id = Column(String(64), primary_key=True)
+    synced_at = Column(TIMESTAMP, nullable=False)
+    # The first sync stops at max_comments; this is where to resume the
+    # backfill of older comments if a later request asks for more
+    backfill_page_token = Column(Text)
+    complete = Column(Boolean, default=False, nullable=False)
+
+
+class AISummary(Base):
+    __tablename__ = "ai_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(String(64), nullable=False)
+    # sha256 of the normalized prompt
+    prompt_hash = Column(String(64), nullable=False)
+    model = Column(String(64), nullable=False)
+    summary = Column(Text, nullable=False)
+    # published_at of the newest comment folded into the summary; newer
+    # comments are the delta for the next update
+    watermark = Column(TIMESTAMP, nullable=False)
+    comments_at_rebuild = Column(Integer, nullable=False)
+    comments_since_rebuild = Column(Integer, default=0, nullable=False)
+    merges_since_rebuild = Column(Integer, default=0, nullable=False)
+    rebuilt_at = Column(TIMESTAMP, default=datetime.utcnow)
+    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (UniqueConstraint("video_id", "prompt_hash", name="uq_ai_summaries_video_prompt"),)
+
+
+class OpenAIUsage(Base):
+    __tablename__ = "openai_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Null for calls made outside a user's request, e.g. at warm-up
+    user_email = Column(String(255))
+    video_id = Column(String(64))
+    model = Column(String(64), nullable=False)
+    kind = Column(String(16), nullable=False)  # completion, embedding
+    prompt_tokens = Column(Integer, nullable=False)
+    completion_tokens = Column(Integer, nullable=False)
+    latency_ms = Column(Integer, nullable=False)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_openai_usage_user_email_created_at", "user_email", "created_at"),
+        Index("ix_openai_usage_video_id_created_at", "video_id", "created_at"),
+    )
@@ -1,7 +1,7 @@
 from sqlalchemy import create_engine, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from .models import User, Video, Comment, AISummary  # Import your models
+from .models import User, Comment, CommentSync, AISummary, OpenAIUsage  # Import your models
 from .database import Base, engine  # Import Base and engine from your database setup
 from .database import DATABASE_URL  # Ensure your database URL is available
 
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from analytics import STOPWORDS
+from lazy_imports import lazy_import
+from open_ai import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL, embed
+from preprocess import clean_text, words
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+np = lazy_import("numpy")
+
+# "openai" embeds with EMBEDDING_MODEL; "hashing" is local and needs no
+# network (it matches shared words rather than meaning)
+EMBEDDER = os.environ.get("EMBEDDER", "openai")
+EMBEDDING_INDEX_DIR = os.environ.get("EMBEDDING_INDEX_DIR", "embedding_index")
+SEARCH_RESULTS = 20
+# Comments a focused summary is built from, when the video has more
+RELEVANT_COMMENTS = int(os.environ.get("RELEVANT_COMMENTS", "200"))
+MAX_OPEN_INDEXES = 64
+
+_SAFE_NAME = re.compile(r"[\w-]{1,64}")
+
+
+class OpenAIEmbedder:
+    remote = True
+
+    def __init__(self, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS):
+        self.name = model
+        self.dimensions = dimensions
+
+    def __call__(self, texts):
+        return np.asarray(embed(texts, self.name, self.dimensions), dtype=np.float32)
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words and word pairs.
+
+    Deterministic and local: used without an API key and as the stub in
+    benchmarks. Finds comments that share vocabulary with the query, not
+    ones that mean the same in other words.
+    """
+
+    remote = False
+    name = "hashing"
+
+    def __init__(self, dimensions=EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def __call__(self, texts):
+        rows, columns, signs = [], [], []
+        for row, text in enumerate(texts):
+            tokens = [token for token in words(text) if token not in STOPWORDS]
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+                rows.append(row)
+                columns.append(h % self.dimensions)
+                signs.append(1.0 if h >> 63 else -1.0)
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(matrix, (rows, columns), signs)
+        return matrix
+
+
+def make_embedder(kind=EMBEDDER):
+    if kind == "openai":
+        return OpenAIEmbedder()
+    if kind == "hashing":
+        return HashingEmbedder()
+    raise ValueError(f"Unsupported EMBEDDER: {kind}")
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+class _FileLock:
+    # Exclusive lock between processes (flock) and between threads of one process
+    _thread_locks = {}
+    _guard = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        with self._guard:
+            self.thread_lock = self._thread_locks.setdefault(path, threading.Lock())
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        self.file = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+        self.thread_lock.release()
+
+
+class VectorIndex:
+    """Unit-length float32 embeddings of one video's comments, on disk.
+
+    <name>.f32 holds the rows back to back, <name>.ids the comment id of
+    each row, one per line, and <name>.json which embedder wrote them. Rows
+    are only appended. Searches read the matrix through np.memmap, so the
+    page cache rather than each worker process holds it. Appends take a
+    file lock, so workers on one host can share the directory.
+    """
+
+    def __init__(self, directory, video_id, embedder_name, dimensions):
+        name = video_id if _SAFE_NAME.fullmatch(video_id) else hashlib.sha256(video_id.encode()).hexdigest()
+        base = os.path.join(directory, name)
+        self.vectors_path, self.ids_path, self.meta_path = f"{base}.f32", f"{base}.ids", f"{base}.json"
+        self.lock_path = f"{base}.lock"
+        self.meta = {"embedder": embedder_name, "dimensions": dimensions}
+        self.dimensions = dimensions
+        self.ids = []
+        self.rows = {}  # comment id -> row
+        self._ids_size = 0
+        self._matrix = None
+        self._refresh_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            self._check_meta()
+        self.refresh()
+
+    def _locked(self):
+        return _FileLock(self.lock_path)
+
+    def _check_meta(self):
+        try:
+            with open(self.meta_path) as f:
+                if json.load(f) == self.meta:
+                    return
+        except (OSError, ValueError):
+            pass
+        # New video, or vectors from another embedder or width: start over
+        for path in (self.vectors_path, self.ids_path):
+            if os.path.exists(path):
+                os.remove(path)
+        with open(self.meta_path, "w") as f:
+            json.dump(self.meta, f)
+
+    def refresh(self):
+        # Pick up rows appended since the last read, by this or another worker
+        try:
+            size = os.path.getsize(self.ids_path)
+        except OSError:
+            size = 0
+        if size == self._ids_size:
+            return
+        with self._refresh_lock:
+            with open(self.ids_path, "rb") as f:
+                f.seek(self._ids_size)
+                data = f.read()
+            # A partial last line is an append in progress; read it next time
+            complete = data[:data.rfind(b"\n") + 1]
+            for comment_id in complete.decode().splitlines():
+                self.rows[comment_id] = len(self.ids)
+                self.ids.append(comment_id)
+            self._ids_size += len(complete)
+            self._matrix = None
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            if self.ids:
+                self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                         shape=(len(self.ids), self.dimensions))
+            else:
+                self._matrix = np.zeros((0, self.dimensions), dtype=np.float32)
+        return self._matrix
+
+    def __len__(self):
+        return len(self.ids)
+
+    def missing(self, ids):
+        return [comment_id for comment_id in ids if comment_id not in self.rows]
+
+    def add(self, ids, vectors):
+        vectors = _normalize(vectors)
+        with self._locked():
+            self.refresh()
+            keep = [i for i, comment_id in enumerate(ids) if comment_id not in self.rows]
+            if not keep:
+                return 0
+            row_bytes = 4 * self.dimensions
+            with open(self.vectors_path, "ab") as f:
+                # Drop vectors a crashed append wrote without their ids
+                f.truncate(len(self.ids) * row_bytes)
+                f.write(vectors[keep].tobytes())
+            with open(self.ids_path, "a") as f:
+                f.write("".join(f"{ids[i]}\n" for i in keep))
+            self.refresh()
+        return len(keep)
+
+    def search(self, query_vector, k, ids=None):
+        # Top k (comment id, cosine similarity), best first, optionally among `ids` only
+        self.refresh()
+        matrix = self.matrix
+        rows = None
+        if ids is not None:
+            rows = np.fromiter((self.rows[i] for i in ids if i in self.rows), dtype=np.int64)
+            matrix = matrix[rows]
+        if not len(matrix):
+            return []
+        scores = matrix @ _normalize(query_vector)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[rows[i] if rows is not None else i], float(scores[i])) for i in top]
+
+
+class EmbeddingIndex:
+    """Comment vector indexes per video, embedded incrementally.
+
+    Only comments not yet in a video's index are sent to the embedder, so
+    re-querying an active video costs one small batch at most. Blocking;
+    call through run_blocking.
+    """
+
+    def __init__(self, embedder=None, directory=EMBEDDING_INDEX_DIR, max_open=MAX_OPEN_INDEXES):
+        self.embedder = embedder or make_embedder()
+        self.directory = directory
+        self.max_open = max_open
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self.embedded = 0
+        self.queries = 0
+
+    def index(self, video_id):
+        with self._lock:
+            index = self._indexes.get(video_id)
+            if index is not None:
+                self._indexes.move_to_end(video_id)
+                return index
+        index = VectorIndex(self.directory, video_id, self.embedder.name, self.embedder.dimensions)
+        with self._lock:
+            self._indexes[video_id] = index
+            while len(self._indexes) > self.max_open:
+                self._indexes.popitem(last=False)
+        return index
+
+    def update(self, video_id, records):
+        """Embed the records not yet indexed. Returns how many were added."""
+        index = self.index(video_id)
+        index.refresh()
+        missing = set(index.missing([record['id'] for record in records]))
+        new = [record for record in records if record['id'] in missing]
+        if not new:
+            return 0
+        # The embeddings API rejects empty input
+        vectors = self.embedder([clean_text(record['text']) or "-" for record in new])
+        added = index.add([record['id'] for record in new], vectors)
+        self.embedded += added
+        return added
+
+    def search(self, video_id, query, records, k=SEARCH_RESULTS):
+        """The k records most similar to `query`, best first, each with its score."""
+        self.update(video_id, records)
+        self.queries += 1
+        by_id = {record['id']: record for record in records}
+        hits = self.index(video_id).search(self.embedder([query])[0], k, ids=list(by_id))
+        return [{**by_id[comment_id], "score": round(score, 4)} for comment_id, score in hits]
+
+    def relevant(self, video_id, query, records, k=RELEVANT_COMMENTS):
+        # The k records closest to the query, in their original order
+        if len(records) <= k:
+            return records
+        keep = {hit['id'] for hit in self.search(video_id, query, records, k)}
+        return [record for record in records if record['id'] in keep]
+
+    def stats(self):
+        return {"open_indexes": len(self._indexes), "embedded": self.embedded, "queries": self.queries}
@@ -0,0 +1,25 @@
+# Production entry point: several uvicorn workers under gunicorn.
+#
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# Workers share state through the users table (sessions), SHARED_STATE_URL
+# (OAuth state, YouTube response caches, job progress) and the summary cache
+# file, so SHARED_STATE_URL must not be memory:// with more than one worker.
+import multiprocessing
+import os
+
+workers = int(os.environ.get("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+# rate_limit.py splits the configured limits between workers
+os.environ["WEB_CONCURRENCY"] = str(workers)
+if workers > 1:
+    os.environ.setdefault("SHARED_STATE_URL", "sqlite:///shared_state.db")
+
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+# Each worker builds its own thread pools, HTTP clients and DB engine after
+# the fork; none of them survive being inherited from a preloaded parent
+preload_app = False
+# Summaries can stream for a while
+timeout = int(os.environ.get("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import math
+import os
+import time
+import uuid
+
+from concurrency import run_blocking
+from rate_limit import KeyedBuckets, RateLimited
+
+logger = logging.getLogger(__name__)
+
+# Videos summarized at the same time across all jobs in this process
+JOB_WORKERS = int(os.environ.get("SUMMARY_JOB_WORKERS", "4"))
+MAX_VIDEOS_PER_JOB = int(os.environ.get("SUMMARY_JOB_MAX_VIDEOS", "500"))
+# Queued or running jobs one user may have in this process
+MAX_ACTIVE_JOBS_PER_USER = int(os.environ.get("SUMMARY_JOB_MAX_ACTIVE", "3"))
+# Per-user YouTube quota budget for bulk jobs, in API units
+JOB_QUOTA_PER_MINUTE = float(os.environ.get("SUMMARY_JOB_QUOTA_PER_MINUTE", "120"))
+JOB_QUOTA_BURST = float(os.environ.get("SUMMARY_JOB_QUOTA_BURST", "200"))
+# Share of the project-wide YouTube bucket that jobs leave to interactive
+# requests: a video is only started while the bucket holds more than this
+JOB_UPSTREAM_RESERVE = float(os.environ.get("SUMMARY_JOB_UPSTREAM_RESERVE", "0.5"))
+JOB_RETENTION = int(os.environ.get("SUMMARY_JOB_RETENTION", "3600"))  # seconds after a job finishes
+# Progress is published for other workers at most this often while a job runs
+JOB_PUBLISH_INTERVAL = 1.0  # seconds
+JOB_ACTIVE_RETRY_AFTER = 30.0  # seconds suggested to a user at MAX_ACTIVE_JOBS_PER_USER
+
+
+class Job:
+    def __init__(self, owner, video_ids, prompt, max_comments):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.video_ids = video_ids
+        self.prompt = prompt
+        self.max_comments = max_comments
+        self.status = "queued"
+        self.results = {}  # video_id -> {"summary": ...} or {"error": ...}
+        self.created_at = time.time()
+        self.finished_at = None
+        self.task = None
+        self.published_at = 0.0
+
+    def to_dict(self, include_results=True):
+        failed = sum(1 for r in self.results.values() if "error" in r)
+        job = {
+            "job_id": self.id,
+            "status": self.status,
+            "total": len(self.video_ids),
+            "completed": len(self.results) - failed,
+            "failed": failed,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if include_results:
+            job["results"] = self.results
+        return job
+
+
+class JobManager:
+    """Runs multi-video summary jobs in the background.
+
+    All jobs share one pool of JOB_WORKERS slots, and each user's jobs draw
+    from that user's YouTube quota bucket, so a large back catalogue is
+    spread out instead of exhausting the project quota in one burst. Jobs
+    also stay out of the last JOB_UPSTREAM_RESERVE of the project bucket,
+    which is kept for interactive requests.
+
+    With a shared `state`, job progress is published there so a poll or
+    cancel that lands on another worker process still finds the job.
+    """
+
+    def __init__(self, summarize_video, workers=JOB_WORKERS, quota_per_minute=JOB_QUOTA_PER_MINUTE,
+                 quota_burst=JOB_QUOTA_BURST, upstream_quota=None, upstream_reserve=JOB_UPSTREAM_RESERVE,
+                 state=None, max_active_per_user=MAX_ACTIVE_JOBS_PER_USER):
+        self.summarize_video = summarize_video
+        self.state = state
+        # Project-wide YouTube bucket shared with interactive requests
+        self.upstream_quota = upstream_quota
+        self.upstream_reserve = upstream_reserve
+        self.workers = workers
+        self.max_active_per_user = max_active_per_user
+        self.quota = KeyedBuckets(quota_per_minute / 60, quota_burst)
+        self._slots = None
+        self._jobs = {}
+
+    def _expire(self):
+        cutoff = time.time() - JOB_RETENTION
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                del self._jobs[job_id]
+
+    def submit(self, user_data, video_ids, prompt, max_comments):
+        self._expire()
+        active = sum(1 for job in self._jobs.values()
+                     if job.owner == user_data.email and job.status in ("queued", "running"))
+        if active >= self.max_active_per_user:
+            raise RateLimited("jobs", JOB_ACTIVE_RETRY_AFTER)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        job = Job(user_data.email, list(dict.fromkeys(video_ids)), prompt, max_comments)
+        self._jobs[job.id] = job
+        job.task = asyncio.get_running_loop().create_task(self._run(job, user_data))
+        return job
+
+    def get(self, job_id, owner):
+        job = self._jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    async def snapshot(self, job_id, owner, include_results=True):
+        # The job as a dict, whichever worker is running it
+        job = self.get(job_id, owner)
+        if job is not None:
+            return job.to_dict(include_results)
+        if self.state is None:
+            return None
+        published = await run_blocking(self.state.get, f"job:{job_id}")
+        if published is None or published.pop("owner") != owner:
+            return None
+        if not include_results:
+            published.pop("results", None)
+        return published
+
+    async def cancel(self, job_id, owner):
+        job = self.get(job_id, owner)
+        if job is not None:
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+            return job.to_dict(include_results=False)
+        snapshot = await self.snapshot(job_id, owner, include_results=False)
+        if snapshot is not None and snapshot["status"] in ("queued", "running"):
+            # The worker running the job checks for this before each video
+            await run_blocking(self.state.set, f"job-cancel:{job_id}", True, JOB_RETENTION)
+        return snapshot
+
+    async def _publish(self, job, force=False):
+        if self.state is None:
+            return
+        now = time.monotonic()
+        if not force and now - job.published_at < JOB_PUBLISH_INTERVAL:
+            return
+        job.published_at = now
+        await run_blocking(self.state.set, f"job:{job.id}", {"owner": job.owner, **job.to_dict()}, JOB_RETENTION)
+
+    async def _cancel_requested(self, job):
+        return self.state is not None and await run_blocking(self.state.get, f"job-cancel:{job.id}") is not None
+
+    async def _run(self, job, user_data):
+        job.status = "running"
+        # One comment page (1 unit) per 100 comments, plus slack for the cache revalidation
+        cost = math.ceil(job.max_comments / 100) + 1
+        bucket = self.quota.get(job.owner)
+
+        async def one(video_id):
+            await bucket.acquire(cost)
+            async with self._slots:
+                if self.upstream_quota is not None:
+                    # youtube.execute charges the units actually spent; wait
+                    # until the bucket could cover a full video above the
+                    # reserve. Overshoot is bounded by one video per slot.
+                    reserve = self.upstream_quota.capacity * self.upstream_reserve
+                    await self.upstream_quota.wait_for(reserve + cost)
+                if await self._cancel_requested(job):
+                    job.task.cancel()
+                    return
+                try:
+                    while True:
+                        try:
+                            summary = await self.summarize_video(user_data, video_id, job.prompt, job.max_comments)
+                            break
+                        except RateLimited as e:
+                            # Background work yields to interactive requests
+                            # rather than failing the video
+                            await asyncio.sleep(e.retry_after)
+                    job.results[video_id] = {"summary": summary}
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Job {job.id}: summarizing {video_id} failed: {e}")
+                    job.results[video_id] = {"error": str(e)}
+                await self._publish(job)
+
+        try:
+            await self._publish(job, force=True)
+            await asyncio.gather(*(one(video_id) for video_id in job.video_ids))
+            job.status = "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        finally:
+            job.finished_at = time.time()
+            await asyncio.shield(self._publish(job, force=True))
@@ -0,0 +1,44 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """Stands in for a module and imports it when an attribute is first read.
+
+    For the heavy client libraries (openai, googleapiclient.discovery,
+    google-auth transports): a worker can boot and take traffic without
+    paying for them up front, and the warm-up hook loads them off the
+    request path. Usage reads like the plain import:
+
+        openai = lazy_import("openai")
+        ...
+        except openai.APIError:
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            # The first use can come from several request threads at once
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
@@ -1,33 +1,48 @@
 from fastapi import FastAPI, Depends, HTTPException, Request
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request as GoogleRequest
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from oauthlib.oauth2.rfc6749.errors import OAuth2Error
-from requests_oauthlib.oauth2_session import OAuth2Session
 import os
-from pydantic import BaseModel
-from typing import List
-from datetime import datetime
-#Open AI
-import openai
-from openai import OpenAI
-from open_ai import summarize_comments as openai_summarize_comments
-# Load environment variables
-from config import (
-    YOUTUBE_API_KEY,
-    YOUTUBE_API_SERVICE_NAME,
-    YOUTUBE_API_VERSION,
-    SESSION_SECRET_KEY,
-    GOOGLE_REDIRECT_URI,
-    GOOGLE_CLIENT_SECRET,
-    GOOGLE_CLIENT_ID,
-    OPENAI_API_KEY
-)
+import json
+import secrets
+import logging
+import time
+from typing import Optional
+from pydantic import BaseModel, Field, conint, constr
+from datetime import datetime, timedelta
+from open_ai import (complete as openai_complete, MODEL_PARAMS, build_final_prompt, stream_completion,
+                     get_client as openai_client, get_async_client as openai_async_client, set_completion_gate)
+from sessions import SessionStore, UserData
+from token_refresh import TokenRefresher
+from jobs import JobManager, MAX_VIDEOS_PER_JOB
+from youtube import (get_service, preload as preload_youtube, execute, iter_video_comments, list_channel_videos,
+                     set_quota_meter, uploads_playlist_id, MAX_COMMENTS, VIDEO_PAGE_SIZE)
+from cache import video_cache, comment_cache
+from summary_cache import summary_cache, summary_key
+from comment_store import CommentStore
+from summary_updates import SummaryStore, INCREMENTAL_SUMMARIES
+from analytics import (ANALYTICS_MODE, analyze_comments, context_block, local_answer, local_question,
+                       np as analytics_numpy)
+from embeddings import EmbeddingIndex, RELEVANT_COMMENTS, SEARCH_RESULTS
+from preprocess import preprocess_comments
+from usage import GROUP_BY as USAGE_GROUP_BY, USAGE_ADMINS, bind_usage_scope, usage_log, usage_scope
+from concurrency import run_blocking
+from shared_state import shared_state
+from rate_limit import AdmissionControl, RateLimited
+from metrics import registry, Gauge, LatencyMiddleware
+from lazy_imports import lazy_import
+from warmup import WarmUp
+# Environment variables, read on use
+import config
+
+# Imported on first use or by the warm-up hook (see warmup.py)
+openai = lazy_import("openai")
+oauth_flow = lazy_import("google_auth_oauthlib.flow")
+google_credentials = lazy_import("google.oauth2.credentials")
+google_requests = lazy_import("google.auth.transport.requests")
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -37,8 +52,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Access-Token"],
 )
-app.add_middleware(SessionMiddleware, secret_key=SESSION_SECRET_KEY)
+# A missing secret is reported by /ready rather than failing the import
+app.add_middleware(SessionMiddleware, secret_key=os.environ.get("SESSION_SECRET_KEY") or secrets.token_urlsafe(32))
+# Per-route latency histograms, exported on /metrics
+app.add_middleware(LatencyMiddleware)
 
 os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"  # Allow HTTP traffic for local dev
 
@@ -50,155 +69,349 @@ SCOPES = [
     "openid"
 ]
 
-flow = Flow.from_client_config(
-    client_config={
+OAUTH_STATE_TTL = 600  # seconds the user has to finish signing in with Google
+
+def client_config():
+    return {
         "web": {
-            "client_id": GOOGLE_CLIENT_ID,
-            "client_secret": GOOGLE_CLIENT_SECRET,
-            "redirect_uris": [GOOGLE_REDIRECT_URI],
-            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-            "token_uri": "https://oauth2.googleapis.com/token"
+            "client_id": config.GOOGLE_CLIENT_ID,
+            "client_secret": config.GOOGLE_CLIENT_SECRET,
+            "redirect_uris": [config.GOOGLE_REDIRECT_URI],
+            "auth_uri": config.GOOGLE_AUTH_URI,
+            "token_uri": config.GOOGLE_TOKEN_URI
         }
-    },
-    scopes=SCOPES,
-    redirect_uri=GOOGLE_REDIRECT_URI
-)
+    }
+
+def make_flow(state=None, code_verifier=None):
+    # A Flow per sign-in: the login and the callback can be served by
+    # different workers, which share only what is in shared_state
+    flow = oauth_flow.Flow.from_client_config(client_config=client_config(), scopes=SCOPES,
+                                              redirect_uri=config.GOOGLE_REDIRECT_URI, state=state)
+    flow.code_verifier = code_verifier  # PKCE
+    return flow
+
+session_store = SessionStore()
+admission = AdmissionControl()
+# YouTube quota is charged per request actually sent, cache hits cost nothing
+set_quota_meter(admission.youtube)
+# Each completion, including every map and reduce call of one summary, takes
+# its own OpenAI slot and request token
+set_completion_gate(admission.openai_slot)
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": exc.retry_after_header})
+
+def checked_max_comments(max_comments):
+    # Capped, so one request cannot walk more comment pages than it is charged for
+    if isinstance(max_comments, bool) or not isinstance(max_comments, int) or max_comments < 1:
+        raise HTTPException(status_code=400, detail="max_comments must be a positive integer")
+    return min(max_comments, MAX_COMMENTS)
+
+def get_bearer_token(request: Request):
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid or missing token")
+    return auth_header.split(" ")[1]
 
-class UserData(BaseModel):
-    name: str
-    email: str
-    channel_id: str
-    access_token: str
-    refresh_token: str
-    token_expiry: datetime
+async def get_current_user(request: Request, token: str = Depends(get_bearer_token)):
+    # Cache hits stay on the event loop; only misses go to the database
+    user_data = session_store.get_cached(token) or await run_blocking(session_store.get_by_token, token)
+    if not user_data:
+        raise HTTPException(status_code=401, detail="Invalid token")
 
-user_data_store = {}  # In-memory storage, replace with a database in production
+    if token_refresher.is_expired(user_data):
+        # A session that was idle through its expiry: renew it now instead of
+        # letting the upstream call fail with a 401
+        try:
+            await token_refresher.refresh(user_data)
+        except Exception as e:
+            logger.warning(f"Token refresh failed for {user_data.email}: {e}")
+    elif token_refresher.needs_refresh(user_data):
+        token_refresher.schedule(user_data)
+
+    if user_data.access_token != token:
+        # The token was renewed in the background; hand the new one to the client
+        request.state.refreshed_access_token = user_data.access_token
+    return user_data
+
+@app.middleware("http")
+async def send_refreshed_token(request: Request, call_next):
+    response = await call_next(request)
+    refreshed = getattr(request.state, "refreshed_access_token", None)
+    if refreshed:
+        response.headers["X-Access-Token"] = refreshed
+    return response
 
 @app.get("/auth/login")
 def login_with_google():
+    code_verifier = secrets.token_urlsafe(64)
+    flow = make_flow(code_verifier=code_verifier)
     authorization_url, state = flow.authorization_url(access_type="offline", include_granted_scopes="true")
+    shared_state.set(f"oauth:{state}", {"code_verifier": code_verifier}, OAUTH_STATE_TTL)
     return RedirectResponse(authorization_url)
 
 @app.get("/auth/callback")
-async def auth_callback(code: str):
-    flow.fetch_token(code=code)
+async def auth_callback(code: str, state: Optional[str] = None):
+    # One-time use: a replayed or forged callback finds nothing
+    pending = await run_blocking(shared_state.pop, f"oauth:{state}") if state else None
+    if pending is None:
+        raise HTTPException(status_code=400, detail="Invalid or expired sign-in state")
+    flow = make_flow(state=state, code_verifier=pending["code_verifier"])
+    await run_blocking(flow.fetch_token, code=code)
     credentials = flow.credentials
 
-    user_info_service = build("oauth2", "v2", credentials=credentials)
-    user_info = user_info_service.userinfo().get().execute()
+    user_info = await run_blocking(execute, get_service("oauth2", "v2").userinfo().get(), credentials, units=0)
 
     email = user_info["email"]
     name = user_info["name"]
 
-    youtube_service = build("youtube", "v3", credentials=credentials)
-    channel_response = youtube_service.channels().list(mine=True, part="snippet,contentDetails").execute()
+    channel_response = await run_blocking(
+        execute, get_service().channels().list(mine=True, part="snippet,contentDetails"), credentials
+    )
 
     if not channel_response.get("items"):
         raise HTTPException(status_code=404, detail="No YouTube channel found")
 
     channel_id = channel_response["items"][0]["id"]
+    uploads_playlist = channel_response["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
 
     user_data = UserData(
+        google_id=user_info["id"],
         name=name,
         email=email,
         channel_id=channel_id,
+        uploads_playlist_id=uploads_playlist,
         access_token=credentials.token,
         refresh_token=credentials.refresh_token,
-        token_expiry=credentials.expiry
+        token_expiry=credentials.expiry,
+        credentials=credentials
     )
-    user_data_store[email] = user_data
+    await run_blocking(session_store.add, user_data)
 
     redirect_url = f"http://localhost:5173/?name={name}&email={email}&channel_id={channel_id}&access_token={credentials.token}"
     return RedirectResponse(redirect_url)
 
 def refresh_access_token(refresh_token):
-    credentials = Credentials(
+    credentials = google_credentials.Credentials(
         token=None,
         refresh_token=refresh_token,
-        client_id=GOOGLE_CLIENT_ID,
-        client_secret=GOOGLE_CLIENT_SECRET,
-        token_uri="https://oauth2.googleapis.com/token"
+        client_id=config.GOOGLE_CLIENT_ID,
+        client_secret=config.GOOGLE_CLIENT_SECRET,
+        token_uri=config.GOOGLE_TOKEN_URI
     )        
 
     
-    credentials.refresh(GoogleRequest())
+    credentials.refresh(google_requests.Request())
     return credentials.token, credentials.expiry
 
-@app.post("/api/refresh_token")
-async def refresh_token(request: Request):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid or missing token")
-    
-    old_token = auth_header.split(" ")[1]
-    user_data = next((u for u in user_data_store.values() if u.access_token == old_token), None)
-    
-    if not user_data:
-        raise HTTPException(status_code=401, detail="Invalid token")
+token_refresher = TokenRefresher(session_store, refresh_access_token)
 
-    try:
-        new_access_token, expiry = refresh_access_token(user_data.refresh_token)
-        user_data.access_token = new_access_token
-        user_data.token_expiry = datetime.utcnow() + expiry
-        return JSONResponse(content={"access_token": new_access_token})
-    except Exception as e:
-        raise HTTPException(status_code=400, detail="Token refresh failed")
+@app.on_event("startup")
+async def start_token_refresher():
+    token_refresher.start()
+    usage_log.start()
 
-@app.get("/api/videos")
-async def get_videos(request: Request):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid or missing token")
-    
-    token = auth_header.split(" ")[1]
-    user_data = next((u for u in user_data_store.values() if u.access_token == token), None)
-    
-    if not user_data:
-        raise HTTPException(status_code=401, detail="Invalid token")
+warm_up = WarmUp()
 
-    try:
-        credentials = Credentials(
+@warm_up.step("config")
+def check_config():
+    missing = config.missing_settings()
+    if missing:
+        raise config.MissingSetting(f"Missing environment variables: {', '.join(missing)}")
+
+@warm_up.step("google_auth")
+def load_google_auth():
+    # Reading an attribute imports the module
+    oauth_flow.Flow, google_credentials.Credentials, google_requests.Request
+
+@warm_up.step("youtube")
+def build_youtube_client():
+    preload_youtube()
+
+@warm_up.step("analytics")
+def load_analytics():
+    analytics_numpy.ndarray
+
+@warm_up.step("openai")
+def build_openai_clients():
+    openai_client()
+    openai_async_client()
+
+@app.on_event("startup")
+async def start_warm_up():
+    await warm_up.on_startup()
+
+@app.get("/ready")
+async def ready():
+    if not warm_up.ready and not warm_up.running:
+        warm_up.start()  # retry the steps that failed
+    return JSONResponse(status_code=200 if warm_up.ready else 503, content=warm_up.status())
+
+@app.on_event("shutdown")
+async def stop_token_refresher():
+    await token_refresher.stop()
+    await usage_log.stop()  # writes the records still buffered
+
+@app.post("/api/refresh_token")
+async def refresh_token(token: str = Depends(get_bearer_token), user_data: UserData = Depends(get_current_user)):
+    # Usually the background refresher got there first and the current token
+    # can be handed out without calling Google
+    if user_data.access_token == token or token_refresher.needs_refresh(user_data):
+        try:
+            await token_refresher.refresh(user_data)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail="Token refresh failed")
+    return JSONResponse(content={"access_token": user_data.access_token})
+
+@app.get("/api/refresh_stats")
+async def refresh_stats():
+    return JSONResponse(content=token_refresher.stats())
+
+def user_credentials(user_data):
+    # One Credentials per session, rebuilt only after the token changes
+    credentials = user_data.credentials
+    if credentials is None or credentials.token != user_data.access_token:
+        credentials = google_credentials.Credentials(
             token=user_data.access_token,
             refresh_token=user_data.refresh_token,
-            client_id=GOOGLE_CLIENT_ID,
-            client_secret=GOOGLE_CLIENT_SECRET,
-            token_uri="https://oauth2.googleapis.com/token"
+            client_id=config.GOOGLE_CLIENT_ID,
+            client_secret=config.GOOGLE_CLIENT_SECRET,
+            token_uri=config.GOOGLE_TOKEN_URI
+        )
+        user_data.credentials = credentials
+    return credentials
+
+def fetch_comments(video_id, user_data, max_comments=MAX_COMMENTS):
+    # Cached per user, so a page one user may read is not served to another
+    return list(iter_video_comments(video_id, user_credentials(user_data), max_comments=max_comments,
+                                    prefetch=True, cache=comment_cache, viewer=user_data.email))
+
+comment_store = CommentStore()
+summary_store = SummaryStore()
+
+def fetch_comments_for_summary(video_id, user_data, max_comments=MAX_COMMENTS):
+    # Stored comments, topped up with only the threads posted since the last sync
+    return comment_store.comments(video_id, user_credentials(user_data), max_comments, cache=comment_cache,
+                                  viewer=user_data.email)
+
+embedding_index = EmbeddingIndex()
+
+async def embed_call(func, *args):
+    # Embedding new comments with the API counts as an OpenAI call
+    if embedding_index.embedder.remote:
+        async with admission.openai_call():
+            return await run_blocking(func, *args)
+    return await run_blocking(func, *args)
+
+async def focus_comments(video_id, prompt, comments):
+    # The comments closest to the prompt, when there are more than a summary needs
+    if len(comments) <= RELEVANT_COMMENTS:
+        return comments
+    return await embed_call(embedding_index.relevant, video_id, prompt, comments)
+
+def summary_cache_key(video_id, prompt, comments, incremental, analytics_context=False, focus=False):
+    # An incremental answer is worded differently from a full rebuild over
+    # the same comments, so the two are cached separately
+    params = {**MODEL_PARAMS, "incremental": incremental}
+    if analytics_context:
+        params["analytics_context"] = True
+    if focus:
+        params["focus"] = True
+    return summary_key(video_id, prompt, [comment['id'] for comment in comments], params)
+
+def with_context(final_prompt, context):
+    return f"{final_prompt}\n\n{context}" if context else final_prompt
+
+def answer_locally(prompt, comments, analytics_mode):
+    # (local answer or None, analytics context for the model prompt or None).
+    # Blocking (CPU); call through run_blocking.
+    if analytics_mode == "off":
+        return None, None
+    kinds = local_question(prompt)
+    if kinds is None and analytics_mode != "context":
+        return None, None
+    result = analyze_comments(comments)
+    if kinds is not None:
+        return local_answer(kinds, result), None
+    return None, context_block(result)
+
+def summarize_records(video_id, prompt, comments, incremental, context=None):
+    # Fold new comments into the stored summary, or rebuild it (preprocessed)
+    update = summary_store.plan(video_id, prompt, comments, incremental)
+    if update.summary is not None:
+        return update.summary
+    summary = openai_complete(with_context(update.final_prompt, context))
+    update.save(summary)
+    return summary
+
+def focused_prompt(prompt, comments, context=None):
+    # Built from the comments relevant to this prompt only, so it is not
+    # stored in ai_summaries: incremental updates assume the stored summary
+    # covers every comment
+    kept, stats = preprocess_comments(comments)
+    logger.info(f"Preprocessed {len(comments)} relevant comments: {stats}")
+    return with_context(build_final_prompt([c['text'] for c in kept], prompt), context)
+
+def summarize_focused(prompt, comments, context=None):
+    return openai_complete(focused_prompt(prompt, comments, context))
+
+async def summarize_video(user_data, video_id, prompt, max_comments=MAX_COMMENTS, incremental=INCREMENTAL_SUMMARIES,
+                          analytics_mode=ANALYTICS_MODE, focus=False):
+    with usage_scope(user_data.email, video_id):
+        return await _summarize_video(user_data, video_id, prompt, max_comments, incremental, analytics_mode, focus)
+
+async def _summarize_video(user_data, video_id, prompt, max_comments, incremental, analytics_mode, focus):
+    comments = await run_blocking(fetch_comments_for_summary, video_id, user_data, max_comments)
+    if not comments:
+        return "No comments found for this video."
+
+    # Sentiment and theme questions are answered from local analytics
+    answer, context = await run_blocking(answer_locally, prompt, comments, analytics_mode)
+    if answer is not None:
+        return answer
+
+    focused = focus and len(comments) > RELEVANT_COMMENTS
+    if focused:
+        comments = await focus_comments(video_id, prompt, comments)
+
+    # Reuse the summary if this exact question was already answered for the
+    # same set of comments
+    key = summary_cache_key(video_id, prompt, comments, incremental, context is not None, focused)
+
+    async def compute():
+        admission.check_openai()
+        if focused:
+            return await run_blocking(summarize_focused, prompt, comments, context)
+        return await run_blocking(summarize_records, video_id, prompt, comments, incremental, context)
+
+    return await summary_cache.get_or_compute(key, compute)
+
+summary_jobs = JobManager(summarize_video, upstream_quota=admission.youtube, state=shared_state)
+
+@app.get("/api/videos")
+async def get_videos(page_token: Optional[str] = None, page_size: int = 15,
+                     user_data: UserData = Depends(get_current_user)):
+    # playlistItems.list + videos.list
+    admission.admit("videos", user_data.email, youtube=True)
+    try:
+        credentials = user_credentials(user_data)
+
+        playlist_id = user_data.uploads_playlist_id or await run_blocking(
+            uploads_playlist_id, user_data.channel_id, credentials, video_cache
         )
+        page = await run_blocking(list_channel_videos, playlist_id, page_token, min(page_size, VIDEO_PAGE_SIZE),
+                                  credentials, video_cache)
 
-        youtube_service = build("youtube", "v3", credentials=credentials)
-        video_response = youtube_service.search().list(
-            part="snippet",
-            channelId=user_data.channel_id,
-            maxResults=15,
-            order="date",
-            type="video"
-        ).execute()
-
-        videos = [{
-            'title': item['snippet']['title'],
-            'videoId': item['id']['videoId'],
-            'thumbnail': item['snippet']['thumbnails']['high']['url'],
-            'description': item['snippet']['description']
-        } for item in video_response.get('items', [])]
-
-        return JSONResponse(content={"videos": videos})
+        return JSONResponse(content=page)
     except Exception as e:
         # If there's an error, it might be due to an expired token
         # The frontend will handle this and attempt a token refresh
         raise HTTPException(status_code=401, detail="Token may have expired")
 
 @app.get("/api/user")
-async def get_user_info(request: Request):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid or missing token")
-    
-    token = auth_header.split(" ")[1]
-    user_data = next((u for u in user_data_store.values() if u.access_token == token), None)
-    
-    if not user_data:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
+async def get_user_info(user_data: UserData = Depends(get_current_user)):
     return JSONResponse(content={
         "name": user_data.name,
         "email": user_data.email,
@@ -206,109 +419,281 @@ async def get_user_info(request: Request):
     })
 
 @app.get("/api/video/{video_id}/comments")
-async def get_video_comments(video_id: str, request: Request):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid or missing token")
-    
-    token = auth_header.split(" ")[1]
-    user_data = next((u for u in user_data_store.values() if u.access_token == token), None)
-    
-    if not user_data:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
+async def get_video_comments(video_id: str, max_comments: int = MAX_COMMENTS,
+                             user_data: UserData = Depends(get_current_user)):
+    max_comments = checked_max_comments(max_comments)
+    admission.admit("comments", user_data.email, youtube=True)
     try:
-        credentials = Credentials(
-            token=user_data.access_token,
-            refresh_token=user_data.refresh_token,
-            client_id=GOOGLE_CLIENT_ID,
-            client_secret=GOOGLE_CLIENT_SECRET,
-            token_uri="https://oauth2.googleapis.com/token"
-        )
-
-        youtube_service = build("youtube", "v3", credentials=credentials)
-        comments_response = youtube_service.commentThreads().list(
-            part="snippet",
-            videoId=video_id,
-            maxResults=40
-        ).execute()
-
-        comments = [item['snippet']['topLevelComment']['snippet']['textDisplay'] 
-                    for item in comments_response.get('items', [])]
+        comments = [comment['text'] for comment in
+                    await run_blocking(fetch_comments, video_id, user_data, max_comments)]
 
         return JSONResponse(content={"comments": comments})
     except Exception as e:
         raise HTTPException(status_code=400, detail="Failed to fetch comments")
 
 @app.post("/api/summarize_comments")
-async def summarize_comments(request: Request):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid or missing token")
-    
-    token = auth_header.split(" ")[1]
-    user_data = next((u for u in user_data_store.values() if u.access_token == token), None)
-    
-    if not user_data:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
+async def summarize_comments(request: Request, user_data: UserData = Depends(get_current_user)):
     body = await request.json()
     video_id = body.get("video_id")
     prompt = body.get("prompt")
+    max_comments = checked_max_comments(body.get("max_comments", MAX_COMMENTS))
+    incremental = body.get("incremental", INCREMENTAL_SUMMARIES)
+    analytics_mode = body.get("analytics", ANALYTICS_MODE)
+    focus = body.get("focus", False)
 
     if not video_id or not prompt:
         raise HTTPException(status_code=400, detail="Missing video_id or prompt")
+    admission.admit("summarize", user_data.email, youtube=True)
 
     try:
-        # Fetch comments
-        credentials = Credentials(
-            token=user_data.access_token,
-            refresh_token=user_data.refresh_token,
-            client_id=GOOGLE_CLIENT_ID,
-            client_secret=GOOGLE_CLIENT_SECRET,
-            token_uri="https://oauth2.googleapis.com/token"
-        )
+        summary = await summarize_video(user_data, video_id, prompt, max_comments, incremental, analytics_mode, focus)
+        return JSONResponse(content={"summary": summary})
+    except RateLimited:
+        raise
+    except openai.APIError as e:
+        logger.error(f"OpenAI API error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
+    except HttpError as e:
+        if e.resp.status == 403 and "insufficientPermissions" in str(e):
+            raise HTTPException(status_code=403, detail="Insufficient authentication scopes. Please log in again.")
+        raise HTTPException(status_code=400, detail=f"YouTube API error: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error in summarize_comments endpoint: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Failed to summarize comments: {str(e)}")
 
-        youtube_service = build("youtube", "v3", credentials=credentials)
-        comments_response = youtube_service.commentThreads().list(
-            part="snippet",
-            videoId=video_id,
-            maxResults=40
-        ).execute()
+class SummarizeJobRequest(BaseModel):
+    # Malformed bodies get a 422 before any work is queued
+    video_ids: list[constr(pattern=r"^[A-Za-z0-9_-]{1,64}$")] = Field(min_length=1, max_length=MAX_VIDEOS_PER_JOB)
+    prompt: constr(min_length=1)
+    max_comments: conint(ge=1) = MAX_COMMENTS
+
+@app.post("/api/summarize_jobs", status_code=202)
+async def create_summarize_job(body: SummarizeJobRequest, user_data: UserData = Depends(get_current_user)):
+    max_comments = checked_max_comments(body.max_comments)
+    admission.admit("jobs", user_data.email, youtube=True)
+
+    job = summary_jobs.submit(user_data, body.video_ids, body.prompt, max_comments)
+    return JSONResponse(status_code=202, content=job.to_dict(include_results=False))
+
+@app.get("/api/summarize_jobs/{job_id}")
+async def get_summarize_job(job_id: str, user_data: UserData = Depends(get_current_user)):
+    job = await summary_jobs.snapshot(job_id, user_data.email)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job)
+
+@app.delete("/api/summarize_jobs/{job_id}")
+async def cancel_summarize_job(job_id: str, user_data: UserData = Depends(get_current_user)):
+    job = await summary_jobs.cancel(job_id, user_data.email)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/summarize_comments/stream")
+async def summarize_comments_stream(request: Request, user_data: UserData = Depends(get_current_user)):
+    started = time.perf_counter()
+    body = await request.json()
+    video_id = body.get("video_id")
+    prompt = body.get("prompt")
+    max_comments = checked_max_comments(body.get("max_comments", MAX_COMMENTS))
+    incremental = body.get("incremental", INCREMENTAL_SUMMARIES)
+    analytics_mode = body.get("analytics", ANALYTICS_MODE)
+    focus = body.get("focus", False)
 
-        comments = [item['snippet']['topLevelComment']['snippet']['textDisplay'] 
-                    for item in comments_response.get('items', [])]
+    if not video_id or not prompt:
+        raise HTTPException(status_code=400, detail="Missing video_id or prompt")
+    admission.admit("summarize", user_data.email, youtube=True)
+    # Covers the event stream too, which runs in a task started from this one
+    bind_usage_scope(user_data.email, video_id)
 
+    try:
+        comments = await run_blocking(fetch_comments_for_summary, video_id, user_data, max_comments)
+    except HttpError as e:
+        if e.resp.status == 403 and "insufficientPermissions" in str(e):
+            raise HTTPException(status_code=403, detail="Insufficient authentication scopes. Please log in again.")
+        raise HTTPException(status_code=400, detail=f"YouTube API error: {str(e)}")
+
+    answer, context = None, None
+    if comments:
+        answer, context = await run_blocking(answer_locally, prompt, comments, analytics_mode)
+    if answer is not None:
+        return StreamingResponse(iter([sse_event("done", {"summary": answer})]), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    focused = focus and len(comments) > RELEVANT_COMMENTS
+    if focused:
+        comments = await focus_comments(video_id, prompt, comments)
+
+    key = summary_cache_key(video_id, prompt, comments, incremental, context is not None, focused)
+    cached = None
+    if comments:
+        cached = summary_cache.get_memory(key) or await run_blocking(summary_cache.get, key)
+        if cached is None:
+            # Before the 200 goes out, so overload is still reported as a 429
+            # rather than as an error event
+            admission.check_openai()
+
+    async def events():
         if not comments:
-            return JSONResponse(content={"summary": "No comments found for this video."})
-
-        # Summarize comments
+            yield sse_event("done", {"summary": "No comments found for this video."})
+            return
+        if cached is not None:
+            logger.info(f"summarize stream ttfb={time.perf_counter() - started:.3f}s (cached)")
+            yield sse_event("done", {"summary": cached})
+            return
+
+        parts = []
+        deltas = None
+        update = None
+        slot = False
         try:
-            summary = openai_summarize_comments(comments, prompt)
-            return JSONResponse(content={"summary": summary})
+            if focused:
+                final_prompt = await run_blocking(focused_prompt, prompt, comments, context)
+            else:
+                update = await run_blocking(summary_store.plan, video_id, prompt, comments, incremental)
+                if update.summary is not None:
+                    yield sse_event("done", {"summary": update.summary})
+                    return
+                final_prompt = with_context(update.final_prompt, context)
+            # Taken only here, so a body that never runs holds no slot
+            admission.acquire_openai()
+            slot = True
+            deltas = stream_completion(final_prompt)
+            async for delta in deltas:
+                if not parts:
+                    logger.info(f"summarize stream ttfb={time.perf_counter() - started:.3f}s")
+                if await request.is_disconnected():
+                    logger.info("Client disconnected, cancelling summary stream")
+                    return
+                parts.append(delta)
+                yield sse_event("delta", {"text": delta})
+        except RateLimited as e:
+            yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+            return
         except openai.APIError as e:
-            print(f"OpenAI API error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
-        except Exception as e:
-            print(f"Error in summarize_comments: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error in summarize_comments: {str(e)}")
+            yield sse_event("error", {"detail": f"OpenAI API error: {str(e)}"})
+            return
+        finally:
+            # Also runs when Starlette cancels us on disconnect: closing the
+            # upstream stream stops OpenAI from generating unused tokens
+            if deltas is not None:
+                await deltas.aclose()
+            if slot:
+                admission.release_openai()
+
+        summary = "".join(parts)
+        if update is not None:
+            await run_blocking(update.save, summary)
+        await run_blocking(summary_cache.set, key, summary)
+        yield sse_event("done", {"summary": summary})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/video/{video_id}/analytics")
+async def get_video_analytics(video_id: str, max_comments: int = MAX_COMMENTS,
+                              user_data: UserData = Depends(get_current_user)):
+    max_comments = checked_max_comments(max_comments)
+    admission.admit("comments", user_data.email, youtube=True)
+    try:
+        comments = await run_blocking(fetch_comments_for_summary, video_id, user_data, max_comments)
+    except HttpError as e:
+        raise HTTPException(status_code=400, detail=f"YouTube API error: {str(e)}")
+    return JSONResponse(content=await run_blocking(analyze_comments, comments))
+
+@app.get("/api/video/{video_id}/search")
+async def search_video_comments(video_id: str, q: str, k: int = SEARCH_RESULTS, max_comments: int = MAX_COMMENTS,
+                                user_data: UserData = Depends(get_current_user)):
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Missing q")
+    max_comments = checked_max_comments(max_comments)
+    admission.admit("comments", user_data.email, youtube=True)
+    try:
+        comments = await run_blocking(fetch_comments_for_summary, video_id, user_data, max_comments)
+        with usage_scope(user_data.email, video_id):
+            results = await embed_call(embedding_index.search, video_id, q, comments, max(1, min(k, 100)))
+    except RateLimited:
+        raise
+    except openai.APIError as e:
+        raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
+    except HttpError as e:
+        raise HTTPException(status_code=400, detail=f"YouTube API error: {str(e)}")
+    return JSONResponse(content={"results": results})
+
+@app.get("/api/usage")
+async def get_usage(group_by: str = "video", hours: Optional[float] = None, video_id: Optional[str] = None,
+                    all_users: bool = False, user_data: UserData = Depends(get_current_user)):
+    # OpenAI tokens, latency and cost, for the caller or (USAGE_ADMINS only) everyone
+    if group_by not in USAGE_GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(USAGE_GROUP_BY)}")
+    if all_users and user_data.email not in USAGE_ADMINS:
+        raise HTTPException(status_code=403, detail="Not allowed to view other users' usage")
+    since = datetime.utcnow() - timedelta(hours=hours) if hours else None
+    groups = await run_blocking(usage_log.summary, group_by, None if all_users else user_data.email, video_id, since)
+    total = {name: sum(group[name] for group in groups)
+             for name in ("calls", "prompt_tokens", "completion_tokens", "cost_usd")}
+    total["cost_usd"] = round(total["cost_usd"], 6)
+    return JSONResponse(content={
+        "group_by": group_by,
+        "since": since.isoformat() if since else None,
+        "total": total,
+        "groups": groups,
+    })
 
-        except HttpError as e:
-            if e.resp.status == 403 and "insufficientPermissions" in str(e):
-                raise HTTPException(status_code=403, detail="Insufficient authentication scopes. Please log in again.")
-            raise HTTPException(status_code=400, detail=f"YouTube API error: {str(e)}")
-    except Exception as e:
-        print(f"Error in summarize_comments endpoint: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Failed to summarize comments: {str(e)}")
+@app.get("/api/cache_stats")
+async def cache_stats():
+    return JSONResponse(content={
+        "videos": video_cache.stats(),
+        "comments": comment_cache.stats(),
+        "summaries": summary_cache.stats(),
+        "comment_sync": comment_store.stats(),
+        "summary_updates": summary_store.stats(),
+        "embeddings": embedding_index.stats(),
+    })
+
+def _cache_counts():
+    caches = {"videos": video_cache.stats(), "comments": comment_cache.stats(), "summaries": summary_cache.stats()}
+    return {name: (stats["hits"] + stats.get("revalidations", 0), stats["misses"]) for name, stats in caches.items()}
+
+def _cache_hit_ratios():
+    ratios = {}
+    for name, (hits, misses) in _cache_counts().items():
+        ratios[(name,)] = hits / (hits + misses) if hits + misses else 0.0
+    return ratios
+
+def _cache_lookups():
+    lookups = {}
+    for name, (hits, misses) in _cache_counts().items():
+        lookups[(name, "hit")] = hits
+        lookups[(name, "miss")] = misses
+    return lookups
+
+registry.register(Gauge("cache_hit_ratio", "Cache hits (including 304 revalidations) over lookups",
+                        labels=("cache",), collect=_cache_hit_ratios))
+registry.register(Gauge("cache_lookups", "Cache lookups by result", labels=("cache", "result"),
+                        collect=_cache_lookups))
+registry.register(Gauge("openai_in_flight", "OpenAI calls currently in flight",
+                        collect=lambda: {(): admission.openai_calls.in_flight}))
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/rate_limit_stats")
+async def rate_limit_stats():
+    return JSONResponse(content=admission.stats())
 
 @app.get("/logout")
 async def logout(request: Request):
     auth_header = request.headers.get("Authorization")
     if auth_header and auth_header.startswith("Bearer "):
         token = auth_header.split(" ")[1]
-        user_data = next((u for u in user_data_store.values() if u.access_token == token), None)
+        user_data = await run_blocking(session_store.get_by_token, token)
         if user_data:
-            del user_data_store[user_data.email]
+            await run_blocking(session_store.remove, user_data)
     return JSONResponse(content={"message": "Logged out successfully"})
 
 if __name__ == "__main__":
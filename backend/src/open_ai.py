@@ -1,28 +1,239 @@
-from openai import OpenAI
+import asyncio
+import contextlib
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import logging
 
-from config import OPENAI_API_KEY
+import config
+from lazy_imports import lazy_import
+from metrics import prompt_budget_actions, record_usage, span
+from usage import usage_log
+
+# The SDK (and httpx under it) is imported on the first call or by the
+# warm-up hook, not when the app boots
+httpx = lazy_import("httpx")
+openai = lazy_import("openai")
+# Optional: exact token counts. Without it prompts are estimated from their length
+tiktoken = lazy_import("tiktoken")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def summarize_comments(comments, prompt):
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    
-    comments_text = "\n".join(comments)
-    new_prompt = f"{prompt}\n\nComments:\n{comments_text}"
+# Comments are split into chunks of roughly this many prompt tokens; each chunk
+# is summarized on its own and the partial summaries are then combined.
+CHUNK_TOKEN_BUDGET = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_PARALLELISM = int(os.environ.get("SUMMARY_PARALLELISM", "4"))
+
+# Everything besides the prompt and comments that changes the generated summary
+MODEL_PARAMS = {
+    "model": os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo"),
+    "max_tokens": int(os.environ.get("OPENAI_MAX_TOKENS", "500")),
+    "temperature": 0.7,
+}
+
+# Prompt tokens a single completion may send. Over the budget,
+# PROMPT_BUDGET_POLICY decides: "trim" cuts the end of the prompt (the last
+# comments) to fit; "model" sends it to OVERFLOW_MODEL instead, trimming only
+# past OVERFLOW_TOKEN_BUDGET
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "12000"))
+PROMPT_BUDGET_POLICY = os.environ.get("PROMPT_BUDGET_POLICY", "trim")
+OVERFLOW_MODEL = os.environ.get("OVERFLOW_MODEL", "gpt-4o-mini")
+OVERFLOW_TOKEN_BUDGET = int(os.environ.get("OVERFLOW_TOKEN_BUDGET", "100000"))
+
+# Comment embeddings for semantic search (embeddings.py). text-embedding-3
+# models can return shortened vectors; 256 dimensions keep a video's index small
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "256"))
+EMBEDDING_BATCH = 256  # inputs per embeddings request; the API accepts up to 2048
+
+# Connection pool and retry policy shared by every OpenAI call in the process
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "60"))  # seconds, per attempt
+OPENAI_DEADLINE = float(os.environ.get("OPENAI_DEADLINE", "120"))  # seconds, across all attempts of a call
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "32"))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get("OPENAI_MAX_KEEPALIVE", "16"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "4"))
+RETRY_BASE_DELAY = 0.5  # seconds
+RETRY_MAX_DELAY = 20.0  # seconds, also caps a server-sent Retry-After
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+# Wraps every blocking chat completion (see set_completion_gate)
+_completion_gate = contextlib.nullcontext
+
+def _pool_limits():
+    return httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                        keepalive_expiry=30)
+
+def set_completion_gate(gate):
+    # `gate()` is entered around each complete() call, so every map, reduce
+    # and final completion takes its own admission slot
+    global _completion_gate
+    _completion_gate = gate
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Retries are handled by with_retries so the policy is the same for sync and async
+                _client = openai.OpenAI(api_key=config.OPENAI_API_KEY, max_retries=0, timeout=OPENAI_TIMEOUT,
+                                        http_client=httpx.Client(limits=_pool_limits(), timeout=OPENAI_TIMEOUT))
+    return _client
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                http_client = httpx.AsyncClient(limits=_pool_limits(), timeout=OPENAI_TIMEOUT)
+                _async_client = openai.AsyncOpenAI(api_key=config.OPENAI_API_KEY, max_retries=0,
+                                                   timeout=OPENAI_TIMEOUT, http_client=http_client)
+    return _async_client
 
+def _is_retryable(error):
+    if isinstance(error, openai.APIConnectionError):  # includes APITimeoutError
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+def _retry_delay(error, attempt):
+    # Full-jitter exponential backoff, but never sooner than the server asked for
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after", ""))
+        except ValueError:
+            retry_after = None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, RETRY_MAX_DELAY))
+    return delay
+
+def _attempt_timeout(deadline_at):
+    return max(0.0, min(OPENAI_TIMEOUT, deadline_at - time.perf_counter()))
+
+def _should_retry(error, attempt, max_retries, deadline_at):
+    # The backoff delay, or None to give up and raise `error`
+    if attempt == max_retries or not _is_retryable(error):
+        return None
+    delay = _retry_delay(error, attempt)
+    if time.perf_counter() + delay >= deadline_at:
+        logger.warning(f"OpenAI call failed ({error.__class__.__name__}), no time left for another attempt")
+        return None
+    logger.warning(f"OpenAI call failed ({error.__class__.__name__}), retrying in {delay:.2f}s")
+    return delay
+
+def with_retries(call, max_retries=OPENAI_MAX_RETRIES, deadline=OPENAI_DEADLINE):
+    # `call` takes the attempt's timeout: OPENAI_TIMEOUT, or less once the
+    # deadline across all attempts is nearer than that
+    deadline_at = time.perf_counter() + deadline
+    for attempt in range(max_retries + 1):
+        try:
+            return call(_attempt_timeout(deadline_at))
+        except openai.APIError as e:
+            delay = _should_retry(e, attempt, max_retries, deadline_at)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+async def with_retries_async(call, max_retries=OPENAI_MAX_RETRIES, deadline=OPENAI_DEADLINE):
+    deadline_at = time.perf_counter() + deadline
+    for attempt in range(max_retries + 1):
+        try:
+            return await call(_attempt_timeout(deadline_at))
+        except openai.APIError as e:
+            delay = _should_retry(e, attempt, max_retries, deadline_at)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+def _messages(prompt):
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt},
+    ]
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text
+    return len(text) // 4 + 1
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    # None (estimate from length) when tiktoken is missing or cannot load its
+    # BPE file, which it downloads on first use; cached, so that is tried once
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",  # Changed from "gpt-4o-mini" to "gpt-3.5-turbo"
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": new_prompt},
-            ],
-            max_tokens=500,
-            temperature=0.7,
-        )
-        
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")  # models newer than the installed tiktoken
+    except ImportError:
+        return None
+    except Exception as e:
+        logger.warning(f"Could not load the tiktoken encoding for {model}, estimating token counts: {e}")
+        return None
+
+def count_tokens(text, model=None):
+    encoding = _encoding(model or MODEL_PARAMS["model"])
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def trim_to_tokens(text, tokens, model=None):
+    encoding = _encoding(model or MODEL_PARAMS["model"])
+    if encoding is None:
+        return text[:tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:tokens])
+
+def prompt_tokens(prompt, model=None):
+    # As the API counts chat messages: each adds its role and a few framing
+    # tokens, and the reply is primed with 3 more
+    return sum(count_tokens(m["content"], model) + 4 for m in _messages(prompt)) + 3
+
+def fit_prompt(prompt, budget=PROMPT_TOKEN_BUDGET, policy=PROMPT_BUDGET_POLICY):
+    """The prompt and model params to send so the prompt stays within budget."""
+    params = MODEL_PARAMS
+    tokens = prompt_tokens(prompt, params["model"])
+    if tokens <= budget:
+        return prompt, params
+    if policy == "model":
+        params = {**MODEL_PARAMS, "model": OVERFLOW_MODEL}
+        budget = OVERFLOW_TOKEN_BUDGET
+        tokens = prompt_tokens(prompt, OVERFLOW_MODEL)
+        if tokens <= budget:
+            prompt_budget_actions.inc("model")
+            logger.info(f"Prompt of {tokens} tokens is over budget, sending it to {OVERFLOW_MODEL}")
+            return prompt, params
+    prompt_budget_actions.inc("trim")
+    logger.warning(f"Prompt of {tokens} tokens is over the budget of {budget}, trimming it")
+    overhead = prompt_tokens("", params["model"])
+    return trim_to_tokens(prompt, budget - overhead, params["model"]), params
+
+def _record(model, usage, started, kind="completion"):
+    record_usage(model, usage)
+    usage_log.record(model, kind, usage, time.perf_counter() - started)
+
+def complete(prompt):
+    client = get_client()
+    prompt, params = fit_prompt(prompt)
+
+    try:
+        started = time.perf_counter()
+        with _completion_gate(), span("openai_completion"):
+            response = with_retries(lambda timeout: client.chat.completions.create(
+                messages=_messages(prompt),
+                timeout=timeout,
+                **params,
+            ))
+        _record(params["model"], response.usage, started)
+
         summary = response.choices[0].message.content
         return summary
     except openai.APIError as e:
@@ -30,4 +241,135 @@ def summarize_comments(comments, prompt):
         raise
     except Exception as e:
         logger.error(f"Unexpected error in summarize_comments: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+def embed(texts, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS):
+    # One vector per text, in order, batched into as few requests as possible
+    client = get_client()
+    vectors = []
+    for start in range(0, len(texts), EMBEDDING_BATCH):
+        batch = texts[start:start + EMBEDDING_BATCH]
+        started = time.perf_counter()
+        with span("openai_embedding"):
+            response = with_retries(lambda timeout: client.embeddings.create(
+                model=model, input=batch, dimensions=dimensions, timeout=timeout))
+        _record(model, response.usage, started, "embedding")
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return vectors
+
+async def complete_async(prompt):
+    client = get_async_client()
+    prompt, params = fit_prompt(prompt)
+    started = time.perf_counter()
+    with span("openai_completion"):
+        response = await with_retries_async(lambda timeout: client.chat.completions.create(
+            messages=_messages(prompt),
+            timeout=timeout,
+            **params,
+        ))
+    _record(params["model"], response.usage, started)
+    return response.choices[0].message.content
+
+def chunk_texts(texts, token_budget=CHUNK_TOKEN_BUDGET):
+    chunks = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if tokens > token_budget:
+            text = text[:token_budget * 4]
+            tokens = token_budget
+        if current and current_tokens + tokens > token_budget:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _map_in_pool(pool, fn, items):
+    # Pool threads do not inherit contextvars; run each item in a copy of the
+    # caller's context so its usage is attributed to the same user and video
+    context = contextvars.copy_context()
+    return list(pool.map(lambda item: context.copy().run(fn, item), items))
+
+def _map_prompt(prompt, chunk, index, total):
+    comments_text = "\n".join(chunk)
+    return (f"{prompt}\n\nThese comments are part {index} of {total}. Summarize what they say "
+            f"that is relevant to the request above.\n\nComments:\n{comments_text}")
+
+def _reduce_prompt(prompt, partials):
+    partials_text = "\n\n".join(f"Part {i}:\n{p}" for i, p in enumerate(partials, 1))
+    return (f"{prompt}\n\nThe comments were summarized in parts. Combine these partial summaries "
+            f"into a single answer to the request above.\n\n{partials_text}")
+
+def build_final_prompt(comments, prompt, complete_fn=complete, chunk_tokens=CHUNK_TOKEN_BUDGET,
+                       parallelism=SUMMARY_PARALLELISM):
+    # Returns the prompt for the last completion. For large comment sets this
+    # runs the map step (and any intermediate reduce rounds) first.
+    chunks = chunk_texts(comments, chunk_tokens)
+    if len(chunks) <= 1:
+        comments_text = "\n".join(comments)
+        return f"{prompt}\n\nComments:\n{comments_text}"
+
+    # Map: summarize chunks concurrently, at most `parallelism` in flight
+    logger.info(f"Summarizing {len(comments)} comments in {len(chunks)} chunks")
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        partials = _map_in_pool(
+            pool,
+            lambda args: complete_fn(_map_prompt(prompt, args[1], args[0], len(chunks))),
+            enumerate(chunks, 1)
+        )
+
+    # Reduce: combine partial summaries, again in chunks if they do not fit
+    while True:
+        groups = chunk_texts(partials, chunk_tokens)
+        if len(groups) == 1 or len(groups) >= len(partials):
+            # Fits in one prompt, or another round would not shrink it
+            return _reduce_prompt(prompt, partials)
+        with ThreadPoolExecutor(max_workers=parallelism) as pool:
+            partials = _map_in_pool(pool, lambda group: complete_fn(_reduce_prompt(prompt, group)), groups)
+
+def _merge_prompt(prompt, previous, comments):
+    comments_text = "\n".join(comments)
+    return (f"{prompt}\n\nThis is the current answer to the request above, based on earlier comments:\n"
+            f"{previous}\n\nUpdate it with these newer comments. Keep what still holds, add what is new "
+            f"and note where opinion has shifted.\n\nNew comments:\n{comments_text}")
+
+def build_update_prompt(previous, comments, prompt, complete_fn=complete, chunk_tokens=CHUNK_TOKEN_BUDGET,
+                        parallelism=SUMMARY_PARALLELISM):
+    # Prompt that folds new comments into an existing summary. New comments
+    # that do not fit in one chunk are condensed first, as in a full summary.
+    if len(chunk_texts(comments, chunk_tokens)) > 1:
+        comments = [complete_fn(build_final_prompt(comments, prompt, complete_fn, chunk_tokens, parallelism))]
+    return _merge_prompt(prompt, previous, comments)
+
+def summarize_comments(comments, prompt, complete_fn=complete, chunk_tokens=CHUNK_TOKEN_BUDGET,
+                       parallelism=SUMMARY_PARALLELISM):
+    return complete_fn(build_final_prompt(comments, prompt, complete_fn, chunk_tokens, parallelism))
+
+async def stream_completion(prompt):
+    client = get_async_client()
+    prompt, params = fit_prompt(prompt)
+    started = time.perf_counter()
+    with span("openai_completion"):
+        stream = await with_retries_async(lambda timeout: client.chat.completions.create(
+            messages=_messages(prompt),
+            stream=True,
+            timeout=timeout,
+            # The final chunk then carries the token usage for the whole response
+            stream_options={"include_usage": True},
+            **params,
+        ))
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    _record(params["model"], chunk.usage, started)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Closing the response tells OpenAI to stop generating, e.g. when the
+            # client disconnected and this generator was closed early
+            await stream.close()
@@ -0,0 +1,246 @@
+import asyncio
+import contextlib
+import math
+import os
+import threading
+import time
+
+# Per-user request rates for each class of route: (requests per minute, burst)
+USER_LIMITS = {
+    "videos": (float(os.environ.get("RATE_LIMIT_VIDEOS_PER_MINUTE", "30")), 10),
+    "comments": (float(os.environ.get("RATE_LIMIT_COMMENTS_PER_MINUTE", "30")), 10),
+    "summarize": (float(os.environ.get("RATE_LIMIT_SUMMARIZE_PER_MINUTE", "10")), 3),
+    "jobs": (float(os.environ.get("RATE_LIMIT_JOBS_PER_MINUTE", "2")), 2),
+}
+# Project-wide upstream budgets shared by all users
+YOUTUBE_QUOTA_PER_DAY = float(os.environ.get("YOUTUBE_QUOTA_PER_DAY", "10000"))
+YOUTUBE_QUOTA_BURST = float(os.environ.get("YOUTUBE_QUOTA_BURST", "500"))
+OPENAI_REQUESTS_PER_MINUTE = float(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", "500"))
+OPENAI_MAX_IN_FLIGHT = int(os.environ.get("OPENAI_MAX_IN_FLIGHT", "16"))
+# How long one call of an admitted request waits for an OpenAI slot before failing
+OPENAI_SLOT_WAIT = float(os.environ.get("OPENAI_SLOT_WAIT", "30"))  # seconds
+# Buckets live in each worker process, so the project-wide limits above are
+# split evenly between workers (gunicorn sets WEB_CONCURRENCY from --workers in
+# our config). Per-user limits are not: a keep-alive connection keeps a user on
+# one worker, so each worker allows a user the full limit.
+WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+
+
+class RateLimited(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Rate limited: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """Allows `rate` units per second on average, with bursts up to `capacity`.
+
+    charge() takes units after the fact and may leave the bucket in debt,
+    which later callers wait out like any other shortfall.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # charge() is called from the threads that make the upstream calls
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, cost=1):
+        # Returns (acquired, seconds until `cost` units would be available)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= cost:
+                self.tokens -= cost
+                return True, 0.0
+            return False, (cost - self.tokens) / self.rate
+
+    def check(self, level=1):
+        # As try_acquire, but takes nothing
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= level:
+                return True, 0.0
+            return False, (level - self.tokens) / self.rate
+
+    def charge(self, cost):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= cost
+
+    async def acquire(self, cost=1):
+        cost = min(cost, self.capacity)  # a single oversized request must still get through eventually
+        while True:
+            acquired, wait = self.try_acquire(cost)
+            if acquired:
+                return
+            await asyncio.sleep(wait)
+
+    async def wait_for(self, level):
+        # Until `level` units are available; takes nothing
+        level = min(level, self.capacity)
+        while True:
+            available, wait = self.check(level)
+            if available:
+                return
+            await asyncio.sleep(wait)
+
+
+class KeyedBuckets:
+    """One TokenBucket per key (e.g. per user), created on first use."""
+
+    def __init__(self, rate, capacity, max_keys=100_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = {}
+
+    def get(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._drop_full()
+            bucket = TokenBucket(self.rate, self.capacity)
+            self._buckets[key] = bucket
+        return bucket
+
+    def _drop_full(self):
+        # Buckets that have refilled completely carry no state worth keeping
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            bucket._refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[key]
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight calls. try_acquire rejects callers over the cap;
+    worker threads may instead wait for a slot with acquire_blocking."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self._free = threading.Condition()
+
+    def try_acquire(self):
+        with self._free:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire_blocking(self, timeout):
+        # False if no slot came free within `timeout` seconds
+        with self._free:
+            if not self._free.wait_for(lambda: self.in_flight < self.limit, timeout):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._free:
+            self.in_flight -= 1
+            self._free.notify()
+
+
+class AdmissionControl:
+    """Decides, before any upstream work starts, whether a request may proceed.
+
+    Rejections raise RateLimited carrying a Retry-After hint, so overload is
+    shed immediately instead of after an upstream timeout or quota error.
+    """
+
+    def __init__(self, user_limits=USER_LIMITS, youtube_per_day=YOUTUBE_QUOTA_PER_DAY,
+                 youtube_burst=YOUTUBE_QUOTA_BURST, openai_per_minute=OPENAI_REQUESTS_PER_MINUTE,
+                 openai_in_flight=OPENAI_MAX_IN_FLIGHT, workers=WORKERS):
+        self.users = {name: KeyedBuckets(per_minute / 60, burst) for name, (per_minute, burst) in user_limits.items()}
+        self.youtube = TokenBucket(youtube_per_day / 86400 / workers, youtube_burst / workers)
+        openai_per_second = openai_per_minute / 60 / workers
+        self.openai = TokenBucket(openai_per_second, max(1.0, openai_per_second))
+        self.openai_calls = ConcurrencyLimiter(max(1, openai_in_flight // workers))
+        self.rejected = {}
+
+    def _reject(self, reason, retry_after):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise RateLimited(reason, retry_after)
+
+    def admit(self, route_class, user_key, youtube=False):
+        acquired, wait = self.users[route_class].get(user_key).try_acquire()
+        if not acquired:
+            self._reject(f"user:{route_class}", wait)
+        if youtube:
+            # Only a check: the units a request spends depend on what the
+            # caches already hold, so youtube.execute charges them as it goes
+            available, wait = self.youtube.check()
+            if not available:
+                self._reject("youtube", wait)
+
+    def acquire_openai(self):
+        # Pair with release_openai(); prefer openai_call() where a block fits
+        if not self.openai_calls.try_acquire():
+            self._reject("openai:in_flight", 1.0)
+        acquired, wait = self.openai.try_acquire()
+        if not acquired:
+            self.openai_calls.release()
+            self._reject("openai:rate", wait)
+
+    def release_openai(self):
+        self.openai_calls.release()
+
+    def check_openai(self):
+        # Up-front check for a route that will call OpenAI; takes nothing, as
+        # each call takes its own slot (see openai_slot)
+        if self.openai_calls.in_flight >= self.openai_calls.limit:
+            self._reject("openai:in_flight", 1.0)
+        available, wait = self.openai.check()
+        if not available:
+            self._reject("openai:rate", wait)
+
+    @contextlib.contextmanager
+    def openai_slot(self, timeout=OPENAI_SLOT_WAIT):
+        """An in-flight slot and a request token for one OpenAI call.
+
+        For blocking calls on worker threads, e.g. each map and reduce call
+        of a large summary. The request was admitted already, so this waits up
+        to `timeout` seconds for capacity rather than rejecting at once.
+        """
+        deadline = time.monotonic() + timeout
+        if not self.openai_calls.acquire_blocking(timeout):
+            self._reject("openai:in_flight", 1.0)
+        try:
+            while True:
+                acquired, wait = self.openai.try_acquire()
+                if acquired:
+                    break
+                if time.monotonic() + wait > deadline:
+                    self._reject("openai:rate", wait)
+                time.sleep(wait)
+            yield
+        finally:
+            self.openai_calls.release()
+
+    @contextlib.asynccontextmanager
+    async def openai_call(self):
+        self.acquire_openai()
+        try:
+            yield
+        finally:
+            self.release_openai()
+
+    def stats(self):
+        return {
+            "rejected": dict(self.rejected),
+            "openai_in_flight": self.openai_calls.in_flight,
+            "youtube_units_available": round(self.youtube.tokens, 1),
+        }
@@ -0,0 +1,257 @@
+import hashlib
+import heapq
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import or_
+
+from database.database import SessionLocal
+from database.models import User
+
+# Sessions whose access token expired longer ago than this are evicted.
+# Kept generous so /api/refresh_token still finds users holding an expired token.
+STALE_SESSION_GRACE = timedelta(days=7)
+# How long a session read from the database is trusted before it is re-read.
+# Bounds how long another worker's refresh or logout can go unnoticed here.
+SESSION_CACHE_TTL = float(os.environ.get("SESSION_CACHE_TTL", "30"))  # seconds
+
+
+@dataclass(slots=True, kw_only=True, eq=False)
+class UserData:
+    """One signed-in user, as held in the session cache.
+
+    A plain slotted record: the values come from Google or our own users
+    table, so there is nothing to validate, and at hundreds of thousands of
+    sessions a pydantic model's per-instance overhead adds up.
+    """
+
+    google_id: str
+    name: str
+    email: str
+    channel_id: str
+    uploads_playlist_id: Optional[str] = None
+    access_token: str
+    refresh_token: str
+    token_expiry: datetime
+    # The token replaced by the last refresh. Still accepted so a browser that
+    # has not picked up the new token yet is not logged out.
+    previous_access_token: Optional[str] = None
+    # google.oauth2 Credentials built for access_token, reused across
+    # requests until the token changes (see main.user_credentials)
+    credentials: Any = field(default=None, repr=False)
+
+    def __post_init__(self):
+        # Every re-read of a session from the database allocates these again
+        self.channel_id = sys.intern(self.channel_id)
+        if self.uploads_playlist_id is not None:
+            self.uploads_playlist_id = sys.intern(self.uploads_playlist_id)
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _to_user_data(user, presented_token=None):
+    previous = presented_token if presented_token and presented_token != user.access_token else None
+    return UserData(
+        google_id=user.google_id,
+        name=user.name,
+        email=user.email,
+        channel_id=user.channel_id,
+        uploads_playlist_id=user.uploads_playlist_id,
+        access_token=user.access_token,
+        refresh_token=user.refresh_token,
+        token_expiry=user.token_expiry,
+        previous_access_token=previous,
+    )
+
+
+class SessionStore:
+    """Signed-in users, stored in the users table.
+
+    Lookups go through an in-process cache indexed by bearer (access) token so
+    the hot auth path does not touch the database. Writes go to the database
+    first, then update the cache.
+    """
+
+    def __init__(self, session_factory=SessionLocal, stale_grace=STALE_SESSION_GRACE, cache_ttl=SESSION_CACHE_TTL):
+        self.session_factory = session_factory
+        self.stale_grace = stale_grace
+        self.cache_ttl = cache_ttl
+        self._lock = threading.Lock()
+        self._by_email = {}
+        self._by_token = {}  # access_token (current or previous) -> (user_data, cached_at)
+        self._last_seen = {}  # email -> monotonic time of the last authenticated request
+        # (token_expiry, access_token) min-heap used to evict stale tokens
+        # without scanning every session.
+        self._expiry_heap = []
+        self._heap_expiry = {}  # access_token -> token_expiry of its latest heap entry
+        # (token_expiry, email) min-heap the background refresh pops due sessions from
+        self._refresh_heap = []
+        self._refresh_expiry = {}  # email -> token_expiry of its latest refresh heap entry
+
+    def __len__(self):
+        return len(self._by_email)
+
+    # Cache
+
+    def get_cached(self, token):
+        entry = self._by_token.get(token)
+        if entry is None:
+            return None
+        user_data, cached_at = entry
+        if cached_at + self.cache_ttl < time.monotonic():
+            return None
+        if user_data.token_expiry + self.stale_grace < datetime.utcnow():
+            self._forget(user_data)
+            return None
+        self._last_seen[user_data.email] = time.monotonic()
+        return user_data
+
+    def due_sessions(self, expiring_by, window):
+        """Sessions whose token expires by `expiring_by` and that made a request
+        in the last `window` seconds.
+
+        Each due session is returned once per token expiry, so a call costs
+        O(due), not O(sessions). Idle sessions are skipped for good: their next
+        request renews the token (see main.get_current_user).
+        """
+        cutoff = time.monotonic() - window
+        due = []
+        with self._lock:
+            while self._refresh_heap and self._refresh_heap[0][0] <= expiring_by:
+                expiry, email = heapq.heappop(self._refresh_heap)
+                if self._refresh_expiry.get(email) != expiry:
+                    continue  # superseded by a later entry
+                del self._refresh_expiry[email]
+                user_data = self._by_email.get(email)
+                if (user_data is not None and user_data.token_expiry == expiry
+                        and self._last_seen.get(email, 0) >= cutoff):
+                    due.append(user_data)
+        return due
+
+    def _remember(self, user_data):
+        now = time.monotonic()
+        with self._lock:
+            previous = self._by_email.get(user_data.email)
+            if previous is not None and previous is not user_data:
+                self._drop_tokens(previous)
+                # A re-read after cache_ttl keeps the Credentials built for the same tokens
+                if (user_data.credentials is None and previous.access_token == user_data.access_token
+                        and previous.refresh_token == user_data.refresh_token):
+                    user_data.credentials = previous.credentials
+            self._by_email[user_data.email] = user_data
+            self._last_seen.setdefault(user_data.email, now)
+            self._by_token[user_data.access_token] = (user_data, now)
+            if user_data.previous_access_token:
+                self._by_token[user_data.previous_access_token] = (user_data, now)
+            # Re-reads of an unchanged session already have their heap entry
+            if self._heap_expiry.get(user_data.access_token) != user_data.token_expiry:
+                self._heap_expiry[user_data.access_token] = user_data.token_expiry
+                heapq.heappush(self._expiry_heap, (user_data.token_expiry, user_data.access_token))
+            if self._refresh_expiry.get(user_data.email) != user_data.token_expiry:
+                self._refresh_expiry[user_data.email] = user_data.token_expiry
+                heapq.heappush(self._refresh_heap, (user_data.token_expiry, user_data.email))
+        self.evict_stale()
+
+    def _drop_tokens(self, user_data):
+        self._by_token.pop(user_data.access_token, None)
+        if user_data.previous_access_token:
+            self._by_token.pop(user_data.previous_access_token, None)
+
+    def _forget(self, user_data):
+        with self._lock:
+            self._drop_tokens(user_data)
+            if self._by_email.get(user_data.email) is user_data:
+                del self._by_email[user_data.email]
+                self._last_seen.pop(user_data.email, None)
+
+    def evict_stale(self, now=None):
+        cutoff = (now or datetime.utcnow()) - self.stale_grace
+        evicted = 0
+        while self._expiry_heap and self._expiry_heap[0][0] < cutoff:
+            with self._lock:
+                if not self._expiry_heap or self._expiry_heap[0][0] >= cutoff:
+                    break
+                expiry, token = heapq.heappop(self._expiry_heap)
+                if self._heap_expiry.get(token) == expiry:
+                    del self._heap_expiry[token]
+                entry = self._by_token.get(token)
+            # Heap entries for refreshed or removed tokens are simply skipped
+            if entry is not None and entry[0].token_expiry == expiry:
+                self._forget(entry[0])
+                evicted += 1
+        return evicted
+
+    # Database-backed operations (blocking; call through run_blocking)
+
+    def get_by_token(self, token):
+        user_data = self.get_cached(token)
+        if user_data is not None:
+            return user_data
+        token_hash = hash_token(token)
+        with self.session_factory() as db:
+            user = db.query(User).filter(
+                or_(User.access_token_hash == token_hash, User.previous_access_token_hash == token_hash)
+            ).first()
+            if user is None:
+                return None
+            user_data = _to_user_data(user, token)
+        if user_data.token_expiry + self.stale_grace < datetime.utcnow():
+            return None
+        self._remember(user_data)
+        return user_data
+
+    def reload(self, user_data):
+        # Re-read a session, e.g. to see whether another worker refreshed it
+        with self.session_factory() as db:
+            user = db.query(User).filter(User.email == user_data.email).first()
+            if user is None:
+                return None
+            return _to_user_data(user)
+
+    def add(self, user_data):
+        with self.session_factory() as db:
+            user = db.query(User).filter(User.email == user_data.email).first()
+            if user is None:
+                user = User(email=user_data.email)
+                db.add(user)
+            user.google_id = user_data.google_id
+            user.name = user_data.name
+            user.channel_id = user_data.channel_id
+            user.uploads_playlist_id = user_data.uploads_playlist_id
+            user.access_token = user_data.access_token
+            user.access_token_hash = hash_token(user_data.access_token)
+            user.previous_access_token_hash = None
+            user.refresh_token = user_data.refresh_token
+            user.token_expiry = user_data.token_expiry
+            db.commit()
+        self._remember(user_data)
+
+    def update_token(self, user_data, access_token, token_expiry):
+        previous = user_data.access_token
+        with self.session_factory() as db:
+            db.query(User).filter(User.email == user_data.email).update({
+                User.access_token: access_token,
+                User.access_token_hash: hash_token(access_token),
+                User.previous_access_token_hash: hash_token(previous),
+                User.token_expiry: token_expiry,
+            })
+            db.commit()
+        with self._lock:
+            self._drop_tokens(user_data)
+            user_data.previous_access_token = previous
+            user_data.access_token = access_token
+            user_data.token_expiry = token_expiry
+        self._remember(user_data)
+
+    def remove(self, user_data):
+        with self.session_factory() as db:
+            db.query(User).filter(User.email == user_data.email).delete()
+            db.commit()
+        self._forget(user_data)
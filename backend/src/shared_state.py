@@ -0,0 +1,140 @@
+import json
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+
+# Where state that every worker must see lives (OAuth state, upstream caches,
+# job progress). "memory://" only works with a single worker;
+# "sqlite:///path.db" is shared by all workers on one host.
+SHARED_STATE_URL = os.environ.get("SHARED_STATE_URL", "memory://")
+PURGE_EVERY = 500  # writes between removals of expired keys
+
+
+class SharedState(ABC):
+    """Key-value store with per-key expiry, shared between worker processes.
+
+    Values are anything json.dumps accepts. Backends implement get, set,
+    pop and delete; pop must be atomic, so a one-time value (an OAuth state)
+    is handed to at most one caller.
+    """
+
+    @abstractmethod
+    def get(self, key):
+        ...
+
+    @abstractmethod
+    def set(self, key, value, ttl):
+        ...
+
+    @abstractmethod
+    def pop(self, key):
+        ...
+
+    @abstractmethod
+    def delete(self, key):
+        ...
+
+
+class MemoryState(SharedState):
+    # Values are stored serialized, as in SQLite, so callers get their own
+    # copy and later changes to the object passed to set() are not shared
+    def __init__(self):
+        self._items = {}  # key -> (JSON text, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None or item[1] < time.time():
+            return None
+        return json.loads(item[0])
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._items[key] = (json.dumps(value), time.time() + ttl)
+            if len(self._items) % PURGE_EVERY == 0:
+                now = time.time()
+                self._items = {k: v for k, v in self._items.items() if v[1] >= now}
+
+    def pop(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+        if item is None or item[1] < time.time():
+            return None
+        return json.loads(item[0])
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class SQLiteState(SharedState):
+    """SharedState in a SQLite file, for several workers on one host.
+
+    Each thread keeps its own connection; WAL mode lets readers proceed
+    while another process writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS shared_state ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit; pop() opens its own transaction
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM shared_state WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                     (key, json.dumps(value, separators=(",", ":")), now + ttl))
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            conn.execute("DELETE FROM shared_state WHERE expires_at < ?", (now,))
+
+    def pop(self, key):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value, expires_at FROM shared_state WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM shared_state WHERE key = ?", (key,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+
+def open_shared_state(url=SHARED_STATE_URL):
+    if url.startswith("memory://"):
+        return MemoryState()
+    if url.startswith("sqlite:///"):
+        return SQLiteState(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported SHARED_STATE_URL: {url}")
+
+
+shared_state = open_shared_state()
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from concurrency import run_blocking
+
+SUMMARY_CACHE_PATH = os.environ.get("SUMMARY_CACHE_PATH", "summary_cache.db")
+SUMMARY_CACHE_MAX_AGE = int(os.environ.get("SUMMARY_CACHE_MAX_AGE", str(7 * 24 * 3600)))  # seconds
+SUMMARY_CACHE_MAX_BYTES = int(os.environ.get("SUMMARY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SUMMARY_CACHE_MEMORY_ENTRIES = int(os.environ.get("SUMMARY_CACHE_MEMORY_ENTRIES", "1024"))
+PRUNE_EVERY = 100  # writes between size/age pruning passes
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.split()).lower()
+
+
+def summary_key(video_id, prompt, comment_ids, model_params):
+    payload = json.dumps({
+        "video_id": video_id,
+        "prompt": normalize_prompt(prompt),
+        "model": model_params,
+        "comments": hashlib.sha256("\n".join(sorted(comment_ids)).encode()).hexdigest(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SummaryCache:
+    """Summaries keyed by content hash, persisted in SQLite.
+
+    A small in-memory LRU sits in front of the database so repeats are served
+    without touching disk. Identical requests that arrive while a summary is
+    being generated wait for that one upstream call instead of starting their own.
+    """
+
+    def __init__(self, path=SUMMARY_CACHE_PATH, max_age=SUMMARY_CACHE_MAX_AGE, max_bytes=SUMMARY_CACHE_MAX_BYTES,
+                 memory_entries=SUMMARY_CACHE_MEMORY_ENTRIES):
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        # Every worker process opens the same file; WAL lets them read while one writes
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "key TEXT PRIMARY KEY, summary TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_summaries_created_at ON summaries (created_at)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (summary, created_at)
+        self._inflight = {}
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_memory(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[1] + self.max_age < time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get(self, key):
+        summary = self.get_memory(key)
+        if summary is not None:
+            return summary
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, created_at FROM summaries WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.max_age),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def set(self, key, summary):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, size, created_at) VALUES (?, ?, ?, ?)",
+                (key, summary, len(summary.encode()), now),
+            )
+            self._conn.commit()
+            self._remember(key, summary, now)
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune(now)
+
+    def _remember(self, key, summary, created_at):
+        self._memory[key] = (summary, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self, now):
+        self._conn.execute("DELETE FROM summaries WHERE created_at < ?", (now - self.max_age,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total > self.max_bytes:
+            # Drop the oldest entries until we are back under the byte budget
+            rows = self._conn.execute("SELECT key, size FROM summaries ORDER BY created_at").fetchall()
+            stale = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                stale.append((key,))
+                total -= size
+                self._memory.pop(key, None)
+            self._conn.executemany("DELETE FROM summaries WHERE key = ?", stale)
+        self._conn.commit()
+
+    async def get_or_compute(self, key, compute):
+        summary = self.get_memory(key)
+        if summary is not None:
+            return summary
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            with self._lock:
+                self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            summary = await run_blocking(self.get, key)
+            if summary is None:
+                summary = await compute()
+                await run_blocking(self.set, key, summary)
+            future.set_result(summary)
+            return summary
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters get the error; don't warn if there were none
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self):
+        return {"memory_entries": len(self._memory), "hits": self.hits, "misses": self.misses,
+                "coalesced": self.coalesced}
+
+
+summary_cache = SummaryCache()
@@ -0,0 +1,160 @@
+import hashlib
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from comment_store import parse_published_at
+from database.database import SessionLocal
+from database.models import AISummary
+from open_ai import MODEL_PARAMS, build_final_prompt, build_update_prompt, complete
+from preprocess import preprocess_comments
+from summary_cache import normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+INCREMENTAL_SUMMARIES = os.environ.get("INCREMENTAL_SUMMARIES", "1") == "1"
+# Rebuild from scratch once the comments merged since the last full summary
+# exceed this fraction of the comments it was built from, or after this many
+# merges, so errors from repeated merging do not accumulate
+SUMMARY_DRIFT_RATIO = float(os.environ.get("SUMMARY_DRIFT_RATIO", "0.5"))
+SUMMARY_MAX_MERGES = int(os.environ.get("SUMMARY_MAX_MERGES", "10"))
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+
+
+class SummaryUpdate:
+    """What to send to the model for one summary request, and how to record the result.
+
+    Exactly one of `summary` (nothing new since the stored summary) and
+    `final_prompt` is set. After completing final_prompt, pass the result to
+    save().
+    """
+
+    def __init__(self, store, video_id, prompt, kind, watermark, comments, base=None,
+                 summary=None, final_prompt=None):
+        self.store = store
+        self.video_id = video_id
+        self.prompt = prompt
+        self.kind = kind  # "unchanged", "delta" or "full"
+        self.watermark = watermark
+        self.comments = comments  # how many comments this update covers
+        self.base = base  # watermark of the stored summary a delta builds on
+        self.summary = summary
+        self.final_prompt = final_prompt
+
+    def save(self, summary):
+        if self.kind != "unchanged":
+            self.store.save(self, summary)
+
+
+class SummaryStore:
+    """Latest summary per (video, prompt), for incremental updates.
+
+    Blocking; call through run_blocking.
+    """
+
+    def __init__(self, session_factory=SessionLocal, drift_ratio=SUMMARY_DRIFT_RATIO, max_merges=SUMMARY_MAX_MERGES):
+        self.session_factory = session_factory
+        self.drift_ratio = drift_ratio
+        self.max_merges = max_merges
+        self.updates = {"unchanged": 0, "delta": 0, "full": 0}
+
+    def _load(self, db, video_id, prompt):
+        return db.query(AISummary).filter(
+            AISummary.video_id == video_id, AISummary.prompt_hash == prompt_hash(prompt)
+        ).first()
+
+    def needs_rebuild(self, row, new_comments):
+        if row.model != MODEL_PARAMS["model"] or row.merges_since_rebuild >= self.max_merges:
+            return True
+        drift = row.comments_since_rebuild + new_comments
+        return drift > self.drift_ratio * max(row.comments_at_rebuild, 1)
+
+    def plan(self, video_id, prompt, records, incremental=True, complete_fn=complete):
+        """Decide between reusing, updating or rebuilding the stored summary.
+
+        `records` are comment records, as from CommentStore.recent(). Runs
+        any map step needed, so this can make model calls itself.
+        """
+        published = [parse_published_at(record['published_at']) for record in records]
+        watermark = max(published)
+        with self.session_factory() as db:
+            row = self._load(db, video_id, prompt) if incremental else None
+            if row is not None:
+                delta = [record for record, at in zip(records, published) if at > row.watermark]
+                base_summary, base_watermark = row.summary, row.watermark
+                # Comments older than the watermark that the summary never saw,
+                # e.g. backfilled for a request with a larger max_comments
+                covered = row.comments_at_rebuild + row.comments_since_rebuild
+                backfilled = len(records) - len(delta) > covered
+                rebuild = backfilled or self.needs_rebuild(row, len(delta))
+
+        if row is not None and not delta and not backfilled:
+            self.updates["unchanged"] += 1
+            return SummaryUpdate(self, video_id, prompt, "unchanged", base_watermark, 0, summary=base_summary)
+
+        if row is not None and not rebuild:
+            comments, stats = preprocess_comments(delta)
+            logger.info(f"Folding {len(delta)} new comments into the summary for {video_id}: {stats}")
+            if not comments:
+                # Only noise and duplicates arrived; just move the watermark
+                update = SummaryUpdate(self, video_id, prompt, "delta", watermark, len(delta), base=base_watermark,
+                                       summary=base_summary)
+                update.save(base_summary)
+                self.updates["unchanged"] += 1
+                return update
+            self.updates["delta"] += 1
+            final_prompt = build_update_prompt(base_summary, [c['text'] for c in comments], prompt, complete_fn)
+            return SummaryUpdate(self, video_id, prompt, "delta", watermark, len(delta), base=base_watermark,
+                                 final_prompt=final_prompt)
+
+        comments, stats = preprocess_comments(records)
+        logger.info(f"Preprocessed comments for {video_id}: {stats}")
+        self.updates["full"] += 1
+        final_prompt = build_final_prompt([c['text'] for c in comments], prompt, complete_fn)
+        return SummaryUpdate(self, video_id, prompt, "full", watermark, len(records), final_prompt=final_prompt)
+
+    def save(self, update, summary):
+        now = datetime.utcnow()
+        with self.session_factory() as db:
+            if update.kind == "delta":
+                # Only move forward from the summary this delta was built on;
+                # if another worker got there first, keep theirs
+                db.query(AISummary).filter(
+                    AISummary.video_id == update.video_id,
+                    AISummary.prompt_hash == prompt_hash(update.prompt),
+                    AISummary.watermark == update.base,
+                ).update({
+                    AISummary.summary: summary,
+                    AISummary.watermark: update.watermark,
+                    AISummary.comments_since_rebuild: AISummary.comments_since_rebuild + update.comments,
+                    AISummary.merges_since_rebuild: AISummary.merges_since_rebuild + 1,
+                    AISummary.updated_at: now,
+                }, synchronize_session=False)
+                db.commit()
+                return
+
+            row = self._load(db, update.video_id, update.prompt)
+            if row is None:
+                row = AISummary(video_id=update.video_id, prompt_hash=prompt_hash(update.prompt))
+                db.add(row)
+            elif row.watermark > update.watermark:
+                return  # a newer summary was stored meanwhile
+            row.model = MODEL_PARAMS["model"]
+            row.summary = summary
+            row.watermark = update.watermark
+            row.comments_at_rebuild = update.comments
+            row.comments_since_rebuild = 0
+            row.merges_since_rebuild = 0
+            row.rebuilt_at = now
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()  # another worker inserted the row first
+
+    def stats(self):
+        return dict(self.updates)
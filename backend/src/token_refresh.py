@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from concurrency import run_blocking
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Tokens are renewed this long before they expire
+REFRESH_MARGIN = timedelta(seconds=int(os.environ.get("TOKEN_REFRESH_MARGIN", "300")))
+REFRESH_INTERVAL = int(os.environ.get("TOKEN_REFRESH_INTERVAL", "30"))  # seconds between scans
+# Only sessions that made a request this recently are refreshed in the background
+ACTIVE_WINDOW = int(os.environ.get("TOKEN_REFRESH_ACTIVE_WINDOW", "900"))  # seconds
+MAX_CONCURRENT_REFRESHES = 8
+
+
+class TokenRefresher:
+    """Renews access tokens shortly before they expire.
+
+    Concurrent refreshes for the same user share one upstream call, whether
+    they come from the background scan or from a request.
+    """
+
+    def __init__(self, store, refresh_fn, margin=REFRESH_MARGIN, interval=REFRESH_INTERVAL,
+                 active_window=ACTIVE_WINDOW):
+        self.store = store
+        self.refresh_fn = refresh_fn
+        self.margin = margin
+        self.interval = interval
+        self.active_window = active_window
+        self._inflight = {}
+        self._background = set()
+        self._task = None
+        self.refreshes = 0
+        self.deduplicated = 0
+        self.failures = 0
+        # Seconds between the scheduled refresh time (expiry - margin) and the
+        # refresh finishing; positive means it was late
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def needs_refresh(self, user_data, now=None):
+        return user_data.token_expiry - self.margin <= (now or datetime.utcnow())
+
+    def is_expired(self, user_data, now=None):
+        return user_data.token_expiry <= (now or datetime.utcnow())
+
+    async def refresh(self, user_data):
+        pending = self._inflight.get(user_data.email)
+        if pending is not None:
+            self.deduplicated += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_data.email] = future
+        try:
+            await self._refresh(user_data)
+            future.set_result(user_data)
+            return user_data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.failures += 1
+            future.set_exception(e)
+            future.exception()  # waiters get the error; don't warn if there were none
+            raise
+        finally:
+            del self._inflight[user_data.email]
+
+    async def _refresh(self, user_data):
+        # Another worker may already have refreshed this session
+        current = await run_blocking(self.store.reload, user_data)
+        if current is not None and not self.needs_refresh(current) and current.access_token != user_data.access_token:
+            await run_blocking(self.store.update_token, user_data, current.access_token, current.token_expiry)
+            self.deduplicated += 1
+            return
+
+        scheduled_at = user_data.token_expiry - self.margin
+        with span("token_refresh"):
+            access_token, expiry = await run_blocking(self.refresh_fn, user_data.refresh_token)
+        await run_blocking(self.store.update_token, user_data, access_token, expiry)
+
+        lag = (datetime.utcnow() - scheduled_at).total_seconds()
+        self.refreshes += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+
+    async def _refresh_quietly(self, user_data):
+        try:
+            await self.refresh(user_data)
+        except Exception as e:
+            logger.warning(f"Background token refresh failed for {user_data.email}: {e}")
+
+    def schedule(self, user_data):
+        # Refresh in the background without making the caller wait
+        if user_data.email in self._inflight:
+            return
+        task = asyncio.get_running_loop().create_task(self._refresh_quietly(user_data))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def refresh_due(self):
+        due = self.store.due_sessions(datetime.utcnow() + self.margin, self.active_window)
+        if not due:
+            return
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REFRESHES)
+
+        async def refresh_one(user_data):
+            async with semaphore:
+                await self._refresh_quietly(user_data)
+
+        await asyncio.gather(*(refresh_one(u) for u in due))
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh_due()
+            except Exception as e:
+                logger.error(f"Token refresh scan failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "refreshes": self.refreshes,
+            "deduplicated": self.deduplicated,
+            "failures": self.failures,
+            "in_flight": len(self._inflight),
+            "avg_lag_seconds": self.total_lag / self.refreshes if self.refreshes else 0.0,
+            "max_lag_seconds": self.max_lag,
+        }
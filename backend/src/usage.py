@@ -0,0 +1,193 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from concurrency import run_blocking
+from lazy_imports import lazy_import
+
+# Imported on the first flush, so open_ai stays importable without a database
+sqlalchemy = lazy_import("sqlalchemy")
+database = lazy_import("database.database")
+models = lazy_import("database.models")
+
+logger = logging.getLogger(__name__)
+
+USAGE_FLUSH_INTERVAL = int(os.environ.get("USAGE_FLUSH_INTERVAL", "5"))  # seconds between writes
+MAX_BUFFERED = 10000  # records kept while the database is unreachable
+# May query usage across all users
+USAGE_ADMINS = {email.strip() for email in os.environ.get("USAGE_ADMINS", "").split(",") if email.strip()}
+
+# USD per million (prompt, completion) tokens, at list prices; models not
+# listed are reported with a cost of 0
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+GROUP_BY = ("user", "video", "model", "day")
+
+_scope = contextvars.ContextVar("usage_scope", default=(None, None))
+
+
+@contextmanager
+def usage_scope(user=None, video_id=None):
+    # OpenAI calls made inside the block are recorded against this user and video
+    token = _scope.set((user, video_id))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def bind_usage_scope(user=None, video_id=None):
+    # For code that cannot wrap a with block, such as a streaming response
+    # generator, which runs in a task of its own: applies until the task ends
+    _scope.set((user, video_id))
+
+
+def cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+class UsageLog:
+    """Tokens and latency of every OpenAI call, per user and video.
+
+    record() only buffers; a background task writes the buffer to the
+    openai_usage table every USAGE_FLUSH_INTERVAL seconds, so calls on the
+    request path never wait for the database.
+    """
+
+    def __init__(self, session_factory=None, interval=USAGE_FLUSH_INTERVAL, max_buffered=MAX_BUFFERED):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_buffered = max_buffered
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._task = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, model, kind, usage, seconds):
+        user, video_id = _scope.get()
+        row = {
+            "user_email": user,
+            "video_id": video_id,
+            "model": model,
+            "kind": kind,
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            # Embedding responses report prompt tokens only
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "latency_ms": round(seconds * 1000),
+            "created_at": datetime.utcnow(),
+        }
+        with self._lock:
+            self.recorded += 1
+            self._buffer.append(row)
+            if len(self._buffer) > self.max_buffered:
+                del self._buffer[0]
+                self.dropped += 1
+
+    def flush(self):
+        """Write buffered records. Blocking; call through run_blocking."""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        try:
+            with (self.session_factory or database.SessionLocal)() as db:
+                db.bulk_insert_mappings(models.OpenAIUsage, rows)
+                db.commit()
+        except Exception as e:
+            logger.warning(f"Writing {len(rows)} usage records failed, keeping them for the next flush: {e}")
+            with self._lock:
+                self._buffer[:0] = rows
+                overflow = len(self._buffer) - self.max_buffered
+                if overflow > 0:
+                    del self._buffer[:overflow]
+                    self.dropped += overflow
+            return 0
+        self.written += len(rows)
+        return len(rows)
+
+    def summary(self, group_by="video", user=None, video_id=None, since=None):
+        """Totals per group, largest cost first. Blocking; call through run_blocking.
+
+        `since` is a datetime; `user` and `video_id` restrict the records counted.
+        """
+        self.flush()  # include this worker's latest calls
+        table = models.OpenAIUsage
+        func = sqlalchemy.func
+        group = {
+            "user": table.user_email,
+            "video": table.video_id,
+            "model": table.model,
+            "day": func.date(table.created_at),
+        }[group_by]
+        query_columns = [group, table.model, func.count(table.id), func.sum(table.prompt_tokens),
+                         func.sum(table.completion_tokens), func.sum(table.latency_ms), func.max(table.latency_ms)]
+        with (self.session_factory or database.SessionLocal)() as db:
+            query = db.query(*query_columns)
+            if user is not None:
+                query = query.filter(table.user_email == user)
+            if video_id is not None:
+                query = query.filter(table.video_id == video_id)
+            if since is not None:
+                query = query.filter(table.created_at >= since)
+            rows = query.group_by(group, table.model).all()
+
+        totals = {}
+        for key, model, calls, prompt_tokens, completion_tokens, latency_ms, max_latency_ms in rows:
+            key = str(key) if key is not None else None
+            entry = totals.setdefault(key, {
+                group_by: key, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "latency_ms": 0, "max_latency_ms": 0, "cost_usd": 0.0, "models": {},
+            })
+            entry["calls"] += calls
+            entry["prompt_tokens"] += prompt_tokens or 0
+            entry["completion_tokens"] += completion_tokens or 0
+            entry["latency_ms"] += latency_ms or 0
+            entry["max_latency_ms"] = max(entry["max_latency_ms"], max_latency_ms or 0)
+            entry["cost_usd"] += cost(model, prompt_tokens or 0, completion_tokens or 0)
+            entry["models"][model] = entry["models"].get(model, 0) + calls
+        for entry in totals.values():
+            entry["mean_latency_ms"] = round(entry.pop("latency_ms") / entry["calls"])
+            entry["cost_usd"] = round(entry["cost_usd"], 6)
+        return sorted(totals.values(), key=lambda entry: entry["cost_usd"], reverse=True)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await run_blocking(self.flush)
+            except Exception as e:
+                logger.error(f"Usage flush failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await run_blocking(self.flush)
+
+    def stats(self):
+        return {"recorded": self.recorded, "written": self.written, "dropped": self.dropped,
+                "buffered": len(self._buffer)}
+
+
+usage_log = UsageLog()
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import os
+import time
+
+from concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# When the heavy libraries get loaded and the upstream clients built:
+#   background - the worker takes requests at once and warms up after startup
+#   eager      - startup waits for the warm-up, so the first request is fast
+#   off        - everything is loaded on first use
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background")
+
+
+class WarmUp:
+    """Named steps that load libraries and build clients ahead of the first request.
+
+    Steps run in order on the blocking pool. One that fails is retried the
+    next time the warm-up is started; /ready reports the outcome.
+    """
+
+    def __init__(self, mode=STARTUP_MODE):
+        self.mode = mode
+        self.steps = {}  # name -> function
+        self.results = {}  # name -> {"ok": bool, "seconds" or "error"}
+        self._task = None
+
+    def step(self, name):
+        def register(func):
+            self.steps[name] = func
+            return func
+        return register
+
+    async def run(self):
+        for name, func in self.steps.items():
+            if self.results.get(name, {}).get("ok"):
+                continue
+            started = time.perf_counter()
+            try:
+                await run_blocking(func)
+            except Exception as e:
+                logger.warning(f"Warm-up step {name} failed: {e}")
+                self.results[name] = {"ok": False, "error": str(e)}
+            else:
+                self.results[name] = {"ok": True, "seconds": round(time.perf_counter() - started, 3)}
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        # In the background; a no-op while a run is in progress
+        if not self.running:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def on_startup(self):
+        if self.mode == "eager":
+            await self.run()
+        elif self.mode == "background":
+            self.start()
+
+    @property
+    def ready(self):
+        if self.mode == "off":
+            return True
+        return all(self.results.get(name, {}).get("ok") for name in self.steps)
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "mode": self.mode,
+            "running": self.running,
+            "steps": {name: self.results.get(name, {"ok": None}) for name in self.steps},
+        }
@@ -1,47 +1,259 @@
 # youtube.py
-from googleapiclient.discovery import build
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.errors import HttpError
 
 # Environment variables
-from config import YOUTUBE_API_KEY,YOUTUBE_API_SERVICE_NAME,YOUTUBE_API_VERSION
-
-def get_video_comments(video_id):
-    youtube = build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION, developerKey=YOUTUBE_API_KEY)
-
-    # Get the comments
-    response = youtube.commentThreads().list(
-        part="snippet",
-        videoId=video_id,
-        maxResults=40
-    ).execute()
-
-    # Extract the comments, and store them in a list
-    comments = []
-    for item in response['items']:
-        comment = item['snippet']['topLevelComment']['snippet']['textDisplay']
-        comments.append(comment)
-
-    return comments
-
-def get_channel_videos(channel_id):
-    youtube = build(YOUTUBE_API_SERVICE_NAME, YOUTUBE_API_VERSION, developerKey=YOUTUBE_API_KEY)
-
-    # Fetch the videos from the channel
-    response = youtube.search().list(
-        channelId=channel_id,
-        part='id,snippet',
-        maxResults=15,
-        order='date'
-    ).execute()
-
-    # Parse the response and return videos
+import config
+from lazy_imports import lazy_import
+from metrics import span
+
+# Loaded on first use or by the warm-up hook; discovery alone is a large
+# share of the app's import time
+httplib2 = lazy_import("httplib2")
+google_auth_httplib2 = lazy_import("google_auth_httplib2")
+discovery = lazy_import("googleapiclient.discovery")
+
+HTTP_TIMEOUT = 30  # seconds
+COMMENT_PAGE_SIZE = 100  # commentThreads.list maximum
+VIDEO_PAGE_SIZE = 50  # playlistItems.list and videos.list maximum
+# Default cap on comments walked per request; each page costs one quota unit
+MAX_COMMENTS = int(os.environ.get("MAX_COMMENTS", "2000"))
+
+# Discovery clients are built once per process. Per-user credentials are not
+# baked into the client; they are attached at execute() time instead:
+#   execute(get_service().search().list(...), credentials)
+_services = {}
+_services_lock = threading.Lock()
+# httplib2.Http is not thread-safe, so each thread keeps its own keep-alive pool
+_local = threading.local()
+_prefetch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="comment-prefetch")
+# Bucket charged with the quota units of every request sent (see set_quota_meter)
+_quota_meter = None
+
+def _thread_http():
+    http = getattr(_local, "http", None)
+    if http is None:
+        http = httplib2.Http(timeout=HTTP_TIMEOUT)
+        _local.http = http
+    return http
+
+def get_service(name=None, version=None, developer_key=None):
+    name = name or config.YOUTUBE_API_SERVICE_NAME
+    version = version or config.YOUTUBE_API_VERSION
+    key = (name, version, developer_key)
+    service = _services.get(key)
+    if service is None:
+        with _services_lock:
+            service = _services.get(key)
+            if service is None:
+                endpoint = config.GOOGLE_API_ENDPOINT
+                client_options = {"api_endpoint": endpoint} if endpoint else None
+                with span("youtube_build"):
+                    service = discovery.build(name, version, http=_thread_http(), developerKey=developer_key,
+                                              client_options=client_options, cache_discovery=False)
+                _services[key] = service
+    return service
+
+def authorized_http(credentials):
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=_thread_http())
+
+def preload():
+    # Called by the warm-up hook: import the client libraries and build the
+    # default service so the first request does not pay for either
+    google_auth_httplib2.AuthorizedHttp
+    get_service()
+
+def set_quota_meter(bucket):
+    # A rate_limit.TokenBucket holding the project's YouTube quota
+    global _quota_meter
+    _quota_meter = bucket
+
+def execute(request, credentials=None, units=1):
+    # Must run on the thread that does the I/O: the keep-alive pool is per thread.
+    # `units` is the request's quota cost; every list call used here costs 1.
+    http = authorized_http(credentials) if credentials is not None else _thread_http()
+    try:
+        with span("youtube_execute"):
+            return request.execute(http=http)
+    except HttpError as e:
+        if e.resp.status == 304:
+            units = 0  # a revalidated cache entry costs no quota
+        raise
+    finally:
+        if units and _quota_meter is not None:
+            _quota_meter.charge(units)
+
+def cached_execute(cache, key, request, credentials=None):
+    entry = cache.get_entry(key)
+    if entry is not None and entry.is_fresh():
+        cache.count("hits")
+        return entry.value
+
+    if entry is not None and entry.etag:
+        # Stale entry: ask YouTube whether it changed. A 304 costs no quota.
+        request.headers["If-None-Match"] = entry.etag
+        try:
+            response = execute(request, credentials)
+        except HttpError as e:
+            if e.resp.status != 304:
+                raise
+            cache.count("revalidations")
+            cache.touch(key)
+            return entry.value
+    else:
+        response = execute(request, credentials)
+
+    cache.count("misses")
+    cache.set(key, response, etag=response.get("etag"))
+    return response
+
+def comment_record(item):
+    snippet = item['snippet']['topLevelComment']['snippet']
+    return {
+        'id': item['id'],
+        'text': snippet['textDisplay'],
+        'author': snippet.get('authorDisplayName'),
+        'like_count': snippet.get('likeCount', 0),
+        'published_at': snippet.get('publishedAt'),
+    }
+
+def fetch_comment_page(video_id, page_token=None, page_size=COMMENT_PAGE_SIZE, order="relevance",
+                       credentials=None, cache=None, viewer=None):
+    # `viewer` scopes cached pages to one user: YouTube decides per user who
+    # may read a private or unlisted video's comments. Leave it None only when
+    # the caller has already checked this user's access.
+    youtube = get_service() if credentials is not None else get_service(developer_key=config.YOUTUBE_API_KEY)
+    params = dict(part="snippet", videoId=video_id, maxResults=min(page_size, COMMENT_PAGE_SIZE), order=order)
+    if page_token:
+        params["pageToken"] = page_token
+    request = youtube.commentThreads().list(**params)
+    if cache is None:
+        return execute(request, credentials)
+    return cached_execute(cache, (video_id, page_token, params["maxResults"], order, viewer), request, credentials)
+
+def iter_video_comments(video_id, credentials=None, page_size=COMMENT_PAGE_SIZE, max_comments=MAX_COMMENTS,
+                        max_pages=None, order="relevance", prefetch=False, cache=None, viewer=None):
+    """Yield comment records page by page, following nextPageToken.
+
+    Stops after max_comments comments or max_pages pages (the quota budget),
+    whichever comes first. With prefetch=True the next page is requested in
+    the background while the caller consumes the current one. Only the page
+    being consumed and the one in flight are held in memory.
+    """
+    def fetch(page_token):
+        return fetch_comment_page(video_id, page_token, page_size, order, credentials, cache, viewer)
+
+    yielded = 0
+    pages = 1
+    response = fetch(None)
+    while True:
+        next_token = response.get('nextPageToken')
+        has_budget = (max_pages is None or pages < max_pages) and (
+            max_comments is None or yielded + len(response.get('items', [])) < max_comments)
+        pending = None
+        if prefetch and next_token and has_budget:
+            pending = _prefetch_executor.submit(fetch, next_token)
+
+        page_done = False
+        try:
+            for item in response.get('items', []):
+                if max_comments is not None and yielded >= max_comments:
+                    return
+                yield comment_record(item)
+                yielded += 1
+            page_done = True
+        finally:
+            # The consumer stopped early (or failed): drop the prefetched page
+            if pending is not None and not page_done:
+                pending.cancel()
+
+        if not next_token or not has_budget:
+            return
+        response = pending.result() if pending is not None else fetch(next_token)
+        pages += 1
+
+def get_video_comments(video_id, max_comments=MAX_COMMENTS):
+    return [comment['text'] for comment in iter_video_comments(video_id, max_comments=max_comments)]
+
+def uploads_playlist_id(channel_id, credentials=None, cache=None):
+    youtube = get_service() if credentials is not None else get_service(developer_key=config.YOUTUBE_API_KEY)
+    request = youtube.channels().list(id=channel_id, part="contentDetails")
+    if cache is None:
+        response = execute(request, credentials)
+    else:
+        response = cached_execute(cache, ("uploads", channel_id), request, credentials)
+    if not response.get('items'):
+        return None
+    return response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+
+def _thumbnail(snippet):
+    thumbnails = snippet.get('thumbnails', {})
+    for size in ('high', 'medium', 'default'):
+        if size in thumbnails:
+            return thumbnails[size]['url']
+    return None
+
+def get_video_details(video_ids, credentials=None, cache=None):
+    # videos.list accepts up to 50 ids per call (1 quota unit each call)
+    youtube = get_service() if credentials is not None else get_service(developer_key=config.YOUTUBE_API_KEY)
+    details = {}
+    for start in range(0, len(video_ids), VIDEO_PAGE_SIZE):
+        batch = video_ids[start:start + VIDEO_PAGE_SIZE]
+        request = youtube.videos().list(id=",".join(batch), part="statistics,contentDetails",
+                                        maxResults=VIDEO_PAGE_SIZE)
+        if cache is None:
+            response = execute(request, credentials)
+        else:
+            response = cached_execute(cache, ("details", tuple(batch)), request, credentials)
+        for item in response.get('items', []):
+            details[item['id']] = item
+    return details
+
+def list_channel_videos(playlist_id, page_token=None, page_size=VIDEO_PAGE_SIZE, credentials=None, cache=None):
+    """One page of a channel's uploads, newest first, with statistics.
+
+    Reads the uploads playlist (1 quota unit) and hydrates it with a batched
+    videos.list call (1 unit), instead of search.list (100 units).
+    """
+    youtube = get_service() if credentials is not None else get_service(developer_key=config.YOUTUBE_API_KEY)
+    params = dict(playlistId=playlist_id, part="snippet,contentDetails", maxResults=min(page_size, VIDEO_PAGE_SIZE))
+    if page_token:
+        params["pageToken"] = page_token
+    request = youtube.playlistItems().list(**params)
+    if cache is None:
+        response = execute(request, credentials)
+    else:
+        response = cached_execute(cache, (playlist_id, page_token, params["maxResults"]), request, credentials)
+
+    items = response.get('items', [])
+    details = get_video_details([item['contentDetails']['videoId'] for item in items], credentials, cache)
+
     videos = []
-    for item in response['items']:
-        video_data = {
-            'title': item['snippet']['title'],
-            'videoId': item['id']['videoId'],
-            'thumbnail': item['snippet']['thumbnails']['high']['url'],
-            'description': item['snippet']['description']
-        }
-        videos.append(video_data)
-
-    return videos
+    for item in items:
+        video_id = item['contentDetails']['videoId']
+        detail = details.get(video_id)
+        if detail is None:
+            continue  # private or deleted video still listed in the playlist
+        snippet = item['snippet']
+        statistics = detail.get('statistics', {})
+        videos.append({
+            'title': snippet['title'],
+            'videoId': video_id,
+            'thumbnail': _thumbnail(snippet),
+            'description': snippet['description'],
+            'publishedAt': item['contentDetails'].get('videoPublishedAt', snippet.get('publishedAt')),
+            'duration': detail.get('contentDetails', {}).get('duration'),
+            'viewCount': int(statistics.get('viewCount', 0)),
+            'likeCount': int(statistics.get('likeCount', 0)),
+            'commentCount': int(statistics.get('commentCount', 0)),
+        })
+    return {'videos': videos, 'next_page_token': response.get('nextPageToken')}
+
+def get_channel_videos(channel_id, max_results=15):
+    playlist_id = uploads_playlist_id(channel_id)
+    if playlist_id is None:
+        return []
+    return list_channel_videos(playlist_id, page_size=max_results)['videos']
@@ -0,0 +1,11 @@
+import os
+import sys
+
+HERE = os.path.dirname(__file__)
+# The app modules import each other by top-level name, as when run from src/;
+# the upstream stubs are shared with the benchmarks
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, "..", "bench"))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+# database.database builds its engine at import; no PostgreSQL in the tests
+os.environ.setdefault("DATABASE_URL", "sqlite://")
@@ -0,0 +1,34 @@
+# Local sentiment and theme answers (analytics.py)
+import pytest
+
+pytest.importorskip("numpy")
+
+from analytics import analyze_comments, local_answer
+
+AUDIO = ["The audio is so muffled I could barely follow along", "Audio sounds muffled, please fix the mic",
+         "Great content but the audio was muffled the whole time", "Why is the audio this muffled?",
+         "Muffled audio ruined it for me", "Can barely hear anything, the audio is muffled",
+         "The muffled audio makes the tutorial hard to follow", "Please check your audio, it's really muffled",
+         "Turned the volume up and the audio is still muffled", "Audio quality dropped, everything sounds muffled"]
+OTHER = ["Liked the editing and the jokes", "The editing is top notch, jokes landed too",
+         "Loved the jokes, editing was slick", "Editing and jokes made my day",
+         "Those jokes plus this editing, perfect", "The jokes were hilarious and the editing tight",
+         "Clever editing, funny jokes", "The editing pace and the jokes were great"]
+
+
+def test_majority_topic_leads_the_themes():
+    # 60 of 100 comments are about the audio: it must not be dropped as too common
+    texts = [AUDIO[i % len(AUDIO)] for i in range(60)] + [OTHER[i % len(OTHER)] for i in range(40)]
+    result = analyze_comments([{"id": str(i), "text": text} for i, text in enumerate(texts)])
+    answer = local_answer({"themes"}, result)
+    assert "audio" in result["topics"][0]["terms"]
+    assert result["keywords"][0]["term"] in ("audio", "muffled")
+    assert "audio" in answer
+
+
+def test_no_themes_falls_through_to_the_model():
+    # Three unrelated comments share no term
+    texts = ["Great tutorial on sourdough starters", "My cat watched this with me",
+             "Which camera did you use for filming?"]
+    records = [{"id": str(i), "text": text} for i, text in enumerate(texts)]
+    assert local_answer({"themes"}, analyze_comments(records)) is None
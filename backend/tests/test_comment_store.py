@@ -0,0 +1,68 @@
+# Incremental comment syncs (comment_store.CommentStore) against the stub
+# YouTube endpoint and a SQLite database
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("googleapiclient")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import config
+import youtube
+from comment_store import CommentStore
+from database.database import Base
+from database.models import Comment
+from stubs import start_stub_server
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server, base_url = start_stub_server(latency=0, comments_per_video=250)
+    monkeypatch.setenv("YOUTUBE_API_KEY", "test")
+    monkeypatch.setenv("YOUTUBE_API_SERVICE_NAME", "youtube")
+    monkeypatch.setenv("YOUTUBE_API_VERSION", "v3")
+    monkeypatch.setattr(config, "GOOGLE_API_ENDPOINT", base_url)
+    monkeypatch.setattr(youtube, "_services", {})  # clients for this stub
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'comments.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def stored(session_factory):
+    # Stub comment indices held for video1; newer comments have higher indices
+    with session_factory() as db:
+        return sorted(int(comment_id.rsplit("-c", 1)[1]) for (comment_id,) in db.query(Comment.id))
+
+
+def test_sync_walks_every_new_comment_past_max_comments(stub, session_factory):
+    store = CommentStore(session_factory, sync_interval=timedelta(0), max_sync_pages=10)
+    store.comments("video1", max_comments=100)
+    assert stored(session_factory) == list(range(150, 250))
+
+    stub.comments_per_video = 500  # 250 new comments, more than max_comments
+    store.comments("video1", max_comments=100)
+    assert stored(session_factory) == list(range(150, 500))
+
+
+def test_capped_sync_resyncs_the_older_comments(stub, session_factory):
+    store = CommentStore(session_factory, sync_interval=timedelta(0), max_sync_pages=2)
+    store.comments("video1", max_comments=100)
+
+    stub.comments_per_video = 750  # 500 new comments, more than two pages
+    records = store.comments("video1", max_comments=100)
+    # The stored comments from before no longer join up with the new ones
+    assert stored(session_factory) == list(range(550, 750))
+    assert [record["id"] for record in records] == [f"video1-c{i}" for i in range(749, 649, -1)]
+
+    # A later request for more backfills from where the capped walk stopped
+    store.comments("video1", max_comments=400)
+    assert stored(session_factory) == list(range(350, 750))
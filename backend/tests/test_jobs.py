@@ -0,0 +1,175 @@
+# Multi-video summary jobs (jobs.JobManager) over a stub model
+import asyncio
+from types import SimpleNamespace
+
+from concurrency import run_blocking
+from jobs import JobManager
+from rate_limit import RateLimited, TokenBucket
+from shared_state import MemoryState
+from stubs import StubModel
+
+USER = SimpleNamespace(email="viewer@example.com")
+
+
+def summarizer(model, fail=(), rate_limited=()):
+    # Stands in for main.summarize_video: one stub model call per video
+    limited = set(rate_limited)
+
+    async def summarize_video(user_data, video_id, prompt, max_comments):
+        if video_id in fail:
+            raise ValueError(f"no comments for {video_id}")
+        if video_id in limited:
+            limited.discard(video_id)
+            raise RateLimited("openai:in_flight", 0.01)
+        return await run_blocking(model, f"{prompt} {video_id}")
+
+    return summarize_video
+
+
+async def finished(manager, job, timeout=5):
+    await asyncio.wait_for(asyncio.shield(job.task), timeout)
+    return await manager.snapshot(job.id, USER.email)
+
+
+def test_job_summarizes_each_video_once():
+    async def scenario():
+        model = StubModel(latency=0.01)
+        manager = JobManager(summarizer(model), workers=2)
+        job = manager.submit(USER, ["a", "b", "a", "c"], "Themes?", 100)
+        return model, await finished(manager, job)
+
+    model, job = asyncio.run(scenario())
+    assert job["status"] == "done"
+    assert (job["total"], job["completed"], job["failed"]) == (3, 3, 0)
+    assert set(job["results"]) == {"a", "b", "c"}
+    assert model.calls == 3
+
+
+def test_failed_videos_are_reported_alongside_partial_results():
+    async def scenario():
+        manager = JobManager(summarizer(StubModel(latency=0), fail={"b"}))
+        job = manager.submit(USER, ["a", "b", "c"], "Themes?", 100)
+        return await finished(manager, job)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "done"
+    assert (job["completed"], job["failed"]) == (2, 1)
+    assert "error" in job["results"]["b"] and "summary" in job["results"]["a"]
+
+
+def test_rate_limited_videos_are_retried_not_failed():
+    async def scenario():
+        model = StubModel(latency=0)
+        manager = JobManager(summarizer(model, rate_limited={"a"}))
+        job = manager.submit(USER, ["a"], "Themes?", 100)
+        return model, await finished(manager, job)
+
+    model, job = asyncio.run(scenario())
+    assert job["results"]["a"] == {"summary": model.summary_text}
+
+
+def test_cancel_stops_remaining_videos_and_keeps_results():
+    async def scenario():
+        model = StubModel(latency=0.2)
+        manager = JobManager(summarizer(model), workers=1)
+        job = manager.submit(USER, [f"v{i}" for i in range(10)], "Themes?", 100)
+        while not job.results:
+            await asyncio.sleep(0.01)
+        cancelled = await manager.cancel(job.id, USER.email)
+        await asyncio.gather(job.task, return_exceptions=True)
+        return cancelled, await manager.snapshot(job.id, USER.email)
+
+    cancelled, job = asyncio.run(scenario())
+    assert cancelled["status"] == "running"
+    assert job["status"] == "cancelled"
+    assert job["finished_at"] is not None
+    assert 1 <= job["completed"] < 10
+
+
+def test_jobs_are_only_visible_to_their_owner():
+    async def scenario():
+        manager = JobManager(summarizer(StubModel(latency=0)))
+        job = manager.submit(USER, ["a"], "Themes?", 100)
+        await finished(manager, job)
+        return await manager.snapshot(job.id, "someone@example.com"), await manager.cancel(job.id, "someone@example.com")
+
+    assert asyncio.run(scenario()) == (None, None)
+
+
+def test_user_quota_spreads_videos_out():
+    # 100 comments cost 2 units per video; a burst of 4 admits two videos, and
+    # the bucket refills far too slowly for a third during the test
+    async def scenario():
+        model = StubModel(latency=0)
+        manager = JobManager(summarizer(model), quota_per_minute=0.6, quota_burst=4)
+        job = manager.submit(USER, ["a", "b", "c"], "Themes?", 100)
+        await asyncio.sleep(0.3)
+        progress = await manager.snapshot(job.id, USER.email)
+        await manager.cancel(job.id, USER.email)
+        await asyncio.gather(job.task, return_exceptions=True)
+        return model, progress
+
+    model, progress = asyncio.run(scenario())
+    assert progress["status"] == "running"
+    assert progress["completed"] == 2
+    assert model.calls == 2
+
+
+def test_jobs_leave_the_reserve_to_interactive_requests():
+    # Each video spends 20 units of a 100-unit project bucket that barely
+    # refills; with half held back, the fourth video has to wait
+    async def scenario():
+        upstream = TokenBucket(rate=0.001, capacity=100)
+        summarize = summarizer(StubModel(latency=0))
+
+        async def spending(user_data, video_id, prompt, max_comments):
+            upstream.charge(20)  # as youtube.execute would for the pages fetched
+            return await summarize(user_data, video_id, prompt, max_comments)
+
+        manager = JobManager(spending, workers=1, upstream_quota=upstream, upstream_reserve=0.5)
+        job = manager.submit(USER, ["a", "b", "c", "d", "e"], "Themes?", 100)
+        await asyncio.sleep(0.3)
+        progress = await manager.snapshot(job.id, USER.email)
+        await manager.cancel(job.id, USER.email)
+        await asyncio.gather(job.task, return_exceptions=True)
+        return progress, upstream.tokens
+
+    progress, left = asyncio.run(scenario())
+    assert progress["status"] == "running"
+    assert progress["completed"] == 3
+    assert left >= 40
+
+
+def test_active_jobs_per_user_are_capped():
+    async def scenario():
+        manager = JobManager(summarizer(StubModel(latency=0.05)), max_active_per_user=2)
+        first = manager.submit(USER, ["a"], "Themes?", 100)
+        manager.submit(USER, ["b"], "Themes?", 100)
+        try:
+            manager.submit(USER, ["c"], "Themes?", 100)
+        except RateLimited as e:
+            rejected = e
+        other = manager.submit(SimpleNamespace(email="other@example.com"), ["c"], "Themes?", 100)
+        await finished(manager, first)
+        again = manager.submit(USER, ["c"], "Themes?", 100)
+        await asyncio.gather(*(job.task for job in manager._jobs.values()))
+        return rejected, other, again
+
+    rejected, other, again = asyncio.run(scenario())
+    assert rejected.reason == "jobs"
+    assert other.status == again.status == "done"
+
+
+def test_progress_is_published_to_shared_state():
+    # Another worker process answers polls from the published snapshot
+    async def scenario():
+        state = MemoryState()
+        runner = JobManager(summarizer(StubModel(latency=0)), state=state)
+        other_worker = JobManager(summarizer(StubModel(latency=0)), state=state)
+        job = runner.submit(USER, ["a", "b"], "Themes?", 100)
+        await finished(runner, job)
+        return await other_worker.snapshot(job.id, USER.email), await other_worker.snapshot(job.id, "x@example.com")
+
+    published, foreign = asyncio.run(scenario())
+    assert published["status"] == "done" and published["completed"] == 2
+    assert foreign is None
@@ -0,0 +1,59 @@
+# Map-reduce summarization (open_ai.build_final_prompt) with a stub model
+import pytest
+
+from open_ai import build_final_prompt, chunk_texts, estimate_tokens, summarize_comments
+from stubs import StubModel
+
+PROMPT = "What do viewers think of the audio?"
+
+
+def comments(count, chars=400):
+    # ~100 tokens each
+    return [f"comment {i} " + "x" * (chars - len(f"comment {i} ")) for i in range(count)]
+
+
+def test_chunks_stay_within_budget():
+    texts = comments(25)
+    chunks = chunk_texts(texts, token_budget=1000)
+    assert [text for chunk in chunks for text in chunk] == texts
+    assert all(sum(estimate_tokens(text) for text in chunk) <= 1000 for chunk in chunks)
+    assert len(chunks) == 3
+
+
+def test_oversized_comment_is_truncated_to_the_budget():
+    [[text]] = chunk_texts(["y" * 10_000], token_budget=100)
+    assert len(text) == 400
+
+
+def test_small_sets_need_no_map_step():
+    model = StubModel(latency=0)
+    prompt = build_final_prompt(comments(5), PROMPT, model, chunk_tokens=3000)
+    assert model.calls == 0
+    assert prompt.startswith(PROMPT)
+    assert all(comment in prompt for comment in comments(5))
+
+
+def test_one_map_call_per_chunk_then_a_reduce_prompt():
+    model = StubModel(latency=0, summary_text="partial")
+    texts = comments(25)
+    prompt = build_final_prompt(texts, PROMPT, model, chunk_tokens=1000)
+    assert model.calls == len(chunk_texts(texts, 1000)) == 3
+    assert "Part 1:\npartial" in prompt and "Part 3:\npartial" in prompt
+    assert texts[0] not in prompt
+
+
+def test_partials_that_do_not_fit_are_reduced_in_rounds():
+    # Each partial is ~100 tokens, so two fit a 250-token chunk:
+    # 8 map calls, then reduce rounds of 4 and 2 calls, then the final prompt
+    model = StubModel(latency=0, summary_text="s" * 400)
+    prompt = build_final_prompt(comments(16), PROMPT, model, chunk_tokens=250)
+    assert model.calls == 8 + 4 + 2
+    assert prompt.count("Part ") == 2
+
+
+@pytest.mark.parametrize("parallelism", [1, 4])
+def test_summarize_returns_the_models_answer(parallelism):
+    model = StubModel(latency=0, summary_text="Viewers liked the audio.")
+    assert summarize_comments(comments(25), PROMPT, model, chunk_tokens=1000,
+                              parallelism=parallelism) == "Viewers liked the audio."
+    assert model.calls == 3 + 1
@@ -0,0 +1,108 @@
+# with_retries against the stub OpenAI endpoint, with injected failures
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import open_ai
+from open_ai import MODEL_PARAMS, _messages, with_retries
+from stubs import start_stub_server
+
+openai = pytest.importorskip("openai")
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    # Backoff sleeps, recorded instead of slept (in open_ai only; the stub
+    # server shares the time module)
+    slept = []
+    monkeypatch.setattr(open_ai, "time", SimpleNamespace(sleep=slept.append, perf_counter=time.perf_counter))
+    return slept
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    servers = []
+
+    def start(**kwargs):
+        server, base_url = start_stub_server(latency=0, **kwargs)
+        servers.append(server)
+        monkeypatch.setenv("OPENAI_BASE_URL", f"{base_url}/v1")
+        monkeypatch.setattr(open_ai, "_client", None)  # a client for this stub
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def create(max_retries=3, deadline=open_ai.OPENAI_DEADLINE):
+    client = open_ai.get_client()
+    return with_retries(lambda timeout: client.chat.completions.create(messages=_messages("hi"), timeout=timeout,
+                                                                       **MODEL_PARAMS),
+                        max_retries=max_retries, deadline=deadline)
+
+
+def test_retries_injected_server_errors(stub, delays):
+    server = stub(fail_first=2, error_status=503)
+    response = create()
+    assert response.choices[0].message.content == server.summary_text
+    assert server.request_counts["completions"] == 3
+    assert len(delays) == 2
+
+
+def test_backoff_honours_retry_after(stub, delays):
+    server = stub(fail_first=1, error_status=429, retry_after=3)
+    create()
+    assert server.request_counts["completions"] == 2
+    assert delays[0] >= 3
+
+
+def test_retry_after_is_capped(stub, delays, monkeypatch):
+    monkeypatch.setattr(open_ai, "RETRY_MAX_DELAY", 5.0)
+    stub(fail_first=1, error_status=429, retry_after=3600)
+    create()
+    assert delays == [5.0]
+
+
+def test_backoff_grows_without_retry_after(stub, delays, monkeypatch):
+    # Full jitter draws from [0, base * 2**attempt]; take the upper end
+    monkeypatch.setattr(open_ai.random, "uniform", lambda low, high: high)
+    stub(fail_first=3, error_status=500)
+    create()
+    assert delays == [open_ai.RETRY_BASE_DELAY * 2 ** attempt for attempt in range(3)]
+
+
+def test_gives_up_after_max_retries(stub, delays):
+    server = stub(error_rate=1.0, error_status=429)
+    with pytest.raises(openai.RateLimitError):
+        create(max_retries=2)
+    assert server.request_counts["completions"] == 3
+
+
+def test_client_errors_are_not_retried(stub, delays):
+    server = stub(fail_first=1, error_status=400)
+    with pytest.raises(openai.BadRequestError):
+        create()
+    assert server.request_counts["completions"] == 1
+    assert delays == []
+
+
+def test_deadline_bounds_a_hung_attempt(stub, delays):
+    # The attempt's timeout shrinks to what is left of the deadline, and no
+    # retry starts once it has passed
+    server = stub()
+    server.latency = 5
+    started = time.perf_counter()
+    with pytest.raises(openai.APITimeoutError):
+        create(deadline=0.5)
+    assert time.perf_counter() - started < 3
+    assert delays == []
+
+
+def test_no_retry_when_backoff_passes_the_deadline(stub, delays):
+    server = stub(fail_first=1, error_status=429, retry_after=10)
+    with pytest.raises(openai.RateLimitError):
+        create(deadline=5)
+    assert server.request_counts["completions"] == 1
+    assert delays == []
@@ -0,0 +1,78 @@
+# Admission control (rate_limit.AdmissionControl) and its token buckets
+import threading
+import time
+
+import pytest
+
+from open_ai import build_final_prompt
+from rate_limit import AdmissionControl, RateLimited, TokenBucket
+
+
+def test_check_takes_nothing():
+    bucket = TokenBucket(rate=1, capacity=5)
+    assert bucket.check(5) == (True, 0.0)
+    assert bucket.try_acquire(5)[0]
+
+
+def test_charge_may_leave_the_bucket_in_debt():
+    bucket = TokenBucket(rate=1, capacity=5)
+    bucket.charge(8)
+    available, wait = bucket.check()
+    assert not available
+    assert 3.9 < wait <= 4.0
+
+
+def test_admission_only_checks_youtube_quota():
+    admission = AdmissionControl(youtube_per_day=86400, youtube_burst=20)
+    for _ in range(5):
+        admission.admit("comments", "viewer@example.com", youtube=True)
+    assert admission.youtube.tokens > 19.9  # served from caches: nothing spent
+
+    admission.youtube.charge(25)  # pages actually fetched
+    with pytest.raises(RateLimited) as raised:
+        admission.admit("comments", "other@example.com", youtube=True)
+    assert raised.value.reason == "youtube"
+
+
+def test_each_map_call_takes_its_own_openai_slot():
+    admission = AdmissionControl(openai_per_minute=60000, openai_in_flight=2)
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+
+    def complete(prompt):
+        # As open_ai.complete does through set_completion_gate
+        with admission.openai_slot():
+            with lock:
+                in_flight.append(prompt)
+                peak.append(len(in_flight))
+            time.sleep(0.02)
+            with lock:
+                in_flight.remove(prompt)
+        return "partial"
+
+    comments = [f"comment {i} " + "word " * 40 for i in range(200)]
+    build_final_prompt(comments, "Summarize", complete_fn=complete, chunk_tokens=200, parallelism=4)
+    assert len(peak) > 2
+    assert max(peak) == 2
+    assert admission.rejected == {}
+
+
+def test_openai_slot_gives_up_after_its_timeout():
+    admission = AdmissionControl(openai_in_flight=1)
+    admission.acquire_openai()
+    with pytest.raises(RateLimited) as raised:
+        with admission.openai_slot(timeout=0.05):
+            pass
+    assert raised.value.reason == "openai:in_flight"
+    assert admission.openai_calls.in_flight == 1
+
+
+def test_per_user_limits_are_not_split_between_workers():
+    # Only the project-wide budgets are divided by the worker count
+    admission = AdmissionControl(user_limits={"summarize": (60, 4)}, youtube_burst=400, workers=4)
+    for _ in range(4):
+        admission.admit("summarize", "viewer@example.com")
+    with pytest.raises(RateLimited):
+        admission.admit("summarize", "viewer@example.com")
+    assert admission.youtube.capacity == 100
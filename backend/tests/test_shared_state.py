@@ -0,0 +1,30 @@
+# Shared state backends (shared_state.py)
+import pytest
+
+from shared_state import MemoryState, SharedState
+
+
+def test_incomplete_backend_fails_when_constructed():
+    class NoPop(SharedState):
+        def get(self, key):
+            return None
+
+        def set(self, key, value, ttl):
+            pass
+
+        def delete(self, key):
+            pass
+
+    with pytest.raises(TypeError):
+        NoPop()
+
+
+def test_memory_state_hands_out_copies():
+    state = MemoryState()
+    value = {"owner": "viewer@example.com"}
+    state.set("job:1", value, 60)
+    value["owner"] = "changed"
+    state.get("job:1").pop("owner")
+    assert state.get("job:1") == {"owner": "viewer@example.com"}
+    assert state.pop("job:1") == {"owner": "viewer@example.com"}
+    assert state.pop("job:1") is None
@@ -2,6 +2,16 @@ import axios from "axios";
 
 const API_URL = "http://localhost:8000";
 
+// The backend renews access tokens in the background and sends the new one
+// in this header; store it so later requests use it.
+axios.interceptors.response.use((response) => {
+  const refreshedToken = response.headers["x-access-token"];
+  if (refreshedToken) {
+    localStorage.setItem("accessToken", refreshedToken);
+  }
+  return response;
+});
+
 export const loginWithGoogle = async () => {
   try {
     window.location.href = `${API_URL}/auth/login`;
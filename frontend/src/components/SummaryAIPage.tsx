@@ -21,9 +21,10 @@ const SummaryAIPage = () => {
       return;
     }
     setIsLoading(true);
+    setSummary(null);
     try {
       const response = await fetch(
-        "http://localhost:8000/api/summarize_comments",
+        "http://localhost:8000/api/summarize_comments/stream",
         {
           method: "POST",
           headers: {
@@ -34,10 +35,13 @@ const SummaryAIPage = () => {
         }
       );
 
-      const data = await response.json();
-      if (response.ok) {
-        setSummary(data.summary);
-      } else {
+      const refreshedToken = response.headers.get("X-Access-Token");
+      if (refreshedToken) {
+        localStorage.setItem("accessToken", refreshedToken);
+      }
+
+      if (!response.ok || !response.body) {
+        const data = await response.json();
         console.error("Failed to fetch summary:", data.detail);
         if (data.detail.includes("insufficient authentication scopes")) {
           clearStoredTokens();
@@ -47,6 +51,34 @@ const SummaryAIPage = () => {
             },
           });
         }
+        return;
+      }
+
+      // Server-sent events: "delta" events carry partial text, "done" the full summary
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let text = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop() ?? "";
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = raw.match(/^data: (.*)$/m)?.[1];
+          if (!event || !data) continue;
+          const payload = JSON.parse(data);
+          if (event === "delta") {
+            text += payload.text;
+            setSummary(text);
+          } else if (event === "done") {
+            setSummary(payload.summary);
+          } else if (event === "error") {
+            console.error("Failed to fetch summary:", payload.detail);
+          }
+        }
       }
     } catch (error) {
       console.error("Error fetching summary:", error);